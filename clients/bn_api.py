@@ -1,17 +1,28 @@
 import ccxt
 from config import proxy
 
-# 从币安获取现货价格
-bn_client = ccxt.binance({
-    'timeout': 30000,
-    'proxies': proxy
-})
+# 从币安获取现货价格，第一次使用时才创建，导入本模块的子进程不会创建连接
+bn_client = None
+
+
+def get_bn_client():
+    """
+    获取币安客户端，进程内只创建一次
+    """
+    global bn_client
+    if bn_client is None:
+        bn_client = ccxt.binance({
+            'timeout': 30000,
+            'proxies': proxy
+        })
+    return bn_client
+
 
 def get_symbol_current_price(symbol):
     """
     获取指定symbol的现货价格
     """
-    current_price = bn_client.fetch_ticker(symbol)['last']
+    current_price = get_bn_client().fetch_ticker(symbol)['last']
     
     return float(current_price)
 
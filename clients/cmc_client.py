@@ -11,46 +11,80 @@ cmc的API调用是用credit_count来计算的，1根k线就是1个credit_count
 - 获取30根k线,就消耗30个credit_count
 - 获取10个交易对,就消耗10个credit_count
 - 一定要节约使用credit_count
+
+异步版本
+- AsyncCMCClient: 所有请求都是协程，共用一个aiohttp会话和速率限制，可以同时发出上百个K线请求
+- CMCClient: 阻塞调用的外观，在后台线程中运行事件循环，原有的调用方式不变
+- 速率限制由 utils/rate_limiter.py 的令牌桶完成，多个进程共用同一份分钟和月度额度，发出请求前取得令牌
+- credit统计写入 utils/usage_ledger.py 的账本，批量追加，不再每次调用都重写统计文件
+- 令牌桶的文件锁、账本的写入和读取都在线程池中执行，事件循环中只有网络请求和解码
+- 每个请求都有超时时间
+- 可以按权重划分多个预算(例如每条链一个)，在 run_with_budget 中运行的请求先从所属预算的令牌桶取令牌，
+  一条链的请求再多也只能用自己的份额，不会挤占其他链
 """
-import time
+import asyncio
+import threading
+import contextvars
+import aiohttp
+import numpy as np
 import pandas as pd
-import requests
 import traceback
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from config import cmc_api_stats_path
-from utils.commons import send_wechat_message, retry
+from utils import rate_limiter, usage_ledger
+from utils.ohlcv_ring import RECORD_DTYPE
+from clients.cmc_decoder import loads, decode_ohlcv
+from utils.commons import send_wechat_message, async_retry
 from utils.log_kit import logger
 
+# 当前请求所属的预算名称，由run_with_budget设置，协程中创建的任务继承
+request_budget = contextvars.ContextVar('request_budget', default=None)
 
-class CMCClient:
+
+class AsyncCMCClient:
     """
-    CoinMarketCap API客户端
+    CoinMarketCap API异步客户端
     """
-    def __init__(self, api_keys=[]):
+    def __init__(self, api_keys=[], max_in_flight=200, timeout=30):
         """
         api_key: 传入一个列表，列表中是API密钥
+        max_in_flight: 同时进行的最大请求数量
+        timeout: 单个请求的超时时间(秒)
         """
         self.base_url = 'https://pro-api.coinmarketcap.com/v4'
         
+        # 并发和超时
+        self.max_in_flight = max_in_flight
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None  # 在事件循环中第一次请求时创建
+        self._semaphore = None
+        
         # api_key
         self.api_keys = api_keys
         self.main_key = self.api_keys[0]  # 第一个为主密钥
         self.backup_keys = self.api_keys[1:] if len(self.api_keys) > 1 else []
-        self.api_key = None  # 当前使用的API密钥
         
         # 日志
         self.logger = logger
         
-        # 速率限制
+        # 速率限制，burst为令牌桶容量
         self.rate_limit = {
             'per_minute': 295,
-            'per_month': 990000
+            'per_month': 990000,
+            'burst': 15
         }
         
         # 初始化统计文件路径
         self.stats_dir = cmc_api_stats_path
         self.stats_dir.mkdir(parents=True, exist_ok=True)
+        # 多进程共用的令牌桶状态
+        self.limiter_file = self.stats_dir / 'rate_limit.bin'
+        # 按预算划分的速率限制，见set_budgets
+        self.budget_file = self.stats_dir / 'budget_limit.bin'
+        self.budgets = {}
+        # 已经提醒过月度额度用完的密钥
+        self._exhausted_keys = set()
         
         # 加载或初始化API使用记录
         self.usage_stats = self._load_usage_stats()
@@ -61,163 +95,137 @@ class CMCClient:
     # ============= API使用统计功能 =============
     def _load_usage_stats(self):
         """加载API使用统计"""
-        current_utc = datetime.utcnow()
-        current_month = current_utc.strftime('%Y%m')
-        stats_file = self.stats_dir / f"api_usage_{current_month}.csv"
-        
-        if stats_file.exists():
-            stats_df = pd.read_csv(stats_file)
-            return {
-                key: {
-                    'minute_calls': 0,  # 当前分钟的调用次数
-                    'current_minute': None,  # 当前自然分钟
-                    'monthly_credits': stats_df[stats_df['api_key'] == key]['monthly_credits'].iloc[0] if not stats_df[stats_df['api_key'] == key].empty else 0
-                }
-                for key in self.api_keys
-            }
-        
-        # 创建新的统计记录
-        stats = {
-            key: {
-                'minute_calls': 0,
-                'current_minute': None,
-                'monthly_credits': 0
-            }
-            for key in self.api_keys
-        }
-        self._save_usage_stats(stats)
-        return stats
-        
-    def _save_usage_stats(self, stats):
-        """保存API使用统计"""
-        current_utc = datetime.utcnow()
-        current_month = current_utc.strftime('%Y%m')
-        stats_file = self.stats_dir / f"api_usage_{current_month}.csv"
+        current_month = datetime.utcnow().strftime('%Y%m')
+        totals = usage_ledger.load_totals(self.stats_dir, current_month)
+        stats = {key: {'monthly_credits': totals.get(key, 0)} for key in self.api_keys}
         
-        stats_data = []
+        # 令牌桶状态还不是当月的数据时，用账本初始化
         for key, data in stats.items():
-            stats_data.append({
-                'api_key': key,
-                'monthly_credits': data['monthly_credits']
-            })
-            
-        pd.DataFrame(stats_data).to_csv(stats_file, index=False)
+            rate_limiter.seed_credits(self.limiter_file, key, current_month, data['monthly_credits'])
+        return stats
 
     def _get_available_key(self):
-        """获取可用的API密钥"""
-        current_utc = datetime.utcnow()
-        current_month = current_utc.strftime('%Y%m')
-        current_minute = current_utc.replace(second=0, microsecond=0)
-        
-        # 检查主密钥的月度使用情况
-        main_key_stats = self.usage_stats[self.main_key]
-        
-        # 检查是否超过月度限制
-        if main_key_stats['monthly_credits'] >= self.rate_limit['per_month']:
-            # 主密钥达到月度限制
-            send_wechat_message(f"主密钥已达到当月限制，切换至备用密钥")
-            return self._get_backup_key()
-        
-        # 检查主密钥的分钟限制
-        if main_key_stats['current_minute'] != current_minute:
-            main_key_stats['current_minute'] = current_minute
-            main_key_stats['minute_calls'] = 0
-            
-        if main_key_stats['minute_calls'] < self.rate_limit['per_minute']:
-            return self.main_key
-            
-        # 主密钥达到分钟限制，使用备用密钥
-        return self._get_backup_key()
+        """
+        获取可用的API密钥，主密钥优先
+        Returns: (密钥, 0)；没有令牌时返回 (None, 等待秒数)；所有密钥月度额度用完时返回 (None, None)
+        """
+        api_key, wait = rate_limiter.try_acquire(self.limiter_file, self.api_keys, self.rate_limit)
+        if api_key is not None and api_key != self.main_key and self.main_key not in self._exhausted_keys:
+            credits = rate_limiter.monthly_credits(self.limiter_file, [self.main_key])[self.main_key]
+            if credits >= self.rate_limit['per_month']:
+                self._exhausted_keys.add(self.main_key)
+                send_wechat_message(f"主密钥已达到当月限制，切换至备用密钥")
+        return api_key, wait
 
-    def _get_backup_key(self):
-        """获取可用的备用密钥"""
-        current_utc = datetime.utcnow()
-        current_minute = current_utc.replace(second=0, microsecond=0)
-        
-        for key in self.backup_keys:
-            key_stats = self.usage_stats[key]
-            
-            # 检查是否超过月度限制
-            if key_stats['monthly_credits'] >= self.rate_limit['per_month']:
-                continue  # 跳过已达到月度限制的密钥
-            
-            # 检查分钟限制
-            if key_stats['current_minute'] != current_minute:
-                key_stats['current_minute'] = current_minute
-                key_stats['minute_calls'] = 0
-                
-            if key_stats['minute_calls'] < self.rate_limit['per_minute']:
-                return key
-                
-        # 所有密钥都达到限制，等待下一分钟
-        return None
-
-    def _update_usage_stats(self, api_key, api_credit_consumed):
-        """更新API使用统计"""
-        stats = self.usage_stats[api_key]
-        
-        # 更新分钟调用次数
-        stats['minute_calls'] += 1
-        
-        # 更新月度调用credit_count
-        stats['monthly_credits'] += api_credit_consumed
-        
-        # 保存统计数据
-        self._save_usage_stats(self.usage_stats)
+    def set_budgets(self, weights):
+        """
+        按权重划分每分钟调用次数和桶容量，没有设置的预算名称不受限制
+        weights: {预算名称: 权重}
+        """
+        total = sum(weights.values())
+        budgets = {}
+        for name, weight in weights.items():
+            burst = max(self.rate_limit['burst'] * weight / total, 1)
+            budgets[name] = {
+                'per_minute': max(self.rate_limit['per_minute'] * weight / total, burst + 1),
+                'per_month': float('inf'),
+                'burst': burst,
+            }
+        self.budgets = budgets
+
+    async def _acquire_budget(self, budget):
+        """等待直到从预算取得一个令牌"""
+        while True:
+            name, wait = await asyncio.to_thread(rate_limiter.try_acquire, self.budget_file, [budget], self.budgets[budget])
+            if name:
+                return
+            await asyncio.sleep(wait)
+
+    async def _acquire_key(self):
+        """等待直到取得一个令牌，请求属于某个预算时先取预算的令牌"""
+        budget = request_budget.get()
+        if budget in self.budgets:
+            await self._acquire_budget(budget)
+        while True:
+            api_key, wait = await asyncio.to_thread(self._get_available_key)
+            if api_key:
+                return api_key
+            if wait is None:
+                # 所有密钥的月度额度都已用完
+                self.logger.warning(f"所有API密钥已达到月度限制，等待60秒后重试")
+                send_wechat_message("⚠️ 所有密钥已达到当月限制")
+                wait = 60
+            await asyncio.sleep(wait)
+
+    async def _update_usage_stats(self, api_key, api_credit_consumed):
+        """更新API使用统计，写入账本由usage_ledger批量完成，文件锁和写入在线程池中执行"""
+        self.usage_stats[api_key]['monthly_credits'] += api_credit_consumed
+        if usage_ledger.record(self.stats_dir, api_key, api_credit_consumed):
+            await asyncio.to_thread(usage_ledger.flush)
+        # 取令牌时已经预占了1个credit
+        await asyncio.to_thread(rate_limiter.add_credits, self.limiter_file, api_key, api_credit_consumed - 1)
         
     def _log_error(self, message, error):
         """记录错误详细信息"""
         error_details = traceback.format_exc()
         self.logger.error(f"{message}: {str(error)}\n{error_details}")
     
-    @retry(max_tries=3)
-    def _make_request(self, url, params):
-        """执行API请求"""
+    async def _get_session(self):
+        """获取aiohttp会话，连接复用"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._session
+
+    async def close(self):
+        """关闭会话，写入账本"""
+        await asyncio.to_thread(usage_ledger.flush)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    @async_retry(max_tries=3)
+    async def _make_request(self, url, params, decoder=None):
+        """
+        执行API请求，每次尝试都重新取令牌，重试也计入速率限制
+        decoder: 响应原始字节的解码函数，默认解析为JSON
+        """
+        api_key = await self._acquire_key()
         headers = {
-            "X-CMC_PRO_API_KEY": self.api_key,
+            "X-CMC_PRO_API_KEY": api_key,
             "Accept": "application/json"
         }
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        result = response.json()
+        # aiohttp的参数只接受字符串和数字
+        params = {key: str(value).lower() if isinstance(value, bool) else value for key, value in params.items()}
+        session = await self._get_session()
+        async with self._semaphore:
+            async with session.get(url, headers=headers, params=params, timeout=self.timeout) as response:
+                response.raise_for_status()
+                body = await response.read()
+        result = (decoder or loads)(body)
             
-        return result
+        return result, api_key
 
 
-    def call_api(self, endpoint, params):
-        """调用API的主要方法"""
+    async def call_api(self, endpoint, params, decoder=None):
+        """调用API的主要方法，decoder见_make_request"""
         # 检查月份是否已变更，如果变更则重新加载统计
         current_month = datetime.utcnow().strftime('%Y%m')
         if current_month != self.current_month:
             self.current_month = current_month
-            self.usage_stats = self._load_usage_stats()  # 重新加载当月统计
+            self.usage_stats = await asyncio.to_thread(self._load_usage_stats)  # 重新加载当月统计
         
         url = f"{self.base_url}{endpoint}"
+        result, api_key = await self._make_request(url, params, decoder)
         
-        while True:
-            api_key = self._get_available_key()
-            if api_key:
-                self.api_key = api_key
-                result = self._make_request(url, params)
-                
-                # 更新API使用统计，使用响应中的实际credit_count
-                api_credit_consumed = result.get('status', {}).get('credit_count', 1)
-                self._update_usage_stats(self.api_key, api_credit_consumed)
-                
-                return result, api_credit_consumed
-            
-            # 所有密钥都达到限制，等待下一分钟
-            current_utc = datetime.utcnow()
-            next_minute = (current_utc + timedelta(minutes=1)).replace(second=0, microsecond=0)
-            sleep_time = (next_minute - current_utc).total_seconds()
-            self.logger.warning(f"所有API密钥已达到分钟限制，等待 {sleep_time:.2f} 秒后重试")
-            time.sleep(sleep_time)
-
-            if not api_key:
-                send_wechat_message("⚠️ 密钥分钟容量达到上限")
+        # 更新API使用统计，使用响应中的实际credit_count
+        api_credit_consumed = result.get('status', {}).get('credit_count', 1)
+        await self._update_usage_stats(api_key, api_credit_consumed)
+        
+        return result, api_credit_consumed
 
     # ============= 具体API方法 =============
-    def get_spot_pairs(self, network_slug, **kwargs):
+    async def get_spot_pairs(self, network_slug, **kwargs):
         """
         获取代币的交易对列表
         """
@@ -226,9 +234,9 @@ class CMCClient:
             "network_slug": network_slug,
             **kwargs
         }
-        return self.call_api(endpoint, params)        
+        return await self.call_api(endpoint, params)        
 
-    def get_pair_quotes(self, network_slug, contract_addresses, **kwargs):
+    async def get_pair_quotes(self, network_slug, contract_addresses, **kwargs):
         """
         获取交易对报价信息
         """
@@ -238,11 +246,12 @@ class CMCClient:
             "contract_address": ','.join(contract_addresses) if isinstance(contract_addresses, list) else contract_addresses,
             **kwargs
         }
-        return self.call_api(endpoint, params)
+        return await self.call_api(endpoint, params)
 
-    def get_pair_ohlcv(self, network_slug, contract_address, **kwargs):
+    async def get_pair_ohlcv(self, network_slug, contract_address, decoder=None, **kwargs):
         """
         获取交易对K线数据
+        decoder: 为 cmc_decoder.decode_ohlcv 时，返回的quotes直接解码为K线数组(records)
         """
         endpoint = '/dex/pairs/ohlcv/historical'
         params = {
@@ -250,23 +259,23 @@ class CMCClient:
             "contract_address": contract_address,
             **kwargs
         }
-        return self.call_api(endpoint, params)
+        return await self.call_api(endpoint, params, decoder)
     
     # ============= K线获取 =============
-    def fetch_klines_df(self, chain, contract_address, interval, time_end=None, time_start=None, limit=15, min_count=29):
+    async def iter_kline_pages(self, chain, contract_address, interval, time_start=None, time_end=None, limit=15, min_count=29):
         """
+        分页获取K线，每页返回一个有类型的数组，不在翻页过程中合并DataFrame
         chain: 链名称
         contract_address: 交易对合约地址
-        interval: Default:"daily";"daily" "hourly" "1m" "5m" "15m" "30m" "4h" "8h" "12h" "weekly" "monthly"
-        time_end: 获取K线数据的结束时间,填写None时,使用当前时间,
-        time_start: 获取K线数据的开始时间,用来增量更新
-        如果time_end和time_start都没有填写,用来获取全部K线
-        min_count: 获取K线数据的最小数量,默认500条
-        获取K线数据,K线数据常有缺失
-        使用说明：
-        1. 获取所有K线, 不需要填写time_end和time_start
-        2. 更新K线, 需要填写time_start, 获取time_start到当前时间的K线
+        interval: "1m" "5m" "15m" "30m" "1h" "4h" 等，只支持分钟和小时
+        time_start: 获取K线数据的开始时间,用来增量更新，从time_start向后翻页直到没有数据，datetime或epoch秒
+        time_end: 和time_start一起填写时只获取 [time_start, time_end] 内的K线，每页的count不超过剩余的K线数量
+        不填写time_start时从当前时间向前翻页，K线数量达到min_count后停止
+        Yields: (K线数组, 交易对信息, 本页credit_count)
+            K线数组为 ohlcv_ring.RECORD_DTYPE 的结构化数组，candle_begin_time为epoch秒
+            交易对信息为 kline_store.META_COLUMNS 的字典
         """
+        interval_seconds = interval_to_seconds(interval)
         # 构建请求参数
         params = {
             "network_slug": chain,
@@ -276,116 +285,145 @@ class CMCClient:
             "count": limit,
             "convert_id": "2781",
             "skip_invalid": True,
-        }       
-            
-        if time_start:
-            start_time = pd.to_datetime(time_start).strftime('%Y-%m-%dT%H:%M:%S.000Z')
-            params["time_start"] = start_time
+        }
+        if time_start is not None:
+            time_start = to_epoch_seconds(time_start)
+            params["time_start"] = epoch_to_iso(time_start)
+        if time_start is not None and time_end is not None:
+            time_end = to_epoch_seconds(time_end)
+            params["time_end"] = epoch_to_iso(time_end)
+            remaining = (time_end - time_start) // interval_seconds + 1
+            params["count"] = min(limit, remaining)
+        else:
+            time_end = None
         
-        all_klines = pd.DataFrame()
-        total_credit_count = 0
+        seen = set()
         while True:
-            try:
-                result, api_credit_consumed = self.get_pair_ohlcv(**params)
-                total_credit_count += api_credit_consumed
-                if not result.get('data') or len(result['data']) == 0:
-                    break
-                
-                data = result['data'][0]
-                
-                # 处理基础信息
-                base_info = {
-                    "pair_name": data["name"],
-                    "pair_address": data["contract_address"],
-                    "symbol": data["base_asset_symbol"],
-                    "address": data["base_asset_contract_address"],
-                    "quote_coin_symbol": data["quote_asset_symbol"],
-                    "chain": data["network_slug"],
-                    "created_at": data["created_at"],
-                }
-                
-                # 处理quotes数据
-                processed_klines = []
-                for quote_item in data["quotes"]:
-                    quote_data = quote_item["quote"][0]
-                    time_data = {
-                        "candle_begin_time": quote_item["time_open"],
-                        "open": quote_data["open"],
-                        "high": quote_data["high"],
-                        "low": quote_data["low"],
-                        "close": quote_data["close"],
-                        "volume": quote_data["volume"],
-                    }
-                    processed_klines.append({**base_info, **time_data})
-                    
-                # 根据请求类型更新参数
-                if time_start:
-                    if interval.endswith("m"):
-                        time_start = pd.to_datetime(processed_klines[-1]["candle_begin_time"]) + timedelta(minutes=int(interval[:-1]))
-                    elif interval.endswith("h"):
-                        time_start = pd.to_datetime(processed_klines[-1]["candle_begin_time"]) + timedelta(hours=int(interval[:-1]))
-                    params["time_start"] = time_start.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-                else:
-                    # 将时间减去interval，并确保格式为ISO 8601
-                    if interval.endswith("m"):
-                        time_end = pd.to_datetime(processed_klines[0]["candle_begin_time"]) - timedelta(minutes=int(interval[:-1]))
-                    elif interval.endswith("h"):
-                        time_end = pd.to_datetime(processed_klines[0]["candle_begin_time"]) - timedelta(hours=int(interval[:-1]))
-                    params["time_end"] = time_end.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-                
-                all_klines = pd.concat([all_klines, pd.DataFrame(processed_klines)])
-                all_klines.drop_duplicates(subset=['candle_begin_time'], inplace=True)
+            result, api_credit_consumed = await self.get_pair_ohlcv(decoder=decode_ohlcv, **params)
+            if not result.get('data') or len(result['data']) == 0 or not len(result['data'][0]['records']):
+                yield np.zeros(0, dtype=RECORD_DTYPE), None, api_credit_consumed
+                return
+            
+            data = result['data'][0]
+            page = data['records']
+            if time_end is not None:
+                page = page[page['candle_begin_time'] <= time_end]
+            info = {
+                "pair_name": data["name"],
+                "pair_address": data["contract_address"],
+                "symbol": data["base_asset_symbol"],
+                "address": data["base_asset_contract_address"],
+                "quote_coin_symbol": data["quote_asset_symbol"],
+                "chain": data["network_slug"],
+                "created_at": pd.Timestamp(data["created_at"]).strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            yield page, info, api_credit_consumed
+            
+            # 根据请求类型更新翻页参数
+            times = page['candle_begin_time']
+            if time_start is not None:
+                # 本页的count已经覆盖到time_end时，没有返回的周期就是没有K线，不再请求
+                if not len(times) or (time_end is not None and params["count"] >= remaining):
+                    return
+                cursor = int(times.max()) + interval_seconds
+                if time_end is not None:
+                    if cursor > time_end:
+                        return
+                    remaining = (time_end - cursor) // interval_seconds + 1
+                    params["count"] = min(limit, remaining)
+                params["time_start"] = epoch_to_iso(cursor)
+            else:
+                params["time_end"] = epoch_to_iso(times.min() - interval_seconds)
                 # 不是增量更新时，如果K线数量达到min_count，则停止
-                if not time_start:
-                    if min_count and len(all_klines) >= min_count:
-                        break
+                seen.update(times.tolist())
+                if min_count and len(seen) >= min_count:
+                    return
 
-                
-            except Exception as e:
-                self._log_error(f"获取{contract_address}最新K线数据失败", e)
-                return pd.DataFrame(), total_credit_count
+    async def fetch_kline_records(self, chain, contract_address, interval, time_start=None, time_end=None, limit=15, min_count=29, raise_errors=False):
+        """
+        获取K线，所有页面最后只合并一次
+        参数见iter_kline_pages
+        raise_errors: 获取失败时抛出异常，用于区分获取失败和区间内没有K线
+        Returns: (按时间排序去重的K线数组, 交易对信息, 总credit_count)，获取失败时K线数组为空
+        """
+        pages = []
+        info = None
+        total_credit_count = 0
+        try:
+            async for page, page_info, api_credit_consumed in self.iter_kline_pages(chain, contract_address, interval, time_start=time_start, time_end=time_end, limit=limit, min_count=min_count):
+                total_credit_count += api_credit_consumed
+                if len(page):
+                    pages.append(page)
+                    info = page_info
+        except Exception as e:
+            if raise_errors:
+                raise
+            self._log_error(f"获取{contract_address}最新K线数据失败", e)
+            return np.zeros(0, dtype=RECORD_DTYPE), None, total_credit_count
+        
+        if not pages:
+            return np.zeros(0, dtype=RECORD_DTYPE), None, total_credit_count
+        records = np.concatenate(pages)
+        # 去重并按时间排序，相同时间保留先获取的
+        _, index = np.unique(records['candle_begin_time'], return_index=True)
+        records = records[index]
+        return records, info, total_credit_count
 
-        if all_klines.empty:
+    async def fetch_klines_df(self, chain, contract_address, interval, time_end=None, time_start=None, limit=15, min_count=29):
+        """
+        chain: 链名称
+        contract_address: 交易对合约地址
+        interval: Default:"daily";"daily" "hourly" "1m" "5m" "15m" "30m" "4h" "8h" "12h" "weekly" "monthly"
+        time_end: 保留参数，翻页时由接口返回的K线决定
+        time_start: 获取K线数据的开始时间,用来增量更新
+        如果time_end和time_start都没有填写,用来获取全部K线
+        min_count: 获取K线数据的最小数量,默认500条
+        获取K线数据,K线数据常有缺失
+        使用说明：
+        1. 获取所有K线, 不需要填写time_end和time_start
+        2. 更新K线, 需要填写time_start, 获取time_start到当前时间的K线
+        """
+        records, info, total_credit_count = await self.fetch_kline_records(chain, contract_address, interval, time_start=time_start, limit=limit, min_count=min_count)
+        if not len(records):
             return pd.DataFrame(), total_credit_count
-        
-        all_klines['candle_begin_time'] = pd.to_datetime(all_klines['candle_begin_time']).dt.strftime('%Y-%m-%d %H:%M:%S')
-        all_klines['created_at'] = pd.to_datetime(all_klines['created_at']).dt.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # K线整理
-        all_klines = all_klines.drop_duplicates(subset=['candle_begin_time'])  # 去重
+
+        # 只在最后构建一次DataFrame
+        all_klines = pd.DataFrame({col: records[col] for col in RECORD_DTYPE.names})
+        all_klines['candle_begin_time'] = pd.to_datetime(all_klines['candle_begin_time'], unit='s').dt.strftime('%Y-%m-%d %H:%M:%S')
+        for col, value in info.items():
+            all_klines[col] = value
         all_klines = self._kline_uniform(all_klines)  # 标准化K线数据
-        all_klines = all_klines.sort_values(by="candle_begin_time", ascending=True)  # 按时间排序
-        
+
         return all_klines, total_credit_count
 
     def _kline_uniform(self, df):
         """K线数据标准化"""
         columns = [
-            'candle_begin_time', 
-            'open', 
-            'high', 
-            'low', 
+            'candle_begin_time',
+            'open',
+            'high',
+            'low',
             'close',
             'volume',
             "symbol",
             "address",
-            "quote_coin_symbol",  
+            "quote_coin_symbol",
             "pair_name",
-            "pair_address",   
+            "pair_address",
             "chain",
             "created_at",
         ]
         df = df[columns]
-        return df    
-    
+        return df
+
     # ============= 获取流动性最大的交易对 =============
-    def get_pair_address_largest_liquidity(self, network_slug, token_address=None, **kwargs):
+    async def get_pair_address_largest_liquidity(self, network_slug, token_address=None, **kwargs):
         """
         获取流动性最大的交易对合约地址
         直接获取排序最大的池子2个
         network_slug: 链名称，如 solana, bsc 等
         token_address: 币种合约地址，可选参数
-        返回: (pair_address, pair_name, liquidity) 元组，如果未找到则返回 (None, None, 0)
+        返回: (pair_address, pair_name, liquidity, credit_count) 元组，如果未找到则返回 (None, None, 0, credit_count)
         """
         params = {
             "network_slug": network_slug,
@@ -403,7 +441,7 @@ class CMCClient:
             params["base_asset_contract_address"] = token_address
             
         # 获取交易对列表
-        result, api_credit_consumed = self.get_spot_pairs(**params)
+        result, api_credit_consumed = await self.get_spot_pairs(**params)
         total_credit_count += api_credit_consumed
         
         if not result or 'data' not in result or not result['data']:
@@ -411,7 +449,7 @@ class CMCClient:
             if "base_asset_contract_address" in params:
                 params.pop("base_asset_contract_address")
             params["quote_asset_contract_address"] = token_address
-            result, api_credit_consumed = self.get_spot_pairs(**params)
+            result, api_credit_consumed = await self.get_spot_pairs(**params)
             total_credit_count += api_credit_consumed
             
             # 如果仍然没有数据，则返回None
@@ -420,7 +458,7 @@ class CMCClient:
             
         # 获取所有交易对并按流动性排序（从高到低）
         pairs = result['data']
-        sorted_pairs = sorted(pairs, key=lambda x: float(x['quote'][0]['liquidity']) if x.get('quote') and len(x['quote']) > 0 and x['quote'][0].get('liquidity') is not None else 0.0, reverse=True)
+        sorted_pairs = sorted(pairs, key=pair_liquidity, reverse=True)
         
         if not sorted_pairs:
             return None, None, 0, total_credit_count
@@ -433,6 +471,153 @@ class CMCClient:
         
         return pair_address, pair_name, liquidity, total_credit_count
 
+    # ============= 批量获取交易对 =============
+    async def get_top_liquidity_pairs(self, network_slug, pages=1, limit=100, **kwargs):
+        """
+        按流动性从高到低分页获取链上的交易对，每页用上一页最后一个交易对的scroll_id继续
+        每个交易对消耗1个credit，pages * limit 就是最多消耗的credit
+        network_slug: 链名称
+        pages: 最多获取的页数
+        limit: 每页的交易对数量
+        Returns: (交易对列表, 总credit_count)
+        """
+        params = {
+            "convert_id": "2781",  # 使用USDT作为计价货币
+            "sort": "liquidity",
+            "sort_dir": "desc",
+            "limit": limit,
+            **kwargs
+        }
+        pairs = []
+        total_credit_count = 0
+        for _ in range(pages):
+            result, api_credit_consumed = await self.get_spot_pairs(network_slug, **params)
+            total_credit_count += api_credit_consumed
+            data = (result or {}).get('data') or []
+            pairs.extend(data)
+            
+            # 不满一页或没有翻页标识时已经是最后一页
+            scroll_id = data[-1].get('scroll_id') if data else None
+            if len(data) < limit or not scroll_id:
+                break
+            params['scroll_id'] = scroll_id
+        
+        return pairs, total_credit_count
+
+
+async def run_with_budget(budget, coro):
+    """
+    在预算下运行协程，协程及其中创建的任务发出的请求都使用这个预算的份额
+    budget: 预算名称，需要先由set_budgets设置权重
+    """
+    token = request_budget.set(budget)
+    try:
+        return await coro
+    finally:
+        request_budget.reset(token)
+
+
+def interval_to_seconds(interval):
+    """K线周期的秒数，只支持分钟(m)和小时(h)"""
+    if interval.endswith('m'):
+        return int(interval[:-1]) * 60
+    if interval.endswith('h'):
+        return int(interval[:-1]) * 3600
+    raise ValueError(f"不支持的K线周期: {interval}")
+
+
+def to_epoch_seconds(value):
+    """epoch秒或datetime(没有时区时按UTC)转换为epoch秒"""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).timestamp())
+
+
+def epoch_to_iso(epoch):
+    """epoch秒转换为CMC使用的ISO 8601格式"""
+    return datetime.utcfromtimestamp(int(epoch)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def pair_liquidity(pair):
+    """交易对的流动性，没有报价时为0"""
+    if pair.get('quote') and len(pair['quote']) > 0 and pair['quote'][0].get('liquidity') is not None:
+        return float(pair['quote'][0]['liquidity'])
+    return 0.0
+
+
+class CMCClient:
+    """
+    CoinMarketCap API客户端，阻塞调用
+    请求在后台线程的事件循环中由AsyncCMCClient执行，多个线程同时调用时共用同一个速率限制
+    """
+    def __init__(self, api_keys=[], max_in_flight=200, timeout=30):
+        """
+        api_key: 传入一个列表，列表中是API密钥
+        max_in_flight: 同时进行的最大请求数量
+        timeout: 单个请求的超时时间(秒)
+        """
+        self.async_client = AsyncCMCClient(api_keys, max_in_flight=max_in_flight, timeout=timeout)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='cmc_client_loop', daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        """其他属性(usage_stats, rate_limit等)直接使用异步客户端的"""
+        return getattr(self.async_client, name)
+
+    def run(self, coro):
+        """
+        在客户端的事件循环中运行协程并等待结果
+        可以传入多个请求组成的协程(例如asyncio.gather)，让它们共用速率限制并发执行
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def submit(self, coro):
+        """
+        在客户端的事件循环中运行协程，不等待结果
+        Returns: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def call_api(self, endpoint, params):
+        """调用API的主要方法"""
+        return self.run(self.async_client.call_api(endpoint, params))
+
+    def get_spot_pairs(self, network_slug, **kwargs):
+        """获取代币的交易对列表"""
+        return self.run(self.async_client.get_spot_pairs(network_slug, **kwargs))
+
+    def get_pair_quotes(self, network_slug, contract_addresses, **kwargs):
+        """获取交易对报价信息"""
+        return self.run(self.async_client.get_pair_quotes(network_slug, contract_addresses, **kwargs))
+
+    def get_pair_ohlcv(self, network_slug, contract_address, **kwargs):
+        """获取交易对K线数据"""
+        return self.run(self.async_client.get_pair_ohlcv(network_slug, contract_address, **kwargs))
+
+    def fetch_klines_df(self, chain, contract_address, interval, time_end=None, time_start=None, limit=15, min_count=29):
+        """获取K线数据，参数见AsyncCMCClient.fetch_klines_df"""
+        return self.run(self.async_client.fetch_klines_df(chain, contract_address, interval, time_end=time_end,
+                                                          time_start=time_start, limit=limit, min_count=min_count))
+
+    def fetch_kline_records(self, chain, contract_address, interval, time_start=None, time_end=None, limit=15, min_count=29, raise_errors=False):
+        """获取有类型的K线数组，参数见AsyncCMCClient.fetch_kline_records"""
+        return self.run(self.async_client.fetch_kline_records(chain, contract_address, interval, time_start=time_start, time_end=time_end,
+                                                              limit=limit, min_count=min_count, raise_errors=raise_errors))
+
+    def get_pair_address_largest_liquidity(self, network_slug, token_address=None, **kwargs):
+        """获取流动性最大的交易对合约地址，参数见AsyncCMCClient.get_pair_address_largest_liquidity"""
+        return self.run(self.async_client.get_pair_address_largest_liquidity(network_slug, token_address, **kwargs))
+
+    def get_top_liquidity_pairs(self, network_slug, pages=1, limit=100, **kwargs):
+        """按流动性分页获取链上的交易对，参数见AsyncCMCClient.get_top_liquidity_pairs"""
+        return self.run(self.async_client.get_top_liquidity_pairs(network_slug, pages=pages, limit=limit, **kwargs))
+
+    def close(self):
+        """关闭会话并停止事件循环"""
+        self.run(self.async_client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
 
 # 如果直接运行此文件，则执行测试
 if __name__ == "__main__":
@@ -450,7 +635,7 @@ if __name__ == "__main__":
         
         # 测试作为base_asset和quote_asset获取
         print("\n测试 get_pair_address_largest_liquidity 函数")
-        pair_address, pair_name, liquidity = client.get_pair_address_largest_liquidity(
+        pair_address, pair_name, liquidity, credit_count = client.get_pair_address_largest_liquidity(
             network_slug="solana", 
             token_address=ca
         )
@@ -463,19 +648,21 @@ if __name__ == "__main__":
         # 测试获取K线数据
         print("\n测试获取K线数据")
         if pair_address:
-            klines = client.fetch_klines_df(
+            records, info, credit_count = client.fetch_kline_records(
                 chain="solana",
                 contract_address=pair_address,
                 interval="5m",
-                # time_start="2025-04-14 09:00:00"
             )
             
-            if klines.empty:
+            if not len(records):
                 print("❌ 未获取到K线数据")
             else:
-                print(f"✅ 成功获取 {len(klines)} 条K线数据")
+                print(f"✅ 成功获取 {len(records)} 条K线数据, credit_count: {credit_count}")
                 print("K线数据示例:")
-                print(klines.head())
+                print(pd.DataFrame(records[:5]))
+                print(info)
+        
+        client.close()
             
     except Exception as e:
         print(f"❌ 测试失败: {str(e)}")
@@ -0,0 +1,139 @@
+"""
+CMC K线响应解码模块
+把 /dex/pairs/ohlcv/historical 的响应直接解码成按列预分配的NumPy数组
+说明:
+1. 安装了orjson时使用orjson解析JSON，没有时使用标准库json
+2. 解析后按列一次取出 open/high/low/close/volume 写入预分配的 ohlcv_ring.RECORD_DTYPE 数组，
+   不再逐根K线合并交易对信息、构建行字典
+3. UTC时间(以Z结尾)截取到秒(YYYY-MM-DDTHH:MM:SS)后用datetime64一次转换为epoch秒，带时区偏移或格式不符时使用pandas解析
+4. 解码结果和JSON解析的结构一致，只是data中的quotes替换为records
+5. 运行 python -m clients.cmc_decoder [响应文件...] 对比原来的解析方式和直接解码的结果和耗时，不传文件时使用 tests/fixtures 中保存的响应；
+   tests/test_cmc_decoder.py 用同样的响应核对和原来的解析方式、json和orjson的结果一致
+"""
+import json
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from utils.ohlcv_ring import RECORD_DTYPE
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def loads(body):
+    """
+    解析JSON，安装了orjson时使用orjson
+    body: 字节或字符串
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def parse_times(times):
+    """
+    ISO 8601时间列表一次转换为epoch秒
+    """
+    if all(time.endswith('Z') for time in times):
+        try:
+            return np.array([time[:19] for time in times], dtype='datetime64[s]').astype(np.int64)
+        except ValueError:
+            pass
+    # 带时区偏移等其他格式
+    return pd.to_datetime(times, utc=True, format='ISO8601').asi8 // 10**9
+
+
+def parse_kline_page(quotes):
+    """
+    把一页K线按列写入预分配的数组
+    quotes: 接口返回的quotes列表
+    Returns: RECORD_DTYPE的结构化数组，candle_begin_time为epoch秒
+    """
+    page = np.empty(len(quotes), dtype=RECORD_DTYPE)
+    if not quotes:
+        return page
+    values = [item["quote"][0] for item in quotes]
+    page['candle_begin_time'] = parse_times([item["time_open"] for item in quotes])
+    for col in RECORD_DTYPE.names[1:]:
+        page[col] = [np.nan if value[col] is None else value[col] for value in values]
+    return page
+
+
+def decode_ohlcv(body):
+    """
+    解码K线响应
+    body: 响应的原始字节
+    Returns: 和JSON解析结构一致的字典，data中每个交易对的quotes替换为records
+    """
+    result = loads(body)
+    for data in result.get('data') or []:
+        data['records'] = parse_kline_page(data.pop('quotes', None) or [])
+    return result
+
+
+# ============= 基准测试 =============
+def _current_path(body):
+    """
+    原来的解析方式: json解析成字典，逐根K线合并交易对信息构建行，再用pandas解析时间
+    """
+    data = json.loads(body)['data'][0]
+    base_info = {
+        "pair_name": data["name"],
+        "pair_address": data["contract_address"],
+        "symbol": data["base_asset_symbol"],
+        "address": data["base_asset_contract_address"],
+        "quote_coin_symbol": data["quote_asset_symbol"],
+        "chain": data["network_slug"],
+        "created_at": data["created_at"],
+    }
+    rows = []
+    for quote_item in data["quotes"]:
+        quote_data = quote_item["quote"][0]
+        rows.append({**base_info, "candle_begin_time": quote_item["time_open"], "open": quote_data["open"], "high": quote_data["high"],
+                     "low": quote_data["low"], "close": quote_data["close"], "volume": quote_data["volume"]})
+    df = pd.DataFrame(rows)
+    page = np.empty(len(df), dtype=RECORD_DTYPE)
+    page['candle_begin_time'] = pd.to_datetime(df['candle_begin_time']).to_numpy(dtype='datetime64[s]').astype(np.int64)
+    for col in RECORD_DTYPE.names[1:]:
+        page[col] = df[col].to_numpy(dtype=np.float64)
+    return page
+
+
+def benchmark(body, rounds=None):
+    """
+    对比原来的解析方式和直接解码的耗时
+    body: 响应的原始字节
+    rounds: 重复次数，不填写时按K线数量决定
+    Returns: {解析方式: 每次耗时(微秒)}
+    """
+    count = len(decode_ohlcv(body)['data'][0]['records'])
+    rounds = rounds or max(20, 20000 // max(count, 1))
+    timings = {}
+    for name, func in (('原来的解析方式', _current_path), (f"直接解码({'orjson' if ORJSON_AVAILABLE else 'json'})", decode_ohlcv)):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            func(body)
+        timings[name] = (time.perf_counter() - started) / rounds * 1e6
+    return timings
+
+
+if __name__ == '__main__':
+    import sys
+
+    # 不传文件时使用 tests/fixtures 中保存的响应
+    paths = [Path(path) for path in sys.argv[1:]] or sorted((Path(__file__).parents[1] / 'tests' / 'fixtures').glob('cmc_ohlcv_*.json'))
+
+    for path in paths:
+        body = path.read_bytes()
+        expected = _current_path(body)
+        decoded = decode_ohlcv(body)['data'][0]['records']
+        # 没有成交的K线volume为NaN，按列比较
+        for col in RECORD_DTYPE.names:
+            np.testing.assert_array_equal(decoded[col], expected[col], err_msg=f'直接解码的{col}和原来的解析方式不一致')
+        timings = benchmark(body)
+        print(f"{path.name}: {len(decoded)}根K线, {len(body)}字节: " + ', '.join(f"{name} {cost:.0f}us" for name, cost in timings.items()))
@@ -106,6 +106,71 @@ cmc_api_keys = [os.getenv('cmc_api_key_1')]
 # k线最小获取数量
 kline_min_count = 14
 
+# 交易对索引，代币地址到流动性最大的交易对，talons的币池更新和K线获取共用
+pair_index_config = {
+    'ttl_hours': 168,  # 找到交易对的记录有效时间，过期后重新通过CMC获取
+    'negative_ttl_hours': 6,  # 没找到交易对的记录有效时间，期间不再重复花费credit查询
+    'prefetch_pages': 2,  # 有代币缺少交易对时，先按流动性分页获取链上的交易对，0表示不批量获取
+    'prefetch_page_size': 100,  # 每页交易对数量，每个交易对消耗1个credit
+    'prefetch_minutes': 60,  # 同一条链批量获取的最短间隔
+}
+
+# K线获取计划，按已存储的K线计算缺少的区间，只请求没有的K线
+kline_fetch_config = {
+    'backfill_count': 300,  # 最多向前检查多少根K线的缺口，更早的缺口不再补齐
+    'page_limit': 100,  # 每页请求的K线数量
+    'settle_count': 3,  # 收盘后多少个周期内接口没有返回的K线仍然重新请求，接口收录新K线有延迟
+}
+
+# 报价采样K线，两次K线更新之间批量获取交易对报价，在本地合成K线，减少OHLCV的credit消耗
+quote_candle_config = {
+    'enabled': False,  # 开启后OHLCV只用于新代币初始化、补齐缺口和定期校正
+    'sample_seconds': 30,  # 报价采样间隔
+    'batch_size': 100,  # 每次请求的交易对数量
+    'reconcile_minutes': 60,  # 用OHLCV校正本地K线的间隔，0表示不校正
+    'reconcile_count': 1,  # 每次校正最近多少根K线
+}
+
+# talons流水线，币池获取、交易对解析、K线获取、发布完成标志之间用有界队列连接
+pipeline_config = {
+    'enabled': True,  # 关闭时按阶段依次执行：所有币池 → 所有交易对 → 所有K线
+    'queue_size': 256,  # 每个队列最多缓存的任务数量，下游处理不过来时上游等待
+    'pool_interval': 1,  # 获取两个账户币池之间的间隔(秒)
+    'chain_weights': {},  # 每条链分到的速率限制和同时下载数量的权重，例如 {'solana': 2, 'bsc': 1}，没有设置的链为1
+    'progress_seconds': 1,  # 写入每条链进度文件(flags/progress.json)的最短间隔(秒)
+}
+
+# 数据就绪通知，talons每个代币、每条链完成时通过Unix域套接字推送给hunter，flag文件作为后备
+notify_config = {
+    'enabled': True,  # 关闭或系统不支持Unix域套接字时每秒检查flag文件
+    'fallback_seconds': 5,  # 等待通知期间检查flag文件的间隔(秒)，防止通知丢失
+    'position_deadline_seconds': 120,  # 持仓代币在run_time之后最多等待多久，超过时用已有数据处理仓位
+    'deadline_minutes': 5,  # 其他代币在run_time之后最多等待多久，超过时使用已有数据
+}
+
+# 共享内存中每个交易对保留的最近K线数量，hunter计算信号时直接读取
+kline_ring_size = 1000
+
+# 信号计算设置
+signal_config = {
+    'incremental': True,  # 策略支持时使用增量计算，每根新K线O(1)更新
+    'verify': False,  # 增量计算结果是否和全量计算核对，用于排查问题
+    'panel': False,  # 策略有向量化实现时，所有代币对齐成二维数组一次计算，优先于增量计算
+    'cache_size': 2000,  # 信号缓存的最大条数，K线没有变化时直接使用缓存
+    'workers': 0,  # 常驻的信号计算进程数量，0表示在主进程中计算
+}
+
+# 表达式策略，signal_timing中用名称引用，例如 ('sma_cross', [5, 10])
+# params为参数名称，按顺序对应signal_timing中的参数；entry为开仓条件，exit为平仓条件，写法见signals/expr.py
+# timeframe可选，为策略使用的K线周期(例如 '1h')，由基础周期的K线在本地重采样
+signal_expressions = {
+    'sma_cross': {
+        'params': ['n', 'm'],
+        'entry': 'cross_up(sma(close, n), sma(sma(close, n), m))',
+        'exit': 'cross_down(sma(close, n), sma(sma(close, n), m))',
+    },
+}
+
 # 间隔时间设置
 interval_config = {
     'kline_interval': '5m',  # 交易K线间隔，单位m
@@ -139,6 +204,9 @@ data_path = root_path / 'data_feed'
 klines_path = data_path / 'klines'
 log_path = root_path / 'logs'
 cmc_api_stats_path = data_path / 'cmc_AIPStats'
+signal_state_path = data_path / 'signal_state'
+pair_index_path = data_path / 'pair_index.db'
+notify_socket_path = data_path / 'data_ready.sock'
 
 # 钉钉设置
 wechat_webhook_url = f'https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key={os.getenv("wechat_webhook_url")}'
@@ -10,9 +10,16 @@ warnings.filterwarnings('ignore')
 
 from utils.log_kit import logger
 from hunter.risk_manager import check_stop_loss, check_take_profit
-from config import data_path, interval_config, accounts_info
+from config import data_path, interval_config, accounts_info, signal_config
 from clients.bn_api import get_symbol_current_price
 from utils.commons import send_wechat_message, replace_special_characters
+from utils import kline_store, ohlcv_ring
+from utils.datatools import load_active_pool
+from hunter.signal_state import incremental_signal
+from hunter.signal_panel import get_panel_kernel, panel_signals
+from hunter.signal_workers import worker_signals
+from signals.registry import get_strategy, get_timeframe
+from hunter import signal_cache, signal_window
 
 # pandas相关的显示设置
 pd.set_option('display.max_rows', 1000)
@@ -52,6 +59,63 @@ def create_position_files():
             logger.info(f"创建空的active_position.csv: {active_position_file}")
 
 
+def get_interval_minutes(timeframe=None):
+    """
+    K线周期对应的分钟数
+    timeframe: 策略使用的K线周期，默认为基础周期
+    """
+    timeframe = timeframe or interval_config['kline_interval']
+    if timeframe.endswith('m'):
+        return int(timeframe[:-1])
+    elif timeframe.endswith('h'):
+        return int(timeframe[:-1]) * 60
+    return 5
+
+
+def compute_last_signal(token_info, chain, signal_name, params, store_dir):
+    """
+    计算代币最后一根K线的信号
+    
+    Returns:
+        只有最后一根K线的DataFrame(UTC时间)，列为candle_begin_time, symbol, signal, close, address, pair_address，
+        没有K线时返回空DataFrame
+    """
+    # 获取已加载的策略模块
+    signal_cls = get_strategy(signal_name)
+    
+    if signal_config['incremental'] and hasattr(signal_cls, 'update_state'):
+        # 增量计算，只处理新到的K线
+        df = incremental_signal(token_info, chain, signal_name, params, signal_cls, store_dir)
+        if df.empty:
+            return df
+        df['symbol'] = token_info['symbol']
+        df['address'] = token_info['address']
+        df['pair_address'] = token_info.get('pair_address')
+    else:
+        # 只读取策略需要的尾部K线，优先从共享内存读取，没有时再读取K线存储；策略声明了更大的周期时在本地重采样
+        # 窗口内不能确定去除重复信号的结果时扩大窗口，和全部历史计算的信号一致
+        bars = signal_cls.lookback(*params)
+        timeframe = get_timeframe(signal_name)
+        window = bars
+        while True:
+            records, complete = signal_window.read_window(store_dir, window, timeframe)
+            if records is None:
+                return pd.DataFrame()
+            df = ohlcv_ring.to_dataframe(records)
+            df['symbol'] = token_info['symbol']
+            df['address'] = token_info['address']
+            df['pair_address'] = token_info.get('pair_address')
+
+            # 计算信号
+            df = signal_cls.signal(df, *params)
+            if complete or signal_window.settled(df['signal'], bars):
+                break
+            window *= signal_window.WIDEN_FACTOR
+    
+    # 获取最后一个有效信号，留下有用的列
+    return df.iloc[[-1]][['candle_begin_time', 'symbol', 'signal', 'close', 'address', 'pair_address']].reset_index(drop=True)
+
+
 def calculate_signal(token_info, run_time, account_info):
     """
     计算交易信号
@@ -74,61 +138,103 @@ def calculate_signal(token_info, run_time, account_info):
     
     # 获取K线数据，处理特殊字符
     symbol = replace_special_characters(symbol)
-    klines_file = data_path / f"klines/{chain}/{symbol}_{address}.csv"
-    if not os.path.exists(klines_file):
-        logger.warning(f"K线数据不存在: {klines_file}")
-        return pd.DataFrame()
-    
-    # 读取K线数据
-    df = pd.read_csv(klines_file, parse_dates=['candle_begin_time'])
-    
-    # 导入相应的策略模块
-    signal_cls = __import__('signals.%s' % signal_name, fromlist=('',))
+    store_dir = kline_store.get_store_dir(chain, symbol, address)
     
-    # 计算信号
-    df = signal_cls.signal(df, *params)
+    # K线没有变化时直接使用缓存的信号
+    cache_key = signal_cache.cache_key(token_info, signal_name, params)
+    version = ohlcv_ring.data_version(store_dir)
+    df_signal = signal_cache.get(cache_key, version)
+    if df_signal is None:
+        df_signal = compute_last_signal(token_info, chain, signal_name, params, store_dir)
+        if df_signal.empty:
+            logger.warning(f"K线数据不存在: {store_dir}")
+            return pd.DataFrame()
+        signal_cache.put(cache_key, version, df_signal)
     
-    # 将UTC时间转换为UTC+8
+    return filter_fresh_signals(df_signal, run_time, get_timeframe(signal_name))
+
+
+def filter_fresh_signals(df, run_time, timeframe=None):
+    """
+    将信号时间从UTC转换为UTC+8，并过滤掉不是最新的信号
+    df: 信号DataFrame，candle_begin_time为UTC时间
+    run_time: 运行时间
+    timeframe: 信号的K线周期，默认为基础周期
+    Returns: 过滤后的信号DataFrame
+    """
+    df = df.copy()
     df['candle_begin_time'] = df['candle_begin_time'] + pd.Timedelta(hours=8)
     
-    # 获取最后一个有效信号
-    df_signal = df.iloc[[-1]]
-    
-    # 检查信号时间是否在运行时间范围内
+    # 如果时间差大于两个周期，则信号不是最新的
     run_time_pd = pd.to_datetime(run_time)
-    time_diff = (run_time_pd - df_signal['candle_begin_time'].values[0]).total_seconds() / 60
-    
-    # 如果时间差大于一个周期（假设5分钟），则信号可能不是最新的
-    if interval_config['kline_interval'].endswith('m'):
-        interval = int(interval_config['kline_interval'][:-1])
-    elif interval_config['kline_interval'].endswith('h'):
-        interval = int(interval_config['kline_interval'][:-1]) * 60
-    else:
-        interval = 5
-
-    if time_diff > interval * 2:
-        logger.warning(f"{symbol} 信号时间 {df_signal['candle_begin_time']} 不在运行时间 {run_time_pd} 范围内")
-        return pd.DataFrame()
-    
-    # 留下有用的列
-    df_signal = df_signal[['candle_begin_time', 'symbol', 'signal', 'close', 'address', 'pair_address']]
+    time_diff = (run_time_pd - df['candle_begin_time']).dt.total_seconds() / 60
+    stale = time_diff > get_interval_minutes(timeframe) * 2
+    for _, row in df[stale].iterrows():
+        logger.warning(f"{row['symbol']} 信号时间 {row['candle_begin_time']} 不在运行时间 {run_time_pd} 范围内")
     
-    return df_signal
+    return df[~stale].reset_index(drop=True)
 
 
-def active_position_process(account_id, account_info, run_time):
+def calculate_signals(token_infos, run_time, account_info):
     """
-    处理活跃仓位，获取卖出订单
+    批量计算多个代币的交易信号
+    策略有向量化实现并开启signal_config['panel']时，缓存未命中的代币一次计算；
+    开启signal_config['workers']时，缓存未命中的代币在进程池中并行计算；否则逐个调用calculate_signal
     
     Args:
-        account_id: 账户ID
+        token_infos: 代币信息字典列表
+        run_time: 运行时间
         account_info: 账户信息
         
     Returns:
-        卖出订单列表
+        每个有效代币一行的信号DataFrame，列与calculate_signal的结果一致
     """
+    signal_name, params = account_info['strategy']['signal_timing']
+    chain = account_info['strategy']['chain_name']
     
-    # 获取活跃仓位文件路径
+    if signal_config['panel'] and get_panel_kernel(signal_name) is not None:
+        # 缓存未命中的代币一次计算
+        df = panel_signals([(signal_name, params, token_infos)], chain)[0]
+    elif signal_config['workers']:
+        # 缓存未命中的代币分给worker进程计算
+        df = worker_signals([(signal_name, params, token_infos)], chain)[0]
+    else:
+        frames = [calculate_signal(token_info, run_time, account_info) for token_info in token_infos]
+        frames = [df for df in frames if not df.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if df.empty:
+        return df
+    
+    # 记录没有K线的代币
+    missing = set(token_info['address'] for token_info in token_infos) - set(df['address'])
+    for address in missing:
+        logger.warning(f"K线数据不存在: {chain} - {address}")
+    
+    return filter_fresh_signals(df, run_time, get_timeframe(signal_name))
+
+
+def select_signals(cycle_signals, account_info, token_infos):
+    """
+    从本周期统一计算的信号中取出账户需要的部分
+    cycle_signals: signal_graph.compute_requests的结果
+    account_info: 账户信息
+    token_infos: 代币信息字典列表
+    Returns: 每个有效代币一行的信号DataFrame
+    """
+    signal_name, params = account_info['strategy']['signal_timing']
+    chain = account_info['strategy']['chain_name']
+    df = cycle_signals.get((chain, signal_name, tuple(params)), pd.DataFrame())
+    if df.empty:
+        return df
+    addresses = set(token_info['address'] for token_info in token_infos)
+    return df[df['address'].isin(addresses)].reset_index(drop=True)
+
+
+def load_active_positions(account_id):
+    """
+    读取账户未平仓的仓位
+    Returns: 未平仓仓位的DataFrame，没有时返回空DataFrame
+    """
     active_position_file = data_path / account_id / 'active_position.csv'
     # 检查文件是否存在
     if not os.path.exists(active_position_file):
@@ -143,7 +249,55 @@ def active_position_process(account_id, account_info, run_time):
         return pd.DataFrame()
 
     # 过滤出活跃仓位
-    active_df = active_positions[~active_positions['status'].isin(['closed', 'stop_loss'])]
+    return active_positions[~active_positions['status'].isin(['closed', 'stop_loss'])]
+
+
+def load_pool_candidates(account_id):
+    """
+    读取账户可以开仓的活跃池子代币，排除已有仓位的代币
+    Returns: 可开仓代币的DataFrame，没有时返回空DataFrame
+    """
+    # 单进程运行时直接使用talons发布的内存快照
+    active_pool = load_active_pool(account_id)
+    if active_pool is None:
+        logger.warning(f"活跃池子文件不存在: {data_path / account_id / 'active_pool.csv'}")
+        return pd.DataFrame()
+    # 检查是否有活跃池子
+    if active_pool.empty:
+        logger.info(f"账户 {account_id} 没有活跃池子")
+        return pd.DataFrame()
+
+    # 活跃仓位的代币，不再开仓
+    active_position_file = data_path / account_id / 'active_position.csv'
+    if os.path.exists(active_position_file):
+        active_position = pd.read_csv(active_position_file)    
+    active_position_tokens = set(active_position['address'].unique())
+    # 过滤已有仓位代币
+    filtered_pool = active_pool[~active_pool['address'].isin(active_position_tokens)]
+    
+    if filtered_pool.empty:
+        logger.info(f"账户 {account_id} 没有可开仓的新代币")
+    return filtered_pool
+
+
+def active_position_process(account_id, account_info, run_time, cycle_signals=None):
+    """
+    处理活跃仓位，获取卖出订单
+    
+    Args:
+        account_id: 账户ID
+        account_info: 账户信息
+        run_time: 运行时间
+        cycle_signals: 本周期统一计算的信号，None时单独计算
+        
+    Returns:
+        卖出订单列表
+    """
+    
+    # 读取未平仓的仓位
+    active_df = load_active_positions(account_id)
+    if active_df.empty:
+        return pd.DataFrame()
     
     # 转换为字典列表
     token_infos = active_df.to_dict(orient='records')
@@ -152,11 +306,20 @@ def active_position_process(account_id, account_info, run_time):
     quote_coin_symbol = account_info['strategy']['quote_coin_symbol']
     quote_coin_price = get_symbol_current_price(f'{quote_coin_symbol}/USDT')
     
-    sell_orders = pd.DataFrame()
+    # 1.批量计算信号
+    if cycle_signals is None:
+        signals_df = calculate_signals(token_infos, run_time, account_info)
+    else:
+        signals_df = select_signals(cycle_signals, account_info, token_infos)
+    
+    sell_orders = []
     for token_info in token_infos:
         
-        # 1.计算信号
-        df = calculate_signal(token_info, run_time, account_info)
+        # 取出该代币的信号
+        if signals_df.empty:
+            df = pd.DataFrame()
+        else:
+            df = signals_df[signals_df['address'] == token_info['address']].reset_index(drop=True)
         
         # 2.检查止损
         df['stop_loss'] = False
@@ -167,7 +330,8 @@ def active_position_process(account_id, account_info, run_time):
         df = check_take_profit(df, token_info, quote_coin_price)
         
         # 4.合并订单
-        sell_orders = pd.concat([sell_orders, df], ignore_index=True)
+        sell_orders.append(df)
+    sell_orders = pd.concat(sell_orders, ignore_index=True) if sell_orders else pd.DataFrame()
         
     # 5.加上active_df的需要信息
     amount_info = active_df[['address', 'balance', 'pnl']]
@@ -178,45 +342,28 @@ def active_position_process(account_id, account_info, run_time):
     return sell_orders
         
 
-def active_pool_process(account_id, account_info, run_time):
+def active_pool_process(account_id, account_info, run_time, cycle_signals=None):
     """
     处理活跃池子，获取买入订单
     account_id: 账户ID
     account_info: 账户信息
     run_time: 运行时间
+    cycle_signals: 本周期统一计算的信号，None时单独计算
     Returns: 买入订单列表
     """
-    # 获取活跃池子
-    active_pool_file = data_path / account_id / 'active_pool.csv'
-    if not os.path.exists(active_pool_file):
-        logger.warning(f"活跃池子文件不存在: {active_pool_file}")
-        return pd.DataFrame()
-    active_pool = pd.read_csv(active_pool_file)
-    # 检查是否有活跃池子
-    if active_pool.empty:
-        logger.info(f"账户 {account_id} 没有活跃池子")
-        return pd.DataFrame()
-
-    # 活跃仓位的代币，不再开仓
-    active_position_file = data_path / account_id / 'active_position.csv'
-    if os.path.exists(active_position_file):
-        active_position = pd.read_csv(active_position_file)    
-    active_position_tokens = set(active_position['address'].unique())
-    # 过滤已有仓位代币
-    filtered_pool = active_pool[~active_pool['address'].isin(active_position_tokens)]
-    
+    # 获取可开仓的代币
+    filtered_pool = load_pool_candidates(account_id)
     if filtered_pool.empty:
-        logger.info(f"账户 {account_id} 没有可开仓的新代币")
         return pd.DataFrame()
 
     # 转换为字典列表
     token_infos = filtered_pool.to_dict(orient='records')
     
-    # 逐一计算信号
-    buy_orders = pd.DataFrame()
-    for token_info in token_infos:
-        df = calculate_signal(token_info, run_time, account_info)
-        buy_orders = pd.concat([buy_orders, df], ignore_index=True)
+    # 批量计算信号
+    if cycle_signals is None:
+        buy_orders = calculate_signals(token_infos, run_time, account_info)
+    else:
+        buy_orders = select_signals(cycle_signals, account_info, token_infos)
     
     logger.ok(f"活跃池子订单:\n{buy_orders if not buy_orders.empty else 'No hot coins'}")
     
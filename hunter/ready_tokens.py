@@ -0,0 +1,98 @@
+"""
+按代币就绪处理模块
+talons每保存一个代币的K线就推送就绪通知(utils/data_notify.py)，hunter不等整条链完成，就绪的代币先计算信号
+说明:
+1. 持仓代币和可开仓代币分开处理，main.py先处理持仓，止损、止盈不会等待不相关的新代币
+2. 就绪的代币分批计算信号，一个账户需要的代币全部就绪(或更新失败)时立即调用处理函数
+3. 到截止时间仍未就绪的代币用已有的K线计算，和原来等待超时后的处理一致
+4. 所有账户的请求在开始时收集一次，每批就绪的代币只从中取出对应的请求，不再为每批重新读取持仓和币池
+"""
+import time
+import pandas as pd
+
+from utils.log_kit import logger
+from utils import data_notify
+from utils.datatools import load_chain_progress
+from hunter.signal_graph import collect_requests, select_requests, compute_requests
+
+# 输出等待进度的间隔(秒)
+REPORT_SECONDS = 10
+
+
+def _merge_signals(cycle_signals, signals):
+    """
+    把一批代币的信号合并到已有的信号中
+    """
+    for key, df in signals.items():
+        old = cycle_signals.get(key)
+        if old is None or old.empty:
+            cycle_signals[key] = df
+        elif not df.empty:
+            cycle_signals[key] = pd.concat([old, df], ignore_index=True)
+
+
+def process_when_ready(accounts, run_time, source, deadline, handle, wait=True):
+    """
+    代币就绪后分批计算信号，账户的代币都计算完时调用handle
+    accounts: {账户ID: 账户信息}
+    run_time: 运行时间
+    source: 'positions' 处理持仓代币，'pools' 处理可开仓代币
+    deadline: 最晚等待到的时间(datetime)
+    handle: handle(account_id, account_info, cycle_signals)，每个账户调用一次
+    wait: 为False时不等待通知，直接用已有的K线计算
+    """
+    chains = {account_id: account_info['strategy']['chain_name'] for account_id, account_info in accounts.items()}
+    pending = {}
+    wanted = {}
+    requests = {}
+    for account_id, account_info in accounts.items():
+        account_requests = collect_requests({account_id: account_info}, source)
+        pending[account_id] = set(address for tokens in account_requests.values() for address in tokens)
+        wanted.setdefault(chains[account_id], set()).update(pending[account_id])
+        for key, tokens in account_requests.items():
+            for address, token_info in tokens.items():
+                requests.setdefault(key, {}).setdefault(address, token_info)
+    token_count = sum(len(tokens) for tokens in requests.values())
+    logger.info(f"本周期 {len(accounts)} 个账户共 {len(requests)} 组策略、{token_count} 个代币需要计算信号")
+    cycle_signals = {}
+
+    def finish():
+        for account_id in [account_id for account_id, addresses in pending.items() if not addresses]:
+            del pending[account_id]
+            handle(account_id, accounts[account_id], cycle_signals)
+
+    def compute(chain_name, addresses):
+        batch = select_requests(requests, chain_name, addresses)
+        if batch:
+            _merge_signals(cycle_signals, compute_requests(batch, run_time))
+        for account_id, remaining in pending.items():
+            if chains[account_id] == chain_name:
+                remaining -= addresses
+        finish()
+
+    # 没有代币的账户直接处理
+    finish()
+    if wait:
+        run_time_str = run_time.strftime('%Y-%m-%d_%H_%M')
+        reported = [time.time()]
+
+        def report(count):
+            if time.time() - reported[0] >= REPORT_SECONDS:
+                logger.info(f"等待 {count} 个{'持仓' if source == 'positions' else '可开仓'}代币的K线就绪")
+                for chain_name in wanted:
+                    progress = load_chain_progress(chain_name)
+                    if progress.get('run_time') == run_time_str and not progress.get('done'):
+                        logger.info(f"{chain_name} K线更新: {progress['finished']}/{progress['total'] or '?'}个代币，已用时 {progress['elapsed']} 秒")
+                reported[0] = time.time()
+
+        for chain_name, ready in data_notify.wait_tokens(run_time, wanted, deadline, on_idle=report):
+            compute(chain_name, ready)
+
+    # 更新失败或到截止时间仍未就绪的代币用已有的K线计算
+    leftovers = {}
+    for account_id, addresses in pending.items():
+        leftovers.setdefault(chains[account_id], set()).update(addresses)
+    for chain_name, addresses in leftovers.items():
+        if wait:
+            logger.warning(f"{chain_name} 有 {len(addresses)} 个代币的K线本周期没有就绪，使用已有的K线计算")
+        compute(chain_name, addresses)
@@ -0,0 +1,94 @@
+"""
+信号缓存模块
+代币没有新K线时(talons获取失败、仓位长时间没有成交等)，直接返回上次的信号，不再重复读取K线和计算
+说明:
+1. key为 (交易对地址, 策略名称, 参数)，同时记录计算时的K线版本
+2. K线版本变化时缓存立即失效，K线版本来自共享内存头部或K线存储元数据，读取是O(1)的
+3. 按最近最少使用淘汰，最多保留 signal_config['cache_size'] 条
+"""
+import pandas as pd
+from collections import OrderedDict
+
+from config import signal_config
+from utils import kline_store, ohlcv_ring
+
+# key -> (K线版本, 信号DataFrame)
+_cache = OrderedDict()
+# 命中统计
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def cache_key(token_info, signal_name, params):
+    """
+    缓存的key: (交易对地址, 策略名称, 参数)，没有交易对地址时使用代币地址
+    """
+    pair_address = token_info.get('pair_address')
+    if pd.isna(pair_address) or not pair_address:
+        pair_address = token_info['address']
+    return (pair_address, signal_name, tuple(params))
+
+
+def get(key, version):
+    """
+    查询缓存
+    key: (交易对地址, 策略名称, 参数元组)
+    version: 当前的K线版本，为None时不使用缓存
+    Returns: 缓存的信号DataFrame，未命中返回None
+    """
+    entry = _cache.get(key)
+    if version is None or entry is None:
+        _stats['misses'] += 1
+        return None
+    if entry[0] != version:
+        # K线已变化，缓存失效
+        del _cache[key]
+        _stats['invalidations'] += 1
+        _stats['misses'] += 1
+        return None
+    _cache.move_to_end(key)
+    _stats['hits'] += 1
+    return entry[1]
+
+
+def put(key, version, df):
+    """
+    写入缓存，超过容量时淘汰最久未使用的记录
+    """
+    if version is None:
+        return
+    _cache[key] = (version, df)
+    _cache.move_to_end(key)
+    while len(_cache) > signal_config['cache_size']:
+        _cache.popitem(last=False)
+
+
+def lookup_groups(groups, chain):
+    """
+    批量查询多组策略的缓存
+    groups: [(策略名称, 参数, 代币信息字典列表)]
+    chain: 链名称
+    Returns: (frames, missed)
+        frames: 与groups顺序对应的列表，每项为命中的信号DataFrame列表
+        missed: 未命中的 [(组序号, 代币信息, 缓存key, K线版本)]，计算后用put写入缓存
+    """
+    frames = [[] for _ in groups]
+    missed = []
+    for i, (signal_name, params, token_infos) in enumerate(groups):
+        for token_info in token_infos:
+            store_dir = kline_store.get_store_dir(chain, token_info['symbol'], token_info['address'])
+            key = cache_key(token_info, signal_name, params)
+            version = ohlcv_ring.data_version(store_dir)
+            cached = get(key, version)
+            if cached is not None:
+                frames[i].append(cached)
+            else:
+                missed.append((i, token_info, key, version))
+    return frames, missed
+
+
+def get_stats():
+    """
+    获取缓存统计
+    Returns: 包含hits, misses, invalidations, size的字典
+    """
+    return {**_stats, 'size': len(_cache)}
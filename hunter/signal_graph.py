@@ -0,0 +1,101 @@
+"""
+跨账户信号计算图
+多个账户经常在同一条链上使用相同的策略、关注相同的代币，逐个账户计算会重复读取K线、重复计算相同的指标
+每个周期先收集所有账户的 (链, 代币, 策略, 参数) 请求并去重，每个请求只计算一次，再分发给各个账户
+说明:
+1. 逐个代币计算时，每个 (链, 代币, 策略, 参数) 只计算一次
+2. 开启 signal_config['panel'] 时，同一条链上所有有向量化实现的策略共用一个面板，
+   每个代币只读取一次K线，滚动均值等中间指标按 (指标, 输入, 周期) 只计算一次
+3. 开启 signal_config['workers'] 时，同一条链上的其他策略一起分给worker进程计算
+4. 计算结果按 (链, 策略名称, 参数元组) 保存，账户通过 position.select_signals 取出自己的代币
+5. 请求每个周期只收集一次(每个账户只读取一次持仓或币池)，代币分批就绪时用select_requests取出就绪代币的请求计算
+"""
+import pandas as pd
+
+from config import signal_config
+from utils.log_kit import logger
+from hunter.position import calculate_signal, filter_fresh_signals, load_active_positions, load_pool_candidates
+from hunter.signal_panel import get_panel_kernel, panel_signals
+from hunter.signal_workers import worker_signals
+from signals.registry import get_timeframe
+
+
+def collect_requests(accounts, source=None, addresses=None):
+    """
+    收集所有账户需要计算信号的代币，按 (链, 策略名称, 参数元组) 分组去重
+    accounts: {账户ID: 账户信息}
+    source: 'positions' 只收集持仓代币，'pools' 只收集可开仓代币，None时都收集
+    addresses: 只收集这些地址的代币，None时不限制
+    Returns: {(链, 策略名称, 参数元组): {代币地址: 代币信息字典}}
+    """
+    loaders = {'positions': (load_active_positions,), 'pools': (load_pool_candidates,)}.get(source, (load_active_positions, load_pool_candidates))
+    requests = {}
+    for account_id, account_info in accounts.items():
+        signal_name, params = account_info['strategy']['signal_timing']
+        chain = account_info['strategy']['chain_name']
+        tokens = requests.setdefault((chain, signal_name, tuple(params)), {})
+        for load in loaders:
+            for token_info in load(account_id).to_dict(orient='records'):
+                if addresses is None or token_info['address'] in addresses:
+                    tokens.setdefault(token_info['address'], token_info)
+    return requests
+
+
+def select_requests(requests, chain, addresses):
+    """
+    从collect_requests的结果中取出一条链上部分代币的请求，不重新读取持仓和币池
+    chain: 链名称
+    addresses: 代币地址集合
+    Returns: 同collect_requests，没有代币的请求不返回
+    """
+    selected = {}
+    for key, tokens in requests.items():
+        if key[0] != chain:
+            continue
+        tokens = {address: token_info for address, token_info in tokens.items() if address in addresses}
+        if tokens:
+            selected[key] = tokens
+    return selected
+
+
+def compute_requests(requests, run_time):
+    """
+    统一计算一组请求的信号
+    requests: collect_requests或select_requests的结果
+    run_time: 运行时间
+    Returns: {(链, 策略名称, 参数元组): 信号DataFrame}，信号已转换为UTC+8并过滤掉不是最新的
+    """
+    cycle_signals = {}
+
+    # 同一条链上有向量化实现的策略合并成一个面板计算，其他策略开启进程池时合并分给worker计算
+    panel_groups = {}
+    worker_groups = {}
+    for (chain, signal_name, params), tokens in requests.items():
+        if not tokens:
+            continue
+        if signal_config['panel'] and get_panel_kernel(signal_name) is not None:
+            panel_groups.setdefault(chain, []).append((signal_name, params, list(tokens.values())))
+            continue
+        if signal_config['workers']:
+            worker_groups.setdefault(chain, []).append((signal_name, params, list(tokens.values())))
+            continue
+        # 逐个代币计算，account_info只需要策略信息
+        account_info = {'strategy': {'chain_name': chain, 'signal_timing': (signal_name, params)}}
+        frames = [calculate_signal(token_info, run_time, account_info) for token_info in tokens.values()]
+        frames = [df for df in frames if not df.empty]
+        cycle_signals[(chain, signal_name, params)] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    for chain_groups, compute in ((panel_groups, panel_signals), (worker_groups, worker_signals)):
+        for chain, groups in chain_groups.items():
+            for (signal_name, params, token_infos), df in zip(groups, compute(groups, chain)):
+                if df.empty:
+                    cycle_signals[(chain, signal_name, params)] = df
+                    continue
+                missing = set(token_info['address'] for token_info in token_infos) - set(df['address'])
+                for address in missing:
+                    logger.warning(f"K线数据不存在: {chain} - {address}")
+                cycle_signals[(chain, signal_name, params)] = filter_fresh_signals(df, run_time, get_timeframe(signal_name))
+
+    token_count = sum(len(tokens) for tokens in requests.values())
+    logger.info(f"本批 {len(requests)} 组策略、{token_count} 个代币计算信号")
+    return cycle_signals
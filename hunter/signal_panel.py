@@ -0,0 +1,186 @@
+"""
+多代币信号面板模块
+把所有候选代币最近的K线对齐成一个二维数组(代币 × K线)，一次向量化计算全部代币的信号，
+代替逐个代币构建DataFrame、计算指标、再逐个合并的方式
+说明:
+1. 每个代币按K线顺序右对齐，最后一根K线对齐到最后一列，K线不足的部分用mask标记
+   中间缺失的K线和逐个代币计算时一样直接跳过，所以结果和signal()在同一段K线上的计算一致
+2. 指标使用 signals/indicators.py，K线不足的部分为NaN，和pandas一样跳过
+3. 每个代币只读取策略声明的回看K线数量，窗口内不能确定去除重复信号的结果时，这些代币扩大窗口重新计算(见hunter/signal_window.py)
+4. 只有在 PANEL_KERNELS 中注册了向量化实现的策略，或者只使用收盘价的表达式策略才能使用面板计算
+5. 同一条链上K线周期相同的多个策略共用一个面板，中间指标按 (指标, 输入, 周期) 只计算一次，
+   此时面板窗口取这些策略中最长的回看数量；声明了TIMEFRAME的策略使用重采样后收盘的K线
+"""
+import numpy as np
+import pandas as pd
+
+from utils import kline_store
+from signals.registry import get_lookback, get_strategy, get_timeframe
+from signals.indicators import rolling_mean, rolling_std, cross_above, cross_below, raw_signals, dedup_signals, last_signal_settled
+from hunter import signal_cache, signal_window
+
+
+# ============= 面板数据 =============
+def load_panel(token_infos, chain, window, timeframe=None):
+    """
+    读取代币最近的K线并右对齐成二维数组
+    token_infos: 代币信息字典列表
+    chain: 链名称
+    window: 每个代币最多保留的K线数量
+    timeframe: K线周期，默认为基础周期
+    Returns: 字典，close/valid为 代币数 × window 的数组，last_time为每个代币最后一根K线的epoch秒(没有K线时为-1)，
+             complete为每个代币是否已经读取全部历史，nodes为已计算的中间指标
+    """
+    close = np.full((len(token_infos), window), np.nan)
+    valid = np.zeros((len(token_infos), window), dtype=bool)
+    last_time = np.full(len(token_infos), -1, dtype=np.int64)
+    complete = np.ones(len(token_infos), dtype=bool)
+
+    for i, token_info in enumerate(token_infos):
+        store_dir = kline_store.get_store_dir(chain, token_info['symbol'], token_info['address'])
+        records, complete[i] = signal_window.read_window(store_dir, window, timeframe)
+        if records is None:
+            continue
+        times, closes = records['candle_begin_time'], records['close']
+        count = min(len(closes), window)
+        close[i, window - count:] = closes[-count:]
+        valid[i, window - count:] = True
+        last_time[i] = times[-1]
+
+    return {'close': close, 'valid': valid, 'last_time': last_time, 'complete': complete, 'nodes': {}}
+
+
+# ============= 中间指标 =============
+def indicator(panel, name, source, n):
+    """
+    获取面板上的中间指标，相同的 (指标, 输入, 周期) 只计算一次
+    panel: load_panel返回的面板
+    name: 指标名称，'mean' 或 'std'
+    source: 输入，'close' 或另一个指标的key
+    n: 周期
+    Returns: (指标的key, 指标数组)
+    """
+    key = (name, source, n)
+    if key not in panel['nodes']:
+        values = panel['close'] if source == 'close' else panel['nodes'][source]
+        func = rolling_mean if name == 'mean' else rolling_std
+        panel['nodes'][key] = func(values, n)
+    return key, panel['nodes'][key]
+
+
+# ============= 策略的向量化实现 =============
+def sma_panel(panel, n, m):
+    """
+    双均线策略，和signals/sma.py一致
+    Returns: 未去重的信号矩阵
+    """
+    short_key, ma_short = indicator(panel, 'mean', 'close', n)
+    _, ma_long = indicator(panel, 'mean', short_key, m)
+    return raw_signals(cross_above(ma_short, ma_long), cross_below(ma_short, ma_long))
+
+
+def bolling_panel(panel, n, k):
+    """
+    布林带策略，和signals/bolling.py一致
+    Returns: 未去重的信号矩阵
+    """
+    close = panel['close']
+    _, middle = indicator(panel, 'mean', 'close', n)
+    _, std = indicator(panel, 'std', 'close', n)
+    upper = middle + k * std
+    return raw_signals(cross_above(close, upper), cross_below(close, middle))
+
+
+# 策略名称到向量化实现的映射
+PANEL_KERNELS = {
+    'sma': sma_panel,
+    'bolling': bolling_panel,
+}
+
+
+def get_panel_kernel(signal_name):
+    """
+    获取策略的向量化实现，表达式策略使用编译后的实现
+    Returns: kernel(panel, *params)，没有时返回None
+    """
+    if signal_name in PANEL_KERNELS:
+        return PANEL_KERNELS[signal_name]
+    return getattr(get_strategy(signal_name), 'panel_kernel', None)
+
+
+def _settled_signals(panel, index, token_infos, chain, timeframe, signal_name, params, bars):
+    """
+    计算面板中一组代币最后一根K线的信号，窗口内不能确定去除重复信号结果的代币扩大窗口重新计算
+    index: 代币在面板中的行号
+    token_infos: 与index对应的代币信息字典列表
+    bars: 策略的回看K线数量
+    Returns: (信号数组, 最后一根K线的epoch秒数组, 最后一根K线的收盘价数组)
+    """
+    kernel = get_panel_kernel(signal_name)
+    signals = dedup_signals(kernel(panel, *params)[index])
+    signal = signals[:, -1].copy()
+    last_time = panel['last_time'][index].copy()
+    last_close = panel['close'][index, -1].copy()
+
+    window = panel['close'].shape[1]
+    pending = np.flatnonzero(~panel['complete'][index] & ~last_signal_settled(signals, bars))
+    while len(pending):
+        window *= signal_window.WIDEN_FACTOR
+        wide = load_panel([token_infos[row] for row in pending], chain, window, timeframe)
+        signals = dedup_signals(kernel(wide, *params))
+        signal[pending] = signals[:, -1]
+        last_time[pending] = wide['last_time']
+        last_close[pending] = wide['close'][:, -1]
+        pending = pending[~wide['complete'] & ~last_signal_settled(signals, bars)]
+    return signal, last_time, last_close
+
+
+def panel_signals(groups, chain):
+    """
+    同一条链上K线周期相同的多组策略共用一个面板，一次计算所有代币最后一根K线的信号
+    K线没有变化的代币直接使用信号缓存，只有未命中的代币进入面板
+    groups: [(策略名称, 参数, 代币信息字典列表)]，策略需要有向量化实现
+    chain: 链名称
+    Returns: 与groups顺序对应的DataFrame列表，每个代币一行，
+             列为candle_begin_time(UTC), symbol, signal, close, address, pair_address，没有K线的代币不在结果中
+    """
+    # 先查缓存
+    frames, missed = signal_cache.lookup_groups(groups, chain)
+
+    # 按K线周期分成多个面板
+    timeframes = {}
+    for item in missed:
+        timeframes.setdefault(get_timeframe(groups[item[0]][0]), []).append(item)
+
+    for timeframe, timeframe_missed in timeframes.items():
+        # 所有未命中的代币只读取一次K线
+        rows = {}
+        for _, token_info, _, _ in timeframe_missed:
+            rows.setdefault(token_info['address'], (len(rows), token_info))
+        panel_infos = [token_info for _, token_info in rows.values()]
+        window = max(get_lookback(groups[i][0], groups[i][1]) for i, _, _, _ in timeframe_missed)
+        panel = load_panel(panel_infos, chain, window, timeframe)
+
+        for i, (signal_name, params, _) in enumerate(groups):
+            group_missed = [(token_info, key, version) for j, token_info, key, version in timeframe_missed if j == i]
+            if not group_missed:
+                continue
+            index = np.array([rows[token_info['address']][0] for token_info, _, _ in group_missed])
+            bars = get_lookback(signal_name, params)
+            signal, last_time, last_close = _settled_signals(panel, index, [token_info for token_info, _, _ in group_missed],
+                                                            chain, timeframe, signal_name, params, bars)
+            for row, (token_info, key, version) in enumerate(group_missed):
+                if last_time[row] < 0:
+                    continue
+                df = pd.DataFrame({
+                    'candle_begin_time': [pd.Timestamp(int(last_time[row]), unit='s')],
+                    'symbol': [token_info['symbol']],
+                    'signal': [signal[row] if signal[row] != 0 else np.nan],
+                    'close': [last_close[row]],
+                    'address': [token_info['address']],
+                    'pair_address': [token_info.get('pair_address')],
+                })
+                signal_cache.put(key, version, df)
+                frames[i].append(df)
+
+    return [pd.concat(group_frames, ignore_index=True) if group_frames else pd.DataFrame() for group_frames in frames]
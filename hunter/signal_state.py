@@ -0,0 +1,190 @@
+"""
+增量信号计算模块
+每个策略只保存O(window)的状态(滑动窗口、累加和、上一根K线的指标和上一个信号)，
+每来一根新K线只做O(1)的更新，不再每个周期对全部历史K线重新计算
+说明:
+1. 状态按 (链, 代币地址, 策略, 参数) 保存，多个账户使用相同策略时共用
+2. 状态保存在 data_feed/signal_state/CHAIN/STRATEGY_PARAMS.pkl，重启后继续使用
+3. 以下情况会用全部历史K线重建状态：没有状态、状态格式和策略的STATE_VERSION不一致、新K线和状态之间有缺口、最后一根K线被修正、
+   K线存储在状态之后写入了状态最后一根K线之前的K线(补齐缺口、报价K线校正等，见kline_store.changed_since)
+4. 开启 signal_config['verify'] 后，每次都会和全量计算的结果核对，不一致时记录警告
+5. 策略声明了TIMEFRAME时，状态按重采样后已经收盘的K线更新
+"""
+import pickle
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from config import signal_config, signal_state_path, kline_ring_size, interval_config
+from utils.log_kit import logger
+from utils import kline_store, ohlcv_ring, ohlcv_resample
+
+# 已加载的状态，key为状态文件路径，value为 {代币地址: 状态}
+_states = {}
+# 本周期有更新、需要保存的状态文件
+_dirty = set()
+
+
+def _state_file(chain, signal_name, params):
+    """
+    获取状态文件路径
+    """
+    params_str = '_'.join(str(param) for param in params)
+    return signal_state_path / chain / f"{signal_name}_{params_str}.pkl"
+
+
+def _load_states(state_file):
+    """
+    加载状态文件，进程内只加载一次
+    """
+    key = str(state_file)
+    if key not in _states:
+        if state_file.exists():
+            with open(state_file, 'rb') as f:
+                _states[key] = pickle.load(f)
+        else:
+            _states[key] = {}
+    return _states[key]
+
+
+def save_states():
+    """
+    保存本周期有更新的状态文件
+    """
+    for key in list(_dirty):
+        state_file = Path(key)
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = state_file.with_suffix('.tmp')
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(_states[key], f)
+        tmp_file.replace(state_file)
+        _dirty.discard(key)
+
+
+def _recent_klines(store_dir, timeframe=None):
+    """
+    获取最近的K线，优先读取共享内存，timeframe不是基础周期时读取重采样后收盘的K线
+    Returns: (epoch秒数组, 收盘价数组)
+    """
+    if not ohlcv_resample.is_base(timeframe):
+        ratio = ohlcv_resample.timeframe_seconds(timeframe) // ohlcv_resample.timeframe_seconds(interval_config['kline_interval'])
+        bars = ohlcv_resample.read_resampled(store_dir, timeframe, tail=max(kline_ring_size // ratio, 2))
+        return bars['candle_begin_time'], bars['close']
+    window = ohlcv_ring.read_ring(store_dir)
+    if window is not None and len(window):
+        return window['candle_begin_time'], window['close']
+    df = kline_store.read_klines(store_dir, tail=kline_ring_size)
+    if df.empty:
+        return np.array([], dtype=np.int64), np.array([])
+    return kline_store.to_epoch(df['candle_begin_time']), df['close'].to_numpy(dtype=np.float64)
+
+
+def _history(store_dir, timeframe=None):
+    """
+    全部历史K线，timeframe不是基础周期时为重采样后收盘的K线
+    """
+    if ohlcv_resample.is_base(timeframe):
+        return kline_store.read_klines(store_dir)
+    bars = ohlcv_resample.read_resampled(store_dir, timeframe)
+    return ohlcv_ring.to_dataframe(bars) if len(bars) else pd.DataFrame()
+
+
+def _rebuild_state(signal_module, store_dir, params, store_version):
+    """
+    使用全部历史K线重建状态，结果和全量计算一致
+    store_version: 读取K线之前K线存储元数据的版本
+    """
+    df = _history(store_dir, getattr(signal_module, 'TIMEFRAME', None))
+    if df.empty:
+        return None
+    state = {'strategy': signal_module.init_state(*params), 'signal': None,
+             'version': getattr(signal_module, 'STATE_VERSION', 1), 'store_version': store_version}
+    for close in df['close'].to_numpy(dtype=np.float64):
+        state['signal'] = signal_module.update_state(state['strategy'], close, *params)
+    state['last_time'] = int(kline_store.to_epoch(df['candle_begin_time'].iloc[[-1]])[0])
+    state['last_close'] = float(df['close'].iloc[-1])
+    return state
+
+
+def _verify(signal_module, store_dir, params, state, symbol):
+    """
+    和全量计算的结果核对
+    """
+    df = _history(store_dir, getattr(signal_module, 'TIMEFRAME', None))
+    if df.empty:
+        return
+    df = signal_module.signal(df, *params)
+    last_row = df.iloc[-1]
+    full_signal = None if pd.isna(last_row['signal']) else int(last_row['signal'])
+    mismatches = []
+    if full_signal != state['signal']:
+        mismatches.append(f"signal: {state['signal']} != {full_signal}")
+    for col in getattr(signal_module, 'INDICATOR_COLUMNS', []):
+        if not np.isclose(state['strategy'][col], last_row[col], rtol=1e-9, atol=0):
+            mismatches.append(f"{col}: {state['strategy'][col]} != {last_row[col]}")
+    if mismatches:
+        logger.warning(f"{symbol} 增量信号和全量计算不一致: {', '.join(mismatches)}")
+
+
+def incremental_signal(token_info, chain, signal_name, params, signal_module, store_dir):
+    """
+    增量计算代币最后一根K线的信号
+    token_info: 代币信息字典
+    chain: 链名称
+    signal_name: 策略名称
+    params: 策略参数
+    signal_module: 策略模块，需要实现init_state和update_state
+    store_dir: 代币的K线存储目录
+    Returns: 只有最后一根K线的DataFrame，列为candle_begin_time, close, signal，没有K线时返回空DataFrame
+    """
+    address = token_info['address']
+    state_file = _state_file(chain, signal_name, params)
+    states = _load_states(state_file)
+    state = states.get(address)
+
+    timeframe = getattr(signal_module, 'TIMEFRAME', None)
+    # 先读取版本再读取K线，读取期间的写入下次还会检查到
+    store_version, written = kline_store.changed_since(store_dir, None if state is None else state.get('store_version'))
+    times, closes = _recent_klines(store_dir, timeframe)
+    if len(times) == 0:
+        return pd.DataFrame()
+
+    if state is not None and state.get('version', 1) != getattr(signal_module, 'STATE_VERSION', 1):
+        # 策略的状态格式已经修改，旧的状态不能继续使用
+        state = None
+
+    if state is not None and written is not None:
+        period = ohlcv_resample.timeframe_seconds(timeframe or interval_config['kline_interval'])
+        if written // period * period < state['last_time']:
+            # 状态之后写入了最后一根之前的K线，累加和里的旧数据已经不对；最后一根K线被修正由下面的收盘价检查
+            state = None
+
+    if state is not None:
+        position = np.searchsorted(times, state['last_time'])
+        # 状态之后的K线有缺口，或者状态对应的K线被修正，需要重建
+        if position == len(times) or times[position] != state['last_time'] or closes[position] != state['last_close']:
+            state = None
+        else:
+            for close in closes[position + 1:]:
+                state['signal'] = signal_module.update_state(state['strategy'], float(close), *params)
+            if position + 1 < len(times) or state.get('store_version') != store_version:
+                state['last_time'] = int(times[-1])
+                state['last_close'] = float(closes[-1])
+                state['store_version'] = store_version
+                _dirty.add(str(state_file))
+
+    if state is None:
+        state = _rebuild_state(signal_module, store_dir, params, store_version)
+        if state is None:
+            return pd.DataFrame()
+        states[address] = state
+        _dirty.add(str(state_file))
+
+    if signal_config['verify']:
+        _verify(signal_module, store_dir, params, state, token_info['symbol'])
+
+    return pd.DataFrame([{
+        'candle_begin_time': pd.Timestamp(state['last_time'], unit='s'),
+        'close': state['last_close'],
+        'signal': np.nan if state['signal'] is None else state['signal'],
+    }])
@@ -0,0 +1,51 @@
+"""
+信号窗口模块
+计算信号时只读取策略回看数量的尾部K线，但去除重复信号需要知道之前的信号，
+窗口之前的信号不在窗口内时，最后一根K线的信号可能和全部历史计算的结果不同(例如布林带连续出现的开仓信号)
+说明:
+1. 窗口内第lookback-1根及之后的K线指标完整，这些位置的信号和全部历史计算的一致，称为有效信号
+2. 最后一根K线之前有有效信号时，窗口内去重的结果和全部历史去重的结果一致
+3. 窗口内没有任何信号且最后一根K线没有信号时，结果也一致
+4. 其他情况窗口扩大WIDEN_FACTOR倍重新计算，直到满足以上条件或已经读取全部历史
+"""
+import numpy as np
+
+from utils import kline_store, ohlcv_ring, ohlcv_resample
+from signals.indicators import last_signal_settled
+
+# 每次扩大窗口的倍数
+WIDEN_FACTOR = 4
+
+
+def read_window(store_dir, bars, timeframe=None):
+    """
+    读取最近bars根K线，优先读取共享内存，不够时读取K线存储；timeframe不是基础周期时读取重采样后收盘的K线
+    Returns: (K线记录，按列名取数组，candle_begin_time为epoch秒；是否已经是全部历史)，没有K线时记录为None
+    """
+    if not ohlcv_resample.is_base(timeframe):
+        records = ohlcv_resample.read_resampled(store_dir, timeframe, tail=bars)
+        if len(records) < bars:
+            # 按时间估算的范围内不够，可能中间有缺失的周期，读取全部历史
+            records = ohlcv_resample.read_resampled(store_dir, timeframe)
+            return (records if len(records) else None), True
+        return records, False
+
+    records = ohlcv_ring.read_ring(store_dir, tail=bars)
+    if records is not None and len(records) >= bars:
+        return records, False
+    df = kline_store.read_klines(store_dir, tail=bars)
+    if df.empty:
+        return (records if records is not None and len(records) else None), True
+    records = {col: df[col].to_numpy(dtype=np.float64) for col in kline_store.KLINE_COLUMNS if col != 'candle_begin_time'}
+    records['candle_begin_time'] = kline_store.to_epoch(df['candle_begin_time'])
+    return records, len(df) < bars
+
+
+def settled(signal_column, bars):
+    """
+    策略signal()结果最后一根K线的信号是否不受窗口之前的信号影响
+    signal_column: 策略输出的signal列，无信号为NaN
+    bars: 策略的回看K线数量
+    """
+    signals = np.nan_to_num(np.asarray(signal_column, dtype=np.float64), nan=0.0)
+    return bool(last_signal_settled(signals, bars))
@@ -0,0 +1,239 @@
+"""
+信号计算进程池
+常驻的worker进程在多个周期之间保持运行，策略只导入一次，最近的K线尾部缓存在进程内，
+代币按地址固定分配给某个worker，K线没有变化时直接使用缓存的尾部
+说明:
+1. 使用spawn方式启动，worker不创建clients中的客户端；spawn会在子进程中重新导入__main__(main.py或runtime.py)及其导入的模块，
+   所以这些模块不能在导入时创建客户端：clients/bn_api.py的币安客户端和talons/klines_fetcher.py的CMC客户端都在第一次使用时才创建
+2. worker只读取策略声明的回看K线数量计算信号(窗口内不能确定去除重复信号的结果时扩大窗口)，不使用增量状态(状态文件按策略保存，多个进程同时写会冲突)
+3. 策略收到全部OHLCV列，和逐个代币计算时一致；结果以数组返回(代币序号, K线时间, 收盘价, 信号)，主进程再组装成DataFrame
+4. worker异常或超时时，该批代币在主进程中计算，主进程中也失败时记录错误并跳过这批代币
+5. signal_config['workers']为0时不启动进程池
+"""
+import zlib
+import traceback
+import numpy as np
+import pandas as pd
+import multiprocessing as mp
+
+from config import signal_config
+from utils.log_kit import logger
+from utils import kline_store, ohlcv_ring, ohlcv_resample
+from signals.registry import get_strategy
+from hunter import signal_cache, signal_window
+
+# 每个worker等待结果的最长时间(秒)
+RESULT_TIMEOUT = 120
+
+# 已启动的worker，[(进程, 任务队列)]
+_workers = []
+# 所有worker共用的结果队列
+_result_queue = None
+# 任务序号
+_task_counter = [0]
+
+# worker进程内缓存的K线尾部，key为存储目录，value为 (K线版本, K线记录, 是否为全部历史)，K线记录按列名取数组
+_tails = {}
+
+
+# ============= worker进程 =============
+def _tail(records, bars):
+    """K线记录的最后bars根"""
+    return {col: values[-bars:] for col, values in records.items()}
+
+
+def _read_tail(store_dir, bars, timeframe=None):
+    """
+    读取最近bars根K线，K线版本没有变化且缓存足够长时直接使用缓存
+    timeframe不是基础周期时读取重采样后收盘的K线，由重采样模块缓存
+    Returns: (K线记录，按列名取数组，candle_begin_time为epoch秒；是否已经是全部历史)，没有K线时记录为None
+    """
+    if not ohlcv_resample.is_base(timeframe):
+        return signal_window.read_window(store_dir, bars, timeframe)
+    key = str(store_dir)
+    version = ohlcv_ring.data_version(store_dir)
+    cached = _tails.get(key)
+    if version is not None and cached is not None and cached[0] == version:
+        records, complete = cached[1], cached[2]
+        count = len(records['candle_begin_time'])
+        if count >= bars or complete:
+            return _tail(records, bars), complete and count <= bars
+
+    records, complete = signal_window.read_window(store_dir, bars)
+    if records is None:
+        return None, True
+    records = {col: np.asarray(records[col]) for col in ohlcv_ring.RECORD_DTYPE.names}
+    _tails[key] = (version, records, complete)
+    return records, complete
+
+
+def compute_batch(chain, signal_name, params, tokens):
+    """
+    计算一批代币最后一根K线的信号，窗口内不能确定去除重复信号的结果时扩大窗口
+    策略收到的DataFrame和逐个代币计算时一致(全部OHLCV列，以及symbol、address)
+    tokens: [(代币序号, symbol, address)]
+    Returns: (序号数组, K线时间数组, 收盘价数组, 信号数组)，没有K线的代币不在结果中
+    """
+    strategy = get_strategy(signal_name)
+    bars = strategy.lookback(*params)
+    timeframe = getattr(strategy, 'TIMEFRAME', None)
+    index, last_times, closes, signals = [], [], [], []
+    for position, symbol, address in tokens:
+        store_dir = kline_store.get_store_dir(chain, symbol, address)
+        window = bars
+        while True:
+            records, complete = _read_tail(store_dir, window, timeframe)
+            if records is None:
+                break
+            df = ohlcv_ring.to_dataframe(records)
+            df['symbol'] = symbol
+            df['address'] = address
+            df = strategy.signal(df, *params)
+            if complete or signal_window.settled(df['signal'], bars):
+                break
+            window *= signal_window.WIDEN_FACTOR
+        if records is None:
+            continue
+        signal = df['signal'].iloc[-1]
+        index.append(position)
+        last_times.append(records['candle_begin_time'][-1])
+        closes.append(records['close'][-1])
+        signals.append(0 if pd.isna(signal) else int(signal))
+    return (np.array(index, dtype=np.int32), np.array(last_times, dtype=np.int64),
+            np.array(closes, dtype=np.float64), np.array(signals, dtype=np.int8))
+
+
+def _compute_in_main(task):
+    """
+    在主进程中计算worker没有完成的一批代币，计算失败时记录错误并跳过这批代币
+    Returns: compute_batch的结果，失败时返回None
+    """
+    _, chain, signal_name, params, tokens = task
+    try:
+        return compute_batch(chain, signal_name, params, tokens)
+    except Exception as e:
+        logger.error(f"{chain} {signal_name}{list(params)} 的 {len(tokens)} 个代币计算信号失败，跳过: {e}\n{traceback.format_exc()}")
+        return None
+
+
+def _worker_loop(task_queue, result_queue):
+    """
+    worker进程的主循环，收到None时退出
+    """
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, chain, signal_name, params, tokens = task
+        try:
+            result_queue.put((task_id, compute_batch(chain, signal_name, params, tokens)))
+        except Exception:
+            result_queue.put((task_id, traceback.format_exc()))
+
+
+# ============= 主进程 =============
+def start_workers():
+    """
+    启动进程池，已启动时检查并重启退出的worker
+    """
+    global _result_queue
+    ctx = mp.get_context('spawn')
+    if _result_queue is None:
+        _result_queue = ctx.Queue()
+    for i in range(signal_config['workers']):
+        if i < len(_workers) and _workers[i][0].is_alive():
+            continue
+        task_queue = ctx.Queue()
+        process = ctx.Process(target=_worker_loop, args=(task_queue, _result_queue), name=f'signal_worker_{i}', daemon=True)
+        process.start()
+        if i < len(_workers):
+            logger.warning(f"信号worker {i} 已退出，重新启动")
+            _workers[i] = (process, task_queue)
+        else:
+            _workers.append((process, task_queue))
+    return _workers
+
+
+def stop_workers():
+    """
+    通知所有worker退出
+    """
+    for process, task_queue in _workers:
+        if process.is_alive():
+            task_queue.put(None)
+    for process, _ in _workers:
+        process.join(timeout=5)
+    _workers.clear()
+
+
+def _shard(address):
+    """
+    代币固定分配给某个worker，让K线尾部缓存在多个周期之间命中
+    """
+    return zlib.crc32(str(address).encode()) % signal_config['workers']
+
+
+def worker_signals(groups, chain):
+    """
+    在进程池中计算多组策略最后一根K线的信号，K线没有变化的代币直接使用信号缓存
+    groups: [(策略名称, 参数, 代币信息字典列表)]
+    chain: 链名称
+    Returns: 与groups顺序对应的DataFrame列表，每个代币一行，
+             列为candle_begin_time(UTC), symbol, signal, close, address, pair_address，没有K线的代币不在结果中
+    """
+    frames, missed = signal_cache.lookup_groups(groups, chain)
+    if not missed:
+        return [pd.concat(group_frames, ignore_index=True) if group_frames else pd.DataFrame() for group_frames in frames]
+
+    workers = start_workers()
+
+    # 按 (组, worker) 拆分任务
+    tasks = {}
+    for position, (i, token_info, _, _) in enumerate(missed):
+        shard = _shard(token_info['address'])
+        tasks.setdefault((i, shard), []).append((position, token_info['symbol'], token_info['address']))
+    pending = {}
+    for (i, shard), tokens in tasks.items():
+        _task_counter[0] += 1
+        signal_name, params, _ = groups[i]
+        task = (_task_counter[0], chain, signal_name, tuple(params), tokens)
+        workers[shard][1].put(task)
+        pending[task[0]] = task
+
+    # 收集结果，异常或超时的任务在主进程中计算
+    results = []
+    while pending:
+        try:
+            task_id, result = _result_queue.get(timeout=RESULT_TIMEOUT)
+        except Exception:
+            logger.warning(f"信号worker超时，剩余 {len(pending)} 批代币在主进程中计算")
+            break
+        task = pending.pop(task_id, None)
+        if task is None:
+            # 之前超时的任务，结果已经在主进程中计算过
+            continue
+        if isinstance(result, str):
+            logger.warning(f"信号worker计算失败，在主进程中计算: {result}")
+            result = _compute_in_main(task)
+        if result is not None:
+            results.append(result)
+    for task in pending.values():
+        result = _compute_in_main(task)
+        if result is not None:
+            results.append(result)
+
+    for index, last_times, closes, signals in results:
+        for position, last_time, close, signal in zip(index, last_times, closes, signals):
+            i, token_info, key, version = missed[position]
+            df = pd.DataFrame({
+                'candle_begin_time': [pd.Timestamp(int(last_time), unit='s')],
+                'symbol': [token_info['symbol']],
+                'signal': [signal if signal != 0 else np.nan],
+                'close': [close],
+                'address': [token_info['address']],
+                'pair_address': [token_info.get('pair_address')],
+            })
+            signal_cache.put(key, version, df)
+            frames[i].append(df)
+
+    return [pd.concat(group_frames, ignore_index=True) if group_frames else pd.DataFrame() for group_frames in frames]
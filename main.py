@@ -4,15 +4,23 @@ Dexowl 主程序
 """
 import time
 import traceback
+import pandas as pd
+from datetime import timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
-from config import accounts_info, interval_config, trade_config
+from config import accounts_info, interval_config, trade_config, notify_config
 from utils.commons import sleep_until_run_time, send_wechat_message
 from utils.log_kit import logger, divider
-from utils.datatools import check_data_update_flag
+from utils.datatools import warn_stale_flags
 from hunter.position import active_position_process, active_pool_process, record_positions, create_position_files
 from hunter.trade import order_place
+from hunter.signal_state import save_states
+from hunter.ready_tokens import process_when_ready
+from hunter.signal_workers import stop_workers
+from utils.data_notify import close_listener
+from hunter import signal_cache
+from signals.registry import load_strategies
 
 is_debug = False
 
@@ -33,7 +41,8 @@ def main():
     else:
         run_time = sleep_until_run_time(interval_config['kline_interval'], if_sleep=True, cheat_seconds=random_seconds)
 
-    # 按账户分组执行交易，每个账户对应其链上的交易
+    # 筛选可交易的账户
+    accounts = {}
     for account_id, account_info in accounts_info.items():
         chain_name = account_info['strategy']['chain_name']
         
@@ -41,30 +50,48 @@ def main():
         if chain_name not in tradable_chains:
             logger.warning(f"账户 {account_id} 所在链 {chain_name} 不可交易，跳过")
             continue
-        
-        # 等待该链的K线flag是否就绪
-        if not is_debug:
-            check_data_update_flag(run_time, chain_name)
+        accounts[account_id] = account_info
+    
+    if not is_debug:
+        for chain_name in dict.fromkeys(account_info['strategy']['chain_name'] for account_info in accounts.values()):
+            warn_stale_flags(run_time, chain_name)
+    
+    # step1: 持仓代币的K线就绪后立即处理活跃仓位并卖出，止损、止盈不等待其他代币，卖出结果立即更新到仓位文件
+    sold_tokens = {}
+    
+    def sell(account_id, account_info, cycle_signals):
         logger.info(f"开始处理账户 {account_id} 的仓位")
-        
-        # step1: 处理活跃仓位，获取卖出订单
-        sell_orders_df = active_position_process(account_id, account_info, run_time)
+        sell_orders_df = active_position_process(account_id, account_info, run_time, cycle_signals)
         logger.info(f"活跃仓位处理完成")
-        
-        # step2: 处理活跃池子，获取买入订单
-        buy_orders_df = active_pool_process(account_id, account_info, run_time)
+        order_results = order_place(sell_orders_df, pd.DataFrame(), account_info['strategy']['chain_name'], account_info, account_id)
+        record_positions(order_results, account_id, account_info)
+        # 本周期清仓的代币已经不在活跃仓位中，买入时仍然跳过
+        sold_tokens[account_id] = set(result['address'] for result in order_results if result['status'] == 'Success' and result['signal'] == -1)
+        logger.info(f"账户 {account_id} 卖出完成")
+    
+    position_deadline = run_time + timedelta(seconds=notify_config['position_deadline_seconds'])
+    process_when_ready(accounts, run_time, 'positions', position_deadline, sell, wait=not is_debug)
+    
+    # step2: 可开仓代币的K线就绪后处理活跃池子并买入，然后更新当前仓位和历史仓位
+    def buy(account_id, account_info, cycle_signals):
+        buy_orders_df = active_pool_process(account_id, account_info, run_time, cycle_signals)
         logger.info(f"活跃池子处理完成")
-
-        # step3: 执行下单
-        order_results = order_place(sell_orders_df, buy_orders_df, chain_name, account_info, account_id)
+        sold = sold_tokens.get(account_id)
+        if sold and not buy_orders_df.empty:
+            buy_orders_df = buy_orders_df[~buy_orders_df['address'].isin(sold)]
+        order_results = order_place(pd.DataFrame(), buy_orders_df, account_info['strategy']['chain_name'], account_info, account_id)
         logger.info(f"执行下单完成")
-
-        # step4: 更新当前仓位和历史仓位
         record_positions(order_results, account_id, account_info)
-        logger.info(f"仓位记录完成")
-
         logger.info(f"账户 {account_id} 处理完成")
     
+    pool_deadline = run_time + timedelta(minutes=notify_config['deadline_minutes'])
+    process_when_ready(accounts, run_time, 'pools', pool_deadline, buy, wait=not is_debug)
+    
+    # 保存增量信号的状态，重启后继续使用
+    save_states()
+    cache_stats = signal_cache.get_stats()
+    logger.info(f"信号缓存: 命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次，失效 {cache_stats['invalidations']} 次，当前 {cache_stats['size']} 条")
+    
     # 短暂休息，避免过度占用CPU
     logger.info("休息10秒后进入下一循环")
     time.sleep(10)
@@ -76,11 +103,16 @@ if __name__ == "__main__":
     create_position_files()   
     logger.info("数据目录结构初始化完成")    
     
+    # 加载并校验所有账户的策略
+    load_strategies(accounts_info)
+    
     while True:
         try:
             main()
         except KeyboardInterrupt:
             logger.info("接收到停止信号，交易系统正在停止...")
+            stop_workers()
+            close_listener()
             break  # 添加break确保正常退出
         except Exception as e:
             err_msg = f"主线程异常: {e}\n{traceback.format_exc()}"
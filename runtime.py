@@ -0,0 +1,69 @@
+"""
+Dexowl 单进程运行入口
+数据中心(talons_startup)和交易(main)作为同一进程中的两个线程运行，通过 utils/event_bus.py 在内存中传递数据:
+1. 币池快照直接发布到事件总线，hunter不再读取和解析 active_pool.csv
+2. K线通过共享内存环形缓冲(ohlcv_ring)在进程内读取，数据就绪通知通过事件总线传递，不经过套接字和flag文件
+3. 信号在hunter内计算并直接使用；币池、flag、进度等文件由后台线程异步写入，只用于持久化和重启恢复
+分开运行 talons_startup.py 和 main.py 的方式仍然可用，行为不变
+"""
+import threading
+import traceback
+import warnings
+warnings.filterwarnings('ignore')
+
+from utils import event_bus
+
+# 需要在导入talons和hunter的模块之前开启，之后的读写都经过事件总线
+event_bus.enable()
+
+import talons_startup
+import main as hunter
+from config import accounts_info
+from talons.pools_generator import create_data_files
+from hunter.position import create_position_files
+from hunter.signal_workers import stop_workers
+from signals.registry import load_strategies
+from utils.data_notify import close_listener
+from utils.commons import send_wechat_message
+from utils.log_kit import logger
+
+
+def run_forever(name, step, stop_event):
+    """
+    循环执行一个周期，异常后等待一分钟再重试
+    """
+    while not stop_event.is_set():
+        try:
+            step()
+        except Exception as e:
+            logger.error(f"{name}异常: {e}\n{traceback.format_exc()}")
+            send_wechat_message(f"{name}异常: {e}")
+            stop_event.wait(60)
+
+
+if __name__ == "__main__":
+    logger.info("单进程运行: 数据中心和交易系统启动")
+
+    # 确保数据目录结构
+    create_data_files()
+    create_position_files()
+
+    # 加载并校验所有账户的策略
+    load_strategies(accounts_info)
+
+    stop_event = threading.Event()
+    talons_thread = threading.Thread(target=run_forever, args=('数据中心', talons_startup.main, stop_event), name='talons', daemon=True)
+    talons_thread.start()
+
+    try:
+        run_forever('交易系统', hunter.main, stop_event)
+    except KeyboardInterrupt:
+        logger.info("接收到停止信号，正在停止...")
+    finally:
+        stop_event.set()
+        stop_workers()
+        close_listener()
+        # 等待后台的文件写入完成
+        event_bus.flush(timeout=30)
+
+    logger.info("单进程运行已停止")
@@ -3,8 +3,17 @@
     1代表开仓
     0代表平仓
 '''
+import math
 import numpy as np
 
+from signals.indicators import rolling_mean, rolling_std, rolling_mean_init, rolling_mean_update, rolling_var_init, rolling_var_update, cross_above, cross_below, raw_signals, dedup_signals, to_signal_column
+
+# 增量计算时需要和全量计算核对的指标列
+INDICATOR_COLUMNS = ['middle', 'std', 'upper']
+# 增量状态的格式版本，和已保存的状态不一致时重建
+STATE_VERSION = 2
+
+
 def signal(df, *args):
     """
     :param df: 原始数据
@@ -20,32 +29,91 @@ def signal(df, *args):
     k = args[1]  # 布林带宽度系数
     
     # ===== 计算指标
+    close = df['close'].to_numpy(dtype=np.float64)
     # 计算中轨（简单移动平均线）
-    df['middle'] = df['close'].rolling(n, min_periods=1).mean()
+    middle = rolling_mean(close, n)
     # 计算标准差
-    df['std'] = df['close'].rolling(n, min_periods=1).std(ddof=0)  # ddof=0 表示总体标准差
+    std = rolling_std(close, n, ddof=0)  # ddof=0 表示总体标准差
     # 计算上轨、下轨
-    df['upper'] = df['middle'] + k * df['std']
-    df['lower'] = df['middle'] - k * df['std']
+    upper = middle + k * std
+    df['middle'] = middle
+    df['std'] = std
+    df['upper'] = upper
+    df['lower'] = middle - k * std
 
     # ===== 找出交易信号
-    # === 找出开仓信号
-    condition1 = df['close'] > df['upper']
-    condition2 = df['close'].shift(1) <= df['upper'].shift(1)
-    df.loc[condition1 & condition2, 'signal'] = 1  # 将产生开仓信号的那根K线的signal设置为1，1代表开仓
+    # === 找出开仓信号: 价格上穿上轨
+    buy = cross_above(close, upper)
 
-    # === 找出平仓信号
-    condition1 = df['close'] < df['middle']
-    condition2 = df['close'].shift(1) >= df['middle'].shift(1)
-    df.loc[condition1 & condition2, 'signal'] = -1  # 将产生平仓信号当天的signal设置为-1，-1代表平仓
+    # === 找出平仓信号: 价格下穿中轨
+    sell = cross_below(close, middle)
 
     # ===== 合并信号，去除重复信号
-    # === 去除重复信号
-    temp = df[df['signal'].notnull()][['signal']]  # 筛选signal不为空的数据，并另存一个变量
-    temp = temp[temp['signal'] != temp['signal'].shift(1)]  # 筛选出当前周期与上个周期持仓信号不一致的，即去除重复信号
-    df['signal'] = temp['signal']  # 将处理后的signal覆盖到原始数据的signal列
+    df['signal'] = to_signal_column(dedup_signals(raw_signals(buy, sell)))
 
     # 保留计算指标列，方便调试
     # df.drop(['middle', 'std', 'upper', 'lower'], axis=1, inplace=True)
 
-    return df 
\ No newline at end of file
+    return df
+
+
+def lookback(*args):
+    """
+    :param *args: signal计算的参数
+    
+    :return: 计算最后一根K线的信号需要的K线数量
+    布林带需要n根K线，判断突破还需要前一根K线
+    """
+    n = args[0]
+    return n + 1
+
+
+def init_state(*args):
+    """
+    :param *args: signal计算的参数
+    
+    :return: 增量计算的初始状态，只保留O(window)的数据
+    """
+    n = args[0]
+    return {
+        'mean': rolling_mean_init(n),  # 中轨的滚动窗口和补偿累加和
+        'var': rolling_var_init(n),  # 标准差的滚动窗口和Welford累加值
+        'close': None,  # 上一根K线的收盘价
+        'middle': None,  # 上一根K线的中轨
+        'std': None,
+        'upper': None,  # 上一根K线的上轨
+        'last_raw_signal': None,  # 上一个未去重的信号，用于去除重复信号
+    }
+
+
+def update_state(state, close, *args):
+    """
+    :param state: init_state返回的状态，会被原地更新
+    :param close: 新K线的收盘价
+    :param *args: signal计算的参数
+    
+    :return: 新K线的信号，与signal()最后一行的signal一致，没有信号时返回None
+    """
+    k = args[1]  # 布林带宽度系数
+    # ===== 更新指标，O(1)，和全量计算的累加顺序相同，布林带逐位一致
+    middle = rolling_mean_update(state['mean'], close)
+    std = math.sqrt(rolling_var_update(state['var'], close, ddof=0))  # 总体标准差
+    upper = middle + k * std
+
+    # ===== 找出交易信号
+    raw_signal = None
+    if state['close'] is not None:
+        if close > upper and state['close'] <= state['upper']:
+            raw_signal = 1
+        elif close < middle and state['close'] >= state['middle']:
+            raw_signal = -1
+    state['close'] = close
+    state['middle'] = middle
+    state['std'] = std
+    state['upper'] = upper
+
+    # ===== 去除重复信号
+    if raw_signal is None or raw_signal == state['last_raw_signal']:
+        return None
+    state['last_raw_signal'] = raw_signal
+    return raw_signal
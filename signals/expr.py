@@ -0,0 +1,318 @@
+"""
+表达式策略编译模块
+在config.signal_expressions中用表达式声明开仓和平仓条件，不需要手写pandas代码，例如:
+    'sma_cross': {
+        'params': ['n', 'm'],
+        'entry': 'cross_up(sma(close, n), sma(sma(close, n), m))',
+        'exit': 'cross_down(sma(close, n), sma(sma(close, n), m))',
+    }
+支持的写法:
+    输入: open, high, low, close, volume，以及params中声明的参数名
+    函数: sma(x, n), std(x, n), ema(x, n), shift(x, n), cross_up(a, b), cross_down(a, b)
+    运算: + - * /，比较 > < >= <= == !=，逻辑 and or not (或 & | ~)
+    周期可以是参数的算式，例如 sma(close, n - 1)
+说明:
+1. 表达式在代入参数后编译成执行计划，开仓和平仓条件中相同的子表达式只计算一次，执行计划按 (策略, 参数) 缓存
+2. 指标使用 signals/indicators.py，结果和手写的策略一致: 同一根K线同时满足时以平仓为准，并去除重复信号
+3. 只使用收盘价的表达式同时提供面板计算的实现，和面板上其他策略共用中间指标
+"""
+import ast
+import types
+import numpy as np
+
+from signals import indicators
+
+# 可以使用的K线列
+INPUT_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+# 滚动类函数，key为表达式中的函数名，value为 (中间指标名称, 计算函数)
+# 中间指标名称和面板的indicator一致，面板上可以共用
+ROLLING_FUNCS = {
+    'sma': ('mean', indicators.rolling_mean),
+    'std': ('std', indicators.rolling_std),
+    'ema': ('ema', indicators.ema),
+    'shift': ('shift', indicators.shift),
+}
+CROSS_FUNCS = {
+    'cross_up': indicators.cross_above,
+    'cross_down': indicators.cross_below,
+}
+BIN_OPS = {
+    ast.Add: ('+', np.add),
+    ast.Sub: ('-', np.subtract),
+    ast.Mult: ('*', np.multiply),
+    ast.Div: ('/', np.divide),
+    ast.BitAnd: ('and', np.logical_and),
+    ast.BitOr: ('or', np.logical_or),
+}
+COMPARE_OPS = {
+    ast.Gt: ('>', np.greater),
+    ast.Lt: ('<', np.less),
+    ast.GtE: ('>=', np.greater_equal),
+    ast.LtE: ('<=', np.less_equal),
+    ast.Eq: ('==', np.equal),
+    ast.NotEq: ('!=', np.not_equal),
+}
+# 交换律成立的运算，子表达式排序后作为key，a + b 和 b + a 只计算一次
+COMMUTATIVE = {'+', '*', 'and', 'or', '==', '!='}
+# 所有运算，key为节点中的运算名称
+OPERATORS = {name: func for name, func in list(BIN_OPS.values()) + list(COMPARE_OPS.values())}
+
+# 已编译的执行计划，key为 (策略名称, 参数元组)
+_plans = {}
+
+
+# ============= 编译 =============
+def _compile_node(node, env, steps, text):
+    """
+    把语法树节点编译成执行步骤，返回节点的key
+    key是规范化的元组，相同的子表达式key相同，steps中只出现一次
+    env: 参数名到参数值的映射
+    steps: 执行步骤，{key: (运算, 子节点key...)}，按依赖顺序插入
+    """
+    if isinstance(node, ast.Name):
+        if node.id in INPUT_COLUMNS:
+            key = ('input', node.id)
+            steps.setdefault(key, ('input', node.id))
+            return key
+        if node.id in env:
+            return ('const', env[node.id])
+        raise ValueError(f"表达式 {text} 中的 {node.id} 不是K线列也不是参数")
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return ('const', node.value)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        operand = _compile_node(node.operand, env, steps, text)
+        if operand[0] == 'const':
+            return ('const', -operand[1])
+        return _add_step(('-', ('const', 0), operand), steps)
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.Invert)):
+        operand = _compile_node(node.operand, env, steps, text)
+        return _add_step(('not', operand), steps)
+
+    if isinstance(node, ast.BinOp) and type(node.op) in BIN_OPS:
+        left = _compile_node(node.left, env, steps, text)
+        right = _compile_node(node.right, env, steps, text)
+        name, func = BIN_OPS[type(node.op)]
+        # 参数之间的运算直接计算，例如 sma(close, n - 1) 的周期
+        if left[0] == 'const' and right[0] == 'const' and name in ('+', '-', '*', '/'):
+            return ('const', func(left[1], right[1]).item())
+        return _add_step((name, left, right), steps)
+
+    if isinstance(node, ast.BoolOp):
+        op = 'and' if isinstance(node.op, ast.And) else 'or'
+        key = _compile_node(node.values[0], env, steps, text)
+        for value in node.values[1:]:
+            key = _add_step((op, key, _compile_node(value, env, steps, text)), steps)
+        return key
+
+    if isinstance(node, ast.Compare):
+        # a < b < c 拆成 (a < b) and (b < c)
+        key = None
+        left = _compile_node(node.left, env, steps, text)
+        for op, comparator in zip(node.ops, node.comparators):
+            if type(op) not in COMPARE_OPS:
+                raise ValueError(f"表达式 {text} 中不支持的比较运算")
+            right = _compile_node(comparator, env, steps, text)
+            compare = _add_step((COMPARE_OPS[type(op)][0], left, right), steps)
+            key = compare if key is None else _add_step(('and', key, compare), steps)
+            left = right
+        return key
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        name = node.func.id
+        args = [_compile_node(arg, env, steps, text) for arg in node.args]
+        if node.keywords or len(args) != 2:
+            raise ValueError(f"表达式 {text} 中 {name}() 需要两个参数")
+        if name in ROLLING_FUNCS:
+            window = args[1]
+            if window[0] != 'const' or int(window[1]) != window[1] or window[1] < (0 if name == 'shift' else 1):
+                raise ValueError(f"表达式 {text} 中 {name}() 的周期需要是正整数: {window}")
+            return _add_step((ROLLING_FUNCS[name][0], args[0], int(window[1])), steps)
+        if name in CROSS_FUNCS:
+            return _add_step((name, args[0], args[1]), steps)
+        raise ValueError(f"表达式 {text} 中不支持的函数 {name}()")
+
+    raise ValueError(f"表达式 {text} 中不支持的写法: {ast.dump(node)}")
+
+
+def _add_step(key, steps):
+    """
+    加入执行步骤，交换律成立的运算先规范化子节点顺序
+    """
+    if key[0] in COMMUTATIVE:
+        key = (key[0],) + tuple(sorted(key[1:], key=repr))
+    steps.setdefault(key, key)
+    return key
+
+
+def compile_plan(spec, params):
+    """
+    代入参数，把开仓和平仓条件编译成一个执行计划
+    spec: signal_expressions中的策略声明
+    params: 策略参数
+    Returns: 字典，steps为按依赖顺序排列的步骤key，entry/exit为条件的key，inputs为用到的K线列
+    """
+    names = spec.get('params', [])
+    if len(names) != len(params):
+        raise ValueError(f"表达式策略需要参数 {names}，实际为 {list(params)}")
+    env = dict(zip(names, params))
+
+    steps = {}
+    outputs = {}
+    for rule in ('entry', 'exit'):
+        text = spec[rule]
+        outputs[rule] = _compile_node(ast.parse(text, mode='eval').body, env, steps, text)
+    inputs = sorted(key[1] for key in steps if key[0] == 'input')
+    return {'steps': list(steps), 'entry': outputs['entry'], 'exit': outputs['exit'], 'inputs': inputs}
+
+
+def get_plan(signal_name, spec, params):
+    """
+    获取已编译的执行计划，每组参数只编译一次
+    """
+    key = (signal_name, tuple(params))
+    if key not in _plans:
+        _plans[key] = compile_plan(spec, params)
+    return _plans[key]
+
+
+# ============= 执行 =============
+def _value(key, values):
+    """
+    取出节点的值，常数直接返回
+    """
+    return key[1] if key[0] == 'const' else values[key]
+
+
+def _node_key(key):
+    """
+    表达式节点对应的面板中间指标key: 收盘价为'close'，滚动类指标为 (指标, 输入, 周期)
+    """
+    if key == ('input', 'close'):
+        return 'close'
+    if key[0] in ('mean', 'std', 'ema', 'shift'):
+        return (key[0], _node_key(key[1]), key[2])
+    return key
+
+
+def execute_plan(plan, columns, nodes=None):
+    """
+    执行计划，计算未去重的信号
+    plan: compile_plan的结果
+    columns: K线列名到数组的映射，一维或 代币 × K线 的二维数组
+    nodes: 已计算的中间指标，面板计算时传入面板的nodes，和其他策略共用，会被原地更新
+    Returns: 未去重的信号数组
+    """
+    nodes = {} if nodes is None else nodes
+    values = {}
+    rolling = {name: func for name, func in ROLLING_FUNCS.values()}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for key in plan['steps']:
+            node_key = _node_key(key)
+            if node_key in nodes:
+                values[key] = nodes[node_key]
+                continue
+            op = key[0]
+            if op == 'input':
+                result = np.asarray(columns[key[1]], dtype=np.float64)
+            elif op in rolling:
+                result = rolling[op](_value(key[1], values), key[2])
+            elif op in CROSS_FUNCS:
+                result = CROSS_FUNCS[op](_value(key[1], values), _value(key[2], values))
+            elif op == 'not':
+                result = np.logical_not(_value(key[1], values))
+            else:
+                result = OPERATORS[op](_value(key[1], values), _value(key[2], values))
+            values[key] = result
+            if op in rolling:
+                nodes[node_key] = result
+
+    shape = np.shape(columns[plan['inputs'][0]]) if plan['inputs'] else np.shape(next(iter(columns.values())))
+    entry = np.broadcast_to(_value(plan['entry'], values), shape).astype(bool)
+    exit_ = np.broadcast_to(_value(plan['exit'], values), shape).astype(bool)
+    return indicators.raw_signals(entry, exit_)
+
+
+def plan_lookback(plan):
+    """
+    计算最后一根K线的信号需要的K线数量
+    sma/std需要n-1根之前的K线，shift需要n根，交叉需要前一根K线
+    ema按10倍周期计算，更早的K线权重小于1e-8
+    """
+    depth = {}
+    for key in plan['steps']:
+        op = key[0]
+        children = [depth.get(child, 0) for child in key[1:] if isinstance(child, tuple) and child[0] != 'const']
+        base = max(children, default=0)
+        if op in ('mean', 'std'):
+            depth[key] = base + key[2] - 1
+        elif op == 'ema':
+            depth[key] = base + key[2] * 10
+        elif op == 'shift':
+            depth[key] = base + key[2]
+        elif op in CROSS_FUNCS:
+            depth[key] = base + 1
+        else:
+            depth[key] = base
+    return max(depth.get(plan['entry'], 0), depth.get(plan['exit'], 0)) + 1
+
+
+# ============= 策略 =============
+def expression_inputs(spec):
+    """
+    开仓和平仓条件中用到的K线列，只解析表达式，不代入参数
+    """
+    names = set()
+    for rule in ('entry', 'exit'):
+        for node in ast.walk(ast.parse(spec[rule], mode='eval')):
+            if isinstance(node, ast.Name) and node.id in INPUT_COLUMNS:
+                names.add(node.id)
+    return names
+
+
+def build_strategy(signal_name, spec):
+    """
+    根据表达式声明生成策略，和signals目录下的策略模块有相同的接口
+    signal_name: 策略名称
+    spec: signal_expressions中的策略声明
+    Returns: 带有signal、lookback函数的策略对象，只使用收盘价时还带有panel_kernel
+    """
+    for rule in ('entry', 'exit'):
+        if not isinstance(spec.get(rule), str):
+            raise ValueError(f"表达式策略 {signal_name} 缺少 {rule} 条件")
+
+    def signal(df, *args):
+        """
+        全量计算信号，新增signal列，1开仓，-1平仓，无信号为NaN
+        """
+        plan = get_plan(signal_name, spec, args)
+        columns = {col: df[col].to_numpy(dtype=np.float64) for col in plan['inputs']}
+        if not columns:
+            columns = {'close': df['close'].to_numpy(dtype=np.float64)}
+        df['signal'] = indicators.to_signal_column(indicators.dedup_signals(execute_plan(plan, columns)))
+        return df
+
+    def lookback(*args):
+        """
+        计算最后一根K线的信号需要的K线数量
+        """
+        return plan_lookback(get_plan(signal_name, spec, args))
+
+    strategy = types.SimpleNamespace(__name__=f'signals.expr.{signal_name}', signal=signal, lookback=lookback, spec=spec)
+    if spec.get('timeframe'):
+        strategy.TIMEFRAME = spec['timeframe']
+
+    # 只使用收盘价时可以在面板上计算
+    if expression_inputs(spec) == {'close'}:
+        def panel_kernel(panel, *args):
+            """
+            面板计算，中间指标和面板上的其他策略共用
+            """
+            plan = get_plan(signal_name, spec, args)
+            return execute_plan(plan, {'close': panel['close']}, panel['nodes'])
+        strategy.panel_kernel = panel_kernel
+
+    return strategy
+
@@ -0,0 +1,532 @@
+"""
+指标计算库
+策略共用的滚动均值、标准差、EMA、交叉和去除重复信号，直接处理NumPy数组，避免pandas在短序列上的调用开销
+说明:
+1. 所有函数沿最后一维计算，支持一维(单个代币)和二维(代币 × K线)数组，NaN视为缺失值，和pandas一样跳过
+2. 安装了numba时使用JIT编译的循环实现，算法和pandas的rolling/ewm一致(含Kahan补偿、窗口内全部相同值直接取该值)；
+   没有numba时滚动均值和标准差使用pandas的滚动窗口(每个代币一列)，其他使用NumPy向量化实现，两种方式的结果都和pandas逐位一致
+3. 信号数组使用int8，1开仓，-1平仓，0无信号，to_signal_column转换为策略输出的signal列
+4. rolling_mean_update/rolling_var_update逐个加入数值，运算顺序和循环实现相同，结果和pandas逐位一致，用于策略的增量计算
+5. tests/test_indicators.py 核对和pandas实现的一致性
+"""
+import math
+import numpy as np
+import pandas as pd
+from collections import deque
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """
+        没有numba时原样返回函数
+        """
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# ============= 循环实现(numba) =============
+@njit(cache=True)
+def _rolling_mean_loop(values, n):
+    """
+    单个序列的滚动均值，和pandas的roll_mean一致
+    """
+    size = len(values)
+    out = np.empty(size)
+    nobs = 0
+    neg_ct = 0
+    sum_x = 0.0
+    compensation_add = 0.0
+    compensation_remove = 0.0
+    same = 0
+    prev_value = np.nan
+    for i in range(size):
+        if i == 0 or n == 1:
+            # 第一个窗口，重新累计
+            nobs = 0
+            neg_ct = 0
+            sum_x = 0.0
+            compensation_add = 0.0
+            compensation_remove = 0.0
+            same = 0
+            prev_value = values[max(i - n + 1, 0)]
+        elif i >= n:
+            # 移出窗口的值
+            val = values[i - n]
+            if val == val:
+                nobs -= 1
+                y = -val - compensation_remove
+                t = sum_x + y
+                compensation_remove = t - sum_x - y
+                sum_x = t
+                if val < 0:
+                    neg_ct -= 1
+        # 加入窗口的值
+        val = values[i]
+        if val == val:
+            nobs += 1
+            y = val - compensation_add
+            t = sum_x + y
+            compensation_add = t - sum_x - y
+            sum_x = t
+            if val < 0:
+                neg_ct += 1
+            if val == prev_value:
+                same += 1
+            else:
+                same = 1
+            prev_value = val
+
+        if nobs > 0:
+            if same >= nobs:
+                out[i] = prev_value
+            else:
+                result = sum_x / nobs
+                if neg_ct == 0 and result < 0:
+                    result = 0.0
+                elif neg_ct == nobs and result > 0:
+                    result = 0.0
+                out[i] = result
+        else:
+            out[i] = np.nan
+    return out
+
+
+@njit(cache=True)
+def _rolling_var_loop(values, n, ddof):
+    """
+    单个序列的滚动方差，和pandas的roll_var一致(Welford算法)
+    """
+    size = len(values)
+    out = np.empty(size)
+    nobs = 0
+    mean_x = 0.0
+    ssqdm_x = 0.0
+    compensation_add = 0.0
+    compensation_remove = 0.0
+    same = 0
+    prev_value = np.nan
+    for i in range(size):
+        if i == 0 or n == 1:
+            nobs = 0
+            mean_x = 0.0
+            ssqdm_x = 0.0
+            compensation_add = 0.0
+            compensation_remove = 0.0
+            same = 0
+            prev_value = values[max(i - n + 1, 0)]
+        elif i >= n:
+            # 移出窗口的值
+            val = values[i - n]
+            if val == val:
+                nobs -= 1
+                if nobs:
+                    prev_mean = mean_x - compensation_remove
+                    y = val - compensation_remove
+                    t = y - mean_x
+                    compensation_remove = t + mean_x - y
+                    mean_x = mean_x - t / nobs
+                    ssqdm_x = ssqdm_x - (val - prev_mean) * (val - mean_x)
+                else:
+                    mean_x = 0.0
+                    ssqdm_x = 0.0
+        # 加入窗口的值
+        val = values[i]
+        if val == val:
+            if val == prev_value:
+                same += 1
+            else:
+                same = 1
+            prev_value = val
+            nobs += 1
+            prev_mean = mean_x - compensation_add
+            y = val - compensation_add
+            t = y - mean_x
+            compensation_add = t + mean_x - y
+            mean_x = mean_x + t / nobs
+            ssqdm_x = ssqdm_x + (val - prev_mean) * (val - mean_x)
+
+        if nobs > ddof:
+            if nobs == 1 or same >= nobs:
+                out[i] = 0.0
+            else:
+                out[i] = max(ssqdm_x / (nobs - ddof), 0.0)
+        else:
+            out[i] = np.nan
+    return out
+
+
+@njit(cache=True)
+def _ema_loop(values, alpha, adjust):
+    """
+    单个序列的指数移动平均，和pandas的ewm(alpha=alpha, adjust=adjust).mean()一致
+    """
+    size = len(values)
+    out = np.empty(size)
+    if size == 0:
+        return out
+    old_wt_factor = 1.0 - alpha
+    new_wt = 1.0 if adjust else alpha
+    weighted = values[0]
+    nobs = 1 if weighted == weighted else 0
+    out[0] = weighted if nobs >= 1 else np.nan
+    old_wt = 1.0
+    for i in range(1, size):
+        cur = values[i]
+        is_observation = cur == cur
+        if is_observation:
+            nobs += 1
+        if weighted == weighted:
+            old_wt *= old_wt_factor
+            if is_observation:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + new_wt * cur) / (old_wt + new_wt)
+                if adjust:
+                    old_wt += new_wt
+                else:
+                    old_wt = 1.0
+        elif is_observation:
+            weighted = cur
+        out[i] = weighted if nobs >= 1 else np.nan
+    return out
+
+
+@njit(cache=True)
+def _dedup_loop(raw):
+    """
+    单个序列去除重复信号
+    """
+    out = np.zeros(len(raw), dtype=np.int8)
+    previous = 0
+    for i in range(len(raw)):
+        if raw[i] != 0:
+            if raw[i] != previous:
+                out[i] = raw[i]
+            previous = raw[i]
+    return out
+
+
+@njit(cache=True)
+def _rolling_mean_rows(values, n):
+    out = np.empty(values.shape)
+    for row in range(values.shape[0]):
+        out[row] = _rolling_mean_loop(values[row], n)
+    return out
+
+
+@njit(cache=True)
+def _rolling_var_rows(values, n, ddof):
+    out = np.empty(values.shape)
+    for row in range(values.shape[0]):
+        out[row] = _rolling_var_loop(values[row], n, ddof)
+    return out
+
+
+@njit(cache=True)
+def _ema_rows(values, alpha, adjust):
+    out = np.empty(values.shape)
+    for row in range(values.shape[0]):
+        out[row] = _ema_loop(values[row], alpha, adjust)
+    return out
+
+
+@njit(cache=True)
+def _dedup_rows(raw):
+    out = np.empty(raw.shape, dtype=np.int8)
+    for row in range(raw.shape[0]):
+        out[row] = _dedup_loop(raw[row])
+    return out
+
+
+# ============= 向量化实现(NumPy) =============
+def _rolling_mean_pandas(values, n):
+    """
+    没有numba时使用pandas的滚动窗口，每个代币一列，结果和pandas逐位一致
+    """
+    return pd.DataFrame(values.T).rolling(n, min_periods=1).mean().to_numpy().T
+
+
+def _rolling_var_pandas(values, n, ddof):
+    return pd.DataFrame(values.T).rolling(n, min_periods=1).var(ddof=ddof).to_numpy().T
+
+
+def _ema_numpy(values, alpha, adjust):
+    """
+    沿时间逐列递推，每一步对所有代币向量化计算
+    """
+    values = values.reshape(-1, values.shape[-1])
+    out = np.empty(values.shape)
+    if values.shape[-1] == 0:
+        return out
+    new_wt = 1.0 if adjust else alpha
+    weighted = values[:, 0].copy()
+    nobs = (~np.isnan(weighted)).astype(np.int64)
+    old_wt = np.ones(len(weighted))
+    out[:, 0] = weighted
+    for i in range(1, values.shape[-1]):
+        cur = values[:, i]
+        is_observation = ~np.isnan(cur)
+        nobs += is_observation
+        started = ~np.isnan(weighted)
+        old_wt = np.where(started, old_wt * (1.0 - alpha), old_wt)
+        update = started & is_observation & (weighted != cur)
+        weighted = np.where(update, (old_wt * weighted + new_wt * cur) / (old_wt + new_wt), weighted)
+        if adjust:
+            old_wt = np.where(started & is_observation, old_wt + new_wt, old_wt)
+        else:
+            old_wt = np.where(started & is_observation, 1.0, old_wt)
+        weighted = np.where(~started & is_observation, cur, weighted)
+        out[:, i] = np.where(nobs >= 1, weighted, np.nan)
+    return out
+
+
+def _dedup_numpy(raw):
+    index = np.broadcast_to(np.arange(raw.shape[-1]), raw.shape)
+    # 每个位置之前最近一个非0信号
+    last_index = np.maximum.accumulate(np.where(raw != 0, index, -1), axis=-1)
+    prev_index = np.full(raw.shape, -1)
+    prev_index[..., 1:] = last_index[..., :-1]
+    previous = np.where(prev_index >= 0, np.take_along_axis(raw, np.maximum(prev_index, 0), axis=-1), 0)
+    return np.where((raw != 0) & (raw != previous), raw, 0).astype(np.int8)
+
+
+# ============= 增量实现 =============
+def rolling_mean_init(n):
+    """
+    滚动均值的增量状态，和_rolling_mean_loop的循环变量相同
+    """
+    return {'n': n, 'values': deque(maxlen=n), 'nobs': 0, 'neg_ct': 0, 'sum_x': 0.0,
+            'compensation_add': 0.0, 'compensation_remove': 0.0, 'same': 0, 'prev_value': math.nan}
+
+
+def rolling_mean_update(state, value):
+    """
+    加入一个数值，返回新的滚动均值，和rolling_mean最后一个值逐位一致
+    state: rolling_mean_init返回的状态，会被原地更新
+    """
+    values = state['values']
+    if state['n'] == 1:
+        # 每个窗口重新累计
+        state.update(nobs=0, neg_ct=0, sum_x=0.0, compensation_add=0.0, compensation_remove=0.0, same=0, prev_value=value)
+    elif len(values) == state['n']:
+        # 移出窗口的值
+        val = values[0]
+        if val == val:
+            state['nobs'] -= 1
+            y = -val - state['compensation_remove']
+            t = state['sum_x'] + y
+            state['compensation_remove'] = t - state['sum_x'] - y
+            state['sum_x'] = t
+            if val < 0:
+                state['neg_ct'] -= 1
+    values.append(value)
+    # 加入窗口的值
+    val = value
+    if val == val:
+        state['nobs'] += 1
+        y = val - state['compensation_add']
+        t = state['sum_x'] + y
+        state['compensation_add'] = t - state['sum_x'] - y
+        state['sum_x'] = t
+        if val < 0:
+            state['neg_ct'] += 1
+        state['same'] = state['same'] + 1 if val == state['prev_value'] else 1
+        state['prev_value'] = val
+
+    nobs = state['nobs']
+    if nobs == 0:
+        return math.nan
+    if state['same'] >= nobs:
+        return state['prev_value']
+    result = state['sum_x'] / nobs
+    if state['neg_ct'] == 0 and result < 0:
+        result = 0.0
+    elif state['neg_ct'] == nobs and result > 0:
+        result = 0.0
+    return result
+
+
+def rolling_var_init(n):
+    """
+    滚动方差的增量状态，和_rolling_var_loop的循环变量相同
+    """
+    return {'n': n, 'values': deque(maxlen=n), 'nobs': 0, 'mean_x': 0.0, 'ssqdm_x': 0.0,
+            'compensation_add': 0.0, 'compensation_remove': 0.0, 'same': 0, 'prev_value': math.nan}
+
+
+def rolling_var_update(state, value, ddof=0):
+    """
+    加入一个数值，返回新的滚动方差，和rolling_std最后一个值的平方逐位一致
+    state: rolling_var_init返回的状态，会被原地更新
+    """
+    values = state['values']
+    if state['n'] == 1:
+        state.update(nobs=0, mean_x=0.0, ssqdm_x=0.0, compensation_add=0.0, compensation_remove=0.0, same=0, prev_value=value)
+    elif len(values) == state['n']:
+        # 移出窗口的值
+        val = values[0]
+        if val == val:
+            state['nobs'] -= 1
+            if state['nobs']:
+                mean_x = state['mean_x']
+                prev_mean = mean_x - state['compensation_remove']
+                y = val - state['compensation_remove']
+                t = y - mean_x
+                state['compensation_remove'] = t + mean_x - y
+                mean_x = mean_x - t / state['nobs']
+                state['mean_x'] = mean_x
+                state['ssqdm_x'] = state['ssqdm_x'] - (val - prev_mean) * (val - mean_x)
+            else:
+                state['mean_x'] = 0.0
+                state['ssqdm_x'] = 0.0
+    values.append(value)
+    # 加入窗口的值
+    val = value
+    if val == val:
+        state['same'] = state['same'] + 1 if val == state['prev_value'] else 1
+        state['prev_value'] = val
+        state['nobs'] += 1
+        mean_x = state['mean_x']
+        prev_mean = mean_x - state['compensation_add']
+        y = val - state['compensation_add']
+        t = y - mean_x
+        state['compensation_add'] = t + mean_x - y
+        mean_x = mean_x + t / state['nobs']
+        state['mean_x'] = mean_x
+        state['ssqdm_x'] = state['ssqdm_x'] + (val - prev_mean) * (val - mean_x)
+
+    nobs = state['nobs']
+    if nobs <= ddof:
+        return math.nan
+    if nobs == 1 or state['same'] >= nobs:
+        return 0.0
+    return max(state['ssqdm_x'] / (nobs - ddof), 0.0)
+
+
+# ============= 对外接口 =============
+def _as_rows(values, dtype=np.float64):
+    """
+    转换为二维连续数组，返回 (二维数组, 原始形状)
+    """
+    values = np.ascontiguousarray(values, dtype=dtype)
+    return values.reshape(-1, values.shape[-1]) if values.ndim else values.reshape(1, 1), values.shape
+
+
+def rolling_mean(values, n):
+    """
+    滚动均值，等价于 rolling(n, min_periods=1).mean()
+    """
+    rows, shape = _as_rows(values)
+    if NUMBA_AVAILABLE:
+        return _rolling_mean_rows(rows, n).reshape(shape)
+    return _rolling_mean_pandas(rows, n).reshape(shape)
+
+
+def rolling_std(values, n, ddof=0):
+    """
+    滚动标准差，等价于 rolling(n, min_periods=1).std(ddof=ddof)
+    """
+    rows, shape = _as_rows(values)
+    if NUMBA_AVAILABLE:
+        var = _rolling_var_rows(rows, n, ddof)
+    else:
+        var = _rolling_var_pandas(rows, n, ddof)
+    return np.sqrt(var).reshape(shape)
+
+
+def ema(values, span, adjust=False):
+    """
+    指数移动平均，等价于 ewm(span=span, adjust=adjust).mean()
+    """
+    alpha = 2.0 / (span + 1.0)
+    rows, shape = _as_rows(values)
+    if NUMBA_AVAILABLE:
+        return _ema_rows(rows, alpha, adjust).reshape(shape)
+    return _ema_numpy(rows, alpha, adjust).reshape(shape)
+
+
+def shift(values, periods=1):
+    """
+    沿K线方向后移，前面补NaN，等价于 shift(periods)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    shifted = np.full(values.shape, np.nan)
+    if periods < values.shape[-1]:
+        shifted[..., periods:] = values[..., :values.shape[-1] - periods]
+    return shifted
+
+
+def cross_above(a, b):
+    """
+    a上穿b: 当前 a > b，上一根K线 a <= b
+    a, b: 数组或标量
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.broadcast_to(np.asarray(b, dtype=np.float64), a.shape)
+    return (a > b) & (shift(a) <= shift(b))
+
+
+def cross_below(a, b):
+    """
+    a下穿b: 当前 a < b，上一根K线 a >= b
+    a, b: 数组或标量
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.broadcast_to(np.asarray(b, dtype=np.float64), a.shape)
+    return (a < b) & (shift(a) >= shift(b))
+
+
+def raw_signals(buy, sell):
+    """
+    合并开仓和平仓条件，同时满足时以平仓为准，和策略中先写1再写-1的顺序一致
+    Returns: 未去重的信号数组
+    """
+    return np.where(sell, -1, np.where(buy, 1, 0)).astype(np.int8)
+
+
+def dedup_signals(raw):
+    """
+    去除重复信号，只保留和上一个信号不同的信号
+    raw: 未去重的信号数组
+    """
+    rows, shape = _as_rows(raw, dtype=np.int8)
+    if NUMBA_AVAILABLE:
+        return _dedup_rows(rows).reshape(shape)
+    return _dedup_numpy(rows).reshape(shape)
+
+
+def dedup_last(raw):
+    """
+    去除重复信号，只返回最后一根K线的结果，比dedup_signals少算前面的K线
+    raw: 未去重的信号数组
+    """
+    raw = np.asarray(raw, dtype=np.int8)
+    index = np.where(raw[..., :-1] != 0, np.arange(raw.shape[-1] - 1), -1)
+    last_index = index.max(axis=-1, initial=-1)
+    previous = np.where(last_index >= 0, np.take_along_axis(raw, np.maximum(last_index, 0)[..., None], axis=-1)[..., 0], 0)
+    last = raw[..., -1]
+    return np.where((last != 0) & (last != previous), last, 0).astype(np.int8)
+
+
+def last_signal_settled(signals, bars):
+    """
+    只用尾部窗口计算时，窗口内去重后最后一根K线的信号是否和全部历史去重的结果一致
+    signals: 窗口内去重后的信号数组，0为无信号
+    bars: 策略的回看K线数量，窗口内第bars-1根及之后的信号和全部历史计算的一致
+    Returns: 最后一根K线之前有有效信号，或者窗口内没有任何信号时为True
+    """
+    signals = np.asarray(signals)
+    before = signals[..., :-1] != 0
+    return before[..., max(bars - 1, 0):].any(axis=-1) | (~before.any(axis=-1) & (signals[..., -1] == 0))
+
+
+def to_signal_column(signals):
+    """
+    转换为策略输出的signal列，无信号为NaN
+    """
+    return np.where(signals != 0, signals, np.nan)
+
@@ -0,0 +1,82 @@
+"""
+策略注册模块
+启动时加载并校验所有账户用到的策略，计算信号时不再为每个代币重复导入
+策略模块需要实现:
+    signal(df, *args): 全量计算信号
+    lookback(*args): 计算最后一根K线的信号最少需要的K线数量，读取K线时只读取这么多
+可选实现:
+    init_state(*args) 和 update_state(state, close, *args): 增量计算，需要同时实现
+    TIMEFRAME: 策略使用的K线周期，例如 '1h'，需要是基础周期的整数倍，由基础K线在本地重采样，不声明时使用基础周期
+说明:
+    只读取尾部K线时，窗口内不能确定去除重复信号的结果会扩大窗口，和全部历史计算的信号一致(见hunter/signal_window.py)
+    config.signal_expressions中声明的表达式策略优先于同名的策略模块，由signals/expr.py编译
+"""
+import importlib
+
+from config import signal_expressions, interval_config
+from utils.log_kit import logger
+from signals.expr import build_strategy
+from utils.ohlcv_resample import check_timeframe
+
+# 已加载的策略，key为策略名称
+_strategies = {}
+
+
+def load_strategy(signal_name):
+    """
+    加载并校验单个策略模块
+    signal_name: 策略名称，对应signals目录下的文件名或signal_expressions中的名称
+    """
+    if signal_name in _strategies:
+        return _strategies[signal_name]
+
+    if signal_name in signal_expressions:
+        module = build_strategy(signal_name, signal_expressions[signal_name])
+    else:
+        module = importlib.import_module(f'signals.{signal_name}')
+    for func_name in ('signal', 'lookback'):
+        if not callable(getattr(module, func_name, None)):
+            raise ValueError(f"策略 {signal_name} 缺少 {func_name}() 函数")
+    if hasattr(module, 'init_state') != hasattr(module, 'update_state'):
+        raise ValueError(f"策略 {signal_name} 的 init_state() 和 update_state() 需要同时实现")
+    if getattr(module, 'TIMEFRAME', None):
+        check_timeframe(module.TIMEFRAME)
+
+    _strategies[signal_name] = module
+    return module
+
+
+def load_strategies(accounts_info):
+    """
+    启动时加载所有账户用到的策略，并校验参数
+    accounts_info: 所有账户信息的字典
+    """
+    for account_id, account_info in accounts_info.items():
+        signal_name, params = account_info['strategy']['signal_timing']
+        module = load_strategy(signal_name)
+        bars = module.lookback(*params)
+        if not isinstance(bars, int) or bars <= 0:
+            raise ValueError(f"账户 {account_id} 的策略 {signal_name}{params} 回看K线数量无效: {bars}")
+        logger.ok(f"账户 {account_id} 加载策略 {signal_name}{params}，需要 {bars} 根 {get_timeframe(signal_name)} K线")
+    return _strategies
+
+
+def get_strategy(signal_name):
+    """
+    获取已加载的策略模块，没有加载时先加载
+    """
+    return _strategies.get(signal_name) or load_strategy(signal_name)
+
+
+def get_timeframe(signal_name):
+    """
+    获取策略使用的K线周期，没有声明时为基础周期
+    """
+    return getattr(get_strategy(signal_name), 'TIMEFRAME', None) or interval_config['kline_interval']
+
+
+def get_lookback(signal_name, params):
+    """
+    获取策略需要的K线数量
+    """
+    return get_strategy(signal_name).lookback(*params)
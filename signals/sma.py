@@ -3,6 +3,16 @@
     1代表开仓
     0代表平仓
 '''
+import numpy as np
+
+from signals.indicators import rolling_mean, rolling_mean_init, rolling_mean_update, cross_above, cross_below, raw_signals, dedup_signals, to_signal_column
+
+# 增量计算时需要和全量计算核对的指标列
+INDICATOR_COLUMNS = ['ma_short', 'ma_long']
+# 增量状态的格式版本，和已保存的状态不一致时重建
+STATE_VERSION = 2
+
+
 def signal(df, *args):
     """
     :param df: 原始数据
@@ -18,27 +28,81 @@ def signal(df, *args):
     m = args[1]
     # ===== 计算指标
     # 计算短线
-    df['ma_short'] = df['close'].rolling(n,min_periods=1).mean()
-    df['ma_long'] = df['ma_short'].rolling(m,min_periods=1).mean()
+    close = df['close'].to_numpy(dtype=np.float64)
+    ma_short = rolling_mean(close, n)
+    ma_long = rolling_mean(ma_short, m)
+    df['ma_short'] = ma_short
+    df['ma_long'] = ma_long
 
     # ===== 找出交易信号
-    # === 找出开仓信号
-    condition1 = df['ma_short'] > df['ma_long']
-    condition2 = df['ma_short'].shift(1) <= df['ma_long'].shift(1)  
-    df.loc[condition1 & condition2, 'signal'] = 1  # 将产生开仓信号的那根K线的signal设置为1，1代表开仓
+    # === 找出开仓信号: 短线上穿长线
+    buy = cross_above(ma_short, ma_long)
 
-    # === 找出做多平仓信号
-    condition1 = df['ma_short'] < df['ma_long']
-    condition2 = df['ma_short'].shift(1) >= df['ma_long'].shift(1)
-    df.loc[condition1 & condition2, 'signal'] = -1  # 将产生平仓信号当天的signal设置为-1，-1代表平仓
+    # === 找出做多平仓信号: 短线下穿长线
+    sell = cross_below(ma_short, ma_long)
 
     # ===== 合并做多做空信号，去除重复信号
-    # === 去除重复信号
-    temp = df[df['signal'].notnull()][['signal']]  # 筛选siganla不为空的数据，并另存一个变量
-    temp = temp[temp['signal'] != temp['signal'].shift(1)]  # 筛选出当前周期与上个周期持仓信号不一致的，即去除重复信号
-    df['signal'] = temp['signal']  # 将处理后的signal覆盖到原始数据的signal列
+    df['signal'] = to_signal_column(dedup_signals(raw_signals(buy, sell)))
 
     # ===== 删除无关变量
     # df.drop(['ma_short','ma_long'], axis=1, inplace=True)  # 删除ma_short、ma_long列
 
-    return df
\ No newline at end of file
+    return df
+
+
+def lookback(*args):
+    """
+    :param *args: signal计算的参数
+    
+    :return: 计算最后一根K线的信号需要的K线数量
+    长线需要n+m-1根K线，判断交叉还需要前一根K线
+    """
+    n = args[0]
+    m = args[1]
+    return n + m
+
+
+def init_state(*args):
+    """
+    :param *args: signal计算的参数
+    
+    :return: 增量计算的初始状态，只保留O(window)的数据
+    """
+    n = args[0]
+    m = args[1]
+    return {
+        'short': rolling_mean_init(n),  # 短线的滚动窗口和补偿累加和
+        'long': rolling_mean_init(m),  # 长线的滚动窗口和补偿累加和
+        'ma_short': None,  # 上一根K线的短线
+        'ma_long': None,  # 上一根K线的长线
+        'last_raw_signal': None,  # 上一个未去重的信号，用于去除重复信号
+    }
+
+
+def update_state(state, close, *args):
+    """
+    :param state: init_state返回的状态，会被原地更新
+    :param close: 新K线的收盘价
+    :param *args: signal计算的参数
+    
+    :return: 新K线的信号，与signal()最后一行的signal一致，没有信号时返回None
+    """
+    # ===== 更新指标，O(1)，和全量计算的累加顺序相同，均线逐位一致
+    ma_short = rolling_mean_update(state['short'], close)
+    ma_long = rolling_mean_update(state['long'], ma_short)
+
+    # ===== 找出交易信号
+    raw_signal = None
+    if state['ma_short'] is not None:
+        if ma_short > ma_long and state['ma_short'] <= state['ma_long']:
+            raw_signal = 1
+        elif ma_short < ma_long and state['ma_short'] >= state['ma_long']:
+            raw_signal = -1
+    state['ma_short'] = ma_short
+    state['ma_long'] = ma_long
+
+    # ===== 去除重复信号
+    if raw_signal is None or raw_signal == state['last_raw_signal']:
+        return None
+    state['last_raw_signal'] = raw_signal
+    return raw_signal
@@ -0,0 +1,123 @@
+"""
+K线获取计划模块
+根据交易对已存储的K线和已知没有K线的区间，计算当前周期缺少的K线，生成最少的 time_start/time_end/count 请求
+说明:
+1. 检查窗口为 [max(第一根K线, 当前K线 - (backfill_count-1)个周期), 当前K线]，窗口内每个周期都应该有K线
+2. 已有K线的时间优先从共享内存读取，覆盖不了窗口时再读取K线存储的最后几个分区
+3. 上次获取时还没有收盘的K线(开始时间 + 周期 > fetched_at)需要重新获取，没有fetched_at时重新获取最后一根
+4. 请求过但接口没有返回、并且收盘已经超过settle_count个周期的周期记录到meta.json的empty_ranges，之后不再请求；
+   刚收盘的周期接口可能还没有收录，下次获取时重新请求
+5. 缺少的周期合并成连续区间，只隔着已知没有K线的周期的区间合并成一个请求，credit只花在没有的K线上
+6. 没有K线存储的新代币仍然从当前时间向前获取kline_min_count根K线
+"""
+import time
+import numpy as np
+
+from config import interval_config, kline_fetch_config
+from clients.cmc_client import interval_to_seconds
+from utils import kline_store, ohlcv_ring
+
+
+def current_slot(interval_seconds, now=None):
+    """
+    当前(还没有收盘的)K线的开始时间，epoch秒
+    """
+    now = time.time() if now is None else now
+    return int(now // interval_seconds * interval_seconds)
+
+
+def _stored_times(store_dir, since):
+    """
+    窗口内已有K线的开始时间，共享内存覆盖窗口时不读取K线存储
+    """
+    window = ohlcv_ring.read_ring(store_dir)
+    if window is not None and len(window) and window['candle_begin_time'][0] <= since:
+        times = window['candle_begin_time'].astype(np.int64)
+        return times[times >= since]
+    return kline_store.read_times(store_dir, since)
+
+
+def _in_ranges(slots, ranges):
+    """
+    判断每个周期是否落在 [[start, end], ...] 区间内
+    """
+    mask = np.zeros(len(slots), dtype=bool)
+    for start, end in ranges:
+        mask |= (slots >= start) & (slots <= end)
+    return mask
+
+
+def _runs(slots, mask, interval_seconds):
+    """
+    把mask为True的连续周期合并成 [[start, end], ...]
+    """
+    selected = slots[mask]
+    if not len(selected):
+        return []
+    breaks = np.flatnonzero(np.diff(selected) != interval_seconds) + 1
+    return [[int(run[0]), int(run[-1])] for run in np.split(selected, breaks)]
+
+
+def plan_fetch(store_dir, interval=None, now=None):
+    """
+    计算交易对缺少的K线区间
+    store_dir: 交易对的K线存储目录
+    interval: K线周期，默认 interval_config['kline_interval']
+    now: 当前时间，epoch秒
+    Returns: [(time_start, time_end), ...] epoch秒的闭区间，没有缺少的K线时为空列表；没有K线存储时返回None
+    """
+    interval_seconds = interval_to_seconds(interval or interval_config['kline_interval'])
+    meta = kline_store.load_meta(store_dir)
+    if 'last_time' not in meta:
+        return None
+
+    end = current_slot(interval_seconds, now)
+    since = max(int(meta['first_time']), end - (kline_fetch_config['backfill_count'] - 1) * interval_seconds)
+    # 对齐到周期
+    since = end - (end - since) // interval_seconds * interval_seconds
+    slots = np.arange(since, end + 1, interval_seconds, dtype=np.int64)
+
+    stored = np.isin(slots, _stored_times(store_dir, since))
+    empty = _in_ranges(slots, meta.get('empty_ranges', []))
+    fetched_at = meta.get('fetched_at', meta['last_time'])
+    unclosed = slots + interval_seconds > fetched_at
+    missing = (~stored & ~empty) | (stored & unclosed)
+
+    # 已知没有K线的周期不会返回数据，两边的缺口合并成一个请求
+    ranges = []
+    for start, stop in _runs(slots, missing | (empty & ~stored), interval_seconds):
+        inside = missing & (slots >= start) & (slots <= stop)
+        if inside.any():
+            ranges.append((int(slots[inside][0]), int(slots[inside][-1])))
+    return ranges
+
+
+def record_fetch(store_dir, ranges, times, fetched_at, interval=None):
+    """
+    记录本次获取的结果: 请求过但没有返回、收盘超过settle_count个周期的周期写入empty_ranges，并记录获取时间
+    store_dir: 交易对的K线存储目录
+    ranges: 本次请求的区间，None表示从当前时间向前获取
+    times: 本次返回的K线开始时间
+    fetched_at: 发出请求的时间，epoch秒
+    """
+    interval_seconds = interval_to_seconds(interval or interval_config['kline_interval'])
+    meta = kline_store.load_meta(store_dir)
+    if 'last_time' not in meta:
+        return
+
+    times = np.asarray(times, dtype=np.int64)
+    end = current_slot(interval_seconds, fetched_at)
+    if ranges is None:
+        # 向前获取时，最早返回的K线之后到当前的周期都请求过
+        ranges = [(int(times.min()), end)] if len(times) else []
+
+    since = end - (kline_fetch_config['backfill_count'] - 1) * interval_seconds
+    slots = np.arange(since, end + 1, interval_seconds, dtype=np.int64)
+    requested = _in_ranges(slots, ranges)
+    # 接口收录K线有延迟，刚收盘的周期没有返回时不能确定没有K线
+    settled = slots + (1 + kline_fetch_config['settle_count']) * interval_seconds <= fetched_at
+    empty = _in_ranges(slots, meta.get('empty_ranges', [])) | (requested & settled & ~np.isin(slots, times))
+    kline_store.update_meta(store_dir, {
+        'empty_ranges': _runs(slots, empty, interval_seconds),
+        'fetched_at': int(fetched_at),
+    })
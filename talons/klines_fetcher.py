@@ -2,12 +2,15 @@
 K线获取模块
 用于获取和更新K线数据
 问题记录
-1. 获取K线数据时，如果K线文件存在，但是最后一根K线距离当前时间太长，导致需要更新的K线非常多，就使用获取所有K线的方式
+1. 已有K线存储的代币由fetch_planner计算缺少的区间，只请求没有的K线；上次更新太久以前的缺口只补齐最近backfill_count根
 2. 有些代币的名称是非法文件字符，用replace_special_characters()函数处理，替换成"-"
 """
 import os
+import time
+import asyncio
+import threading
+import numpy as np
 import pandas as pd
-import concurrent.futures
 import traceback
 from datetime import datetime
 from pathlib import Path
@@ -16,13 +19,33 @@ from config import cmc_api_keys
 import warnings
 warnings.filterwarnings('ignore')
 
-from config import root_path, interval_config, kline_min_count, klines_path, accounts_info
-from clients.cmc_client import CMCClient
+from config import root_path, interval_config, kline_min_count, klines_path, accounts_info, pair_index_config, kline_fetch_config, quote_candle_config
+from clients.cmc_client import CMCClient, pair_liquidity
 from utils.log_kit import logger
 from utils.commons import replace_special_characters
+from utils.datatools import load_active_pool, save_active_pool
+from utils import kline_store, ohlcv_ring, pair_index, data_notify
+from talons import fetch_planner, quote_candles
+
+# CMC客户端，第一次使用时才创建(会启动事件循环线程、共享速率限制和用量账本)，
+# 导入本模块的signal worker子进程(spawn会重新导入runtime.py)不会创建
+cmc_client = None
+_cmc_client_lock = threading.Lock()
+# 每条链上次批量获取交易对的时间
+prefetch_times = {}
+# 报价采样的交易对，{链名称: {交易对地址: K线存储目录}}
+quote_targets = {}
+
+def get_cmc_client():
+    """
+    获取CMC客户端，进程内只创建一次
+    """
+    global cmc_client
+    with _cmc_client_lock:
+        if cmc_client is None:
+            cmc_client = CMCClient(cmc_api_keys)
+    return cmc_client
 
-# 创建CMC客户端
-cmc_client = CMCClient(cmc_api_keys)
 
 def collect_tokens_from_files(chain_name: str, account_id: str) -> pd.DataFrame:
     """
@@ -39,12 +62,11 @@ def collect_tokens_from_files(chain_name: str, account_id: str) -> pd.DataFrame:
     
     tokens_df = pd.DataFrame()
     
-    # 读取active_pool.csv
-    if active_pool_path.exists():
+    # 读取active_pool.csv，单进程运行时直接使用内存中的快照
+    pool_df = load_active_pool(account_id)
+    if pool_df is not None:
         # 检查文件是否为空
-        if os.path.getsize(active_pool_path) > 0:
-            pool_df = pd.read_csv(active_pool_path)
-            
+        if not pool_df.columns.empty:
             if not pool_df.empty:
                 # 选择需要的列
                 if all(col in pool_df.columns for col in ['chain', 'address', 'symbol', 'pair_address']):
@@ -90,71 +112,144 @@ def collect_tokens_from_files(chain_name: str, account_id: str) -> pd.DataFrame:
     
     return tokens_df
 
-def get_pair_address(token_address: str, chain_name: str) -> str:
+def prefetch_pair_addresses(chain_name: str, addresses: List[str]) -> Dict[str, Dict]:
     """
-    获取代币的pair_address
+    按流动性从高到低分页获取链上的交易对，建立 代币地址→流动性最大的交易对 的映射
+    代币作为base资产的交易对优先，没有时再使用作为quote资产的交易对，和get_pair_address_largest_liquidity一致
+    所有作为base资产出现的代币都写入交易对索引，之后新出现的代币也可以直接命中
+    同一条链在prefetch_minutes内只获取一次
     
-    token_address: 代币地址
     chain_name: 链名称
+    addresses: 缺少交易对的代币地址
         
-    Returns: pair_address，如果获取失败则返回None
+    Returns: {代币地址: 交易对索引的记录}，只包含命中的代币
     """
-    # 使用CMC客户端获取最大流动性的交易对
-    pair_address, pair_name, liquidity, total_credit_count = cmc_client.get_pair_address_largest_liquidity(
-        network_slug=chain_name,
-        token_address=token_address
-    )
+    pages = pair_index_config['prefetch_pages']
+    last_time = prefetch_times.get(chain_name)
+    if not pages or (last_time and (datetime.utcnow() - last_time).total_seconds() < pair_index_config['prefetch_minutes'] * 60):
+        return {}
+    prefetch_times[chain_name] = datetime.utcnow()
     
-    if pair_address:
-        logger.ok(f"{token_address} 获取到交易对: {pair_name} - {pair_address}, 流动性: {liquidity}, credit_count: {total_credit_count}")
-        return pair_address
-    else:
-        logger.warning(f"未找到{token_address}的交易对, credit_count: {total_credit_count}")
-        return None
+    pairs, total_credit_count = get_cmc_client().get_top_liquidity_pairs(chain_name, pages=pages, limit=pair_index_config['prefetch_page_size'])
+    pairs = sorted(pairs, key=pair_liquidity, reverse=True)
+    
+    candidates = set(addresses)
+    best = {}
+    for side in ('base_asset_contract_address', 'quote_asset_contract_address'):
+        for pair in pairs:
+            address = pair.get(side)
+            if not address or address in best:
+                continue
+            # quote资产一般是SOL、USDC等，只记录需要的代币
+            if side == 'quote_asset_contract_address' and address not in candidates:
+                continue
+            best[address] = {
+                'address': address,
+                'pair_address': pair['contract_address'],
+                'pair_name': pair.get('name'),
+                'liquidity': pair_liquidity(pair),
+            }
+    pair_index.put_many(chain_name, list(best.values()))
+    
+    hits = {address: best[address] for address in candidates if address in best}
+    logger.info(f"{chain_name} 批量获取到{len(pairs)}个交易对, 命中{len(hits)}/{len(candidates)}个代币, credit_count: {total_credit_count}")
+    return hits
+
+
+async def fetch_pair_addresses_async(chain_name: str, addresses: List[str]) -> list:
+    """
+    同时获取多个代币流动性最大的交易对
+    Returns: 与addresses顺序对应的 (pair_address, pair_name, liquidity, credit_count) 或异常
+    """
+    tasks = [
+        get_cmc_client().async_client.get_pair_address_largest_liquidity(network_slug=chain_name, token_address=address)
+        for address in addresses
+    ]
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def fetch_pair_addresses(chain_name: str, addresses: List[str]) -> List[Dict]:
+    """
+    通过CMC逐个获取代币流动性最大的交易对，所有请求一批同时发出
+    
+    chain_name: 链名称
+    addresses: 代币地址列表
         
+    Returns: 交易对索引的记录列表，字段为 address, pair_address, pair_name, liquidity，没有找到时pair_address为None
+             获取失败的代币不在结果中
+    """
+    records = []
+    results = get_cmc_client().run(fetch_pair_addresses_async(chain_name, addresses))
+    for token_address, result in zip(addresses, results):
+        if isinstance(result, Exception):
+            logger.error(f"获取{token_address}的交易对失败: {result}")
+            continue
+        pair_address, pair_name, liquidity, total_credit_count = result
+        if pair_address:
+            logger.ok(f"{token_address} 获取到交易对: {pair_name} - {pair_address}, 流动性: {liquidity}, credit_count: {total_credit_count}")
+        else:
+            logger.warning(f"未找到{token_address}的交易对, credit_count: {total_credit_count}")
+        records.append({'address': token_address, 'pair_address': pair_address, 'pair_name': pair_name, 'liquidity': liquidity})
+    return records
 
 
 def update_active_pool_pair_address(chain_name: str, account_id: str, active_pool_df: pd.DataFrame) -> pd.DataFrame:
     """
     更新active_pool.csv文件中的pair_address字段
+    1. 批量查询交易对索引
+    2. 索引中没有的代币，按流动性分页获取链上的交易对，命中的直接使用
+    3. 仍然没有的代币通过CMC逐个获取(一批同时发出)，结果(包括没有找到的)写入索引，每个代币只花费一次credit
     
     chain_name: 链名称
     account_id: 账户ID
     active_pool_df: 包含代币信息的DataFrame
     Returns: 更新后的DataFrame
     """
-    # 更新缺少pair_address的记录
-    update_count = 0
     updated_df = active_pool_df.copy()
+    missing = updated_df['pair_address'].isna() | (updated_df['pair_address'] == '')
+    if not missing.any():
+        return updated_df
     
-    for idx, row in active_pool_df.iterrows():
-        if pd.isna(row['pair_address']) or not row['pair_address']:
-            pair_address = get_pair_address(row['address'], chain_name)
-            
-            if pair_address:
-                updated_df.loc[idx, 'pair_address'] = pair_address
-                update_count += 1
+    addresses = list(dict.fromkeys(updated_df.loc[missing, 'address']))
+    address_to_pair = pair_index.get_many(chain_name, addresses)
+    
+    unresolved = [address for address in addresses if address not in address_to_pair]
+    if unresolved:
+        for address, record in prefetch_pair_addresses(chain_name, unresolved).items():
+            address_to_pair[address] = record['pair_address']
+        unresolved = [address for address in unresolved if address not in address_to_pair]
+    if unresolved:
+        records = fetch_pair_addresses(chain_name, unresolved)
+        pair_index.put_many(chain_name, records)
+        for record in records:
+            address_to_pair[record['address']] = record['pair_address']
+    
+    # 更新缺少pair_address的记录
+    pairs = updated_df.loc[missing, 'address'].map(address_to_pair)
+    pairs = pairs[pairs.notna()]
+    update_count = len(pairs)
+    updated_df.loc[pairs.index, 'pair_address'] = pairs
     
     # 保存更新后的文件
     if update_count > 0:
-        active_pool_path = root_path / 'data_feed' / f'{account_id}' / 'active_pool.csv'
-        updated_df.to_csv(active_pool_path, index=False)
+        save_active_pool(account_id, updated_df)
     
     return updated_df
 
-def download_klines(token_data: Dict, chain_name: str, klines_dir: Path) -> bool:
+
+def prepare_download(token_data: Dict, chain_name: str, klines_dir: Path):
     """
-    下载单个代币的K线数据
+    准备单个代币的K线下载参数
     说明：
-    1. 如果K线文件存在，则从K线文件中获取最后一条K线的开始时间
-    2. 但是如果K线存在，最后一根K线距离时间太长，根据最小获取K线数量重现获取。
-    3. 如果K线文件不存在，则获取最小K线数量
+    1. 如果K线存储存在，由fetch_planner根据已有的K线和已知没有K线的区间计算缺少的区间，每个区间一个请求
+    2. 如果K线存储不存在，则从当前时间向前获取最小K线数量
 
     token_data: 代币数据
     chain_name: 链名称
     klines_dir: K线保存目录
         
-    Returns: 是否成功下载
+    Returns: (K线存储目录, 缺少的区间, fetch_kline_records的参数列表)，缺少的区间为None表示向前获取，
+             没有pair_address时返回None
     """
     token_address = token_data['address']
     token_symbol = token_data['symbol']
@@ -162,86 +257,135 @@ def download_klines(token_data: Dict, chain_name: str, klines_dir: Path) -> bool
     
     if not pair_address or pd.isna(pair_address):
         logger.warning(f"代币{token_symbol} ({token_address})没有pair_address，跳过")
-        return False
+        return None
     
-    # K线文件路径，处理特殊字符
+    # K线存储目录，处理特殊字符
     token_symbol = replace_special_characters(token_symbol)
-    kline_file = klines_dir / f"{str(token_symbol)}_{str(token_address)}.csv"
-    if kline_file.exists():
-        klines_orign = pd.read_csv(kline_file)
-        if not klines_orign.empty:
-            start_time = klines_orign['candle_begin_time'].values[-1]
-            
-            # 判断是否需要获取所有K线
-            # 计算当前时间与start_time的差值
-            current_time = datetime.utcnow()
-            start_datetime = pd.to_datetime(start_time)
-            time_diff = current_time - start_datetime
-            
-            # 解析interval_config['kline_interval']
-            interval = interval_config['kline_interval']
-            minutes_per_interval = 0
-            if interval.endswith('m'):
-                minutes_per_interval = int(interval[:-1])
-            elif interval.endswith('h'):
-                minutes_per_interval = int(interval[:-1]) * 60
-            
-            # 计算需要更新的K线数量
-            intervals_diff = time_diff.total_seconds() / (minutes_per_interval * 60)
-            
-            if intervals_diff > kline_min_count:
-                # 如果更新K线的代币, 他上次更新已经很久了，导致需要更新的K线非常多，就使用获取所有K线
-                logger.info(f"{token_symbol}上次更新时间为{start_time}，需要更新的K线数量({intervals_diff:.0f})超过最小K线获取数量({kline_min_count})，使用最少获取K线的方式")
-                klines_df, total_credit_count = cmc_client.fetch_klines_df(
-                    chain=chain_name,
-                    contract_address=pair_address,
-                    interval=interval_config['kline_interval'],
-                    min_count=kline_min_count
-                )
-            else:
-                # 只获取最新K线数据
-                klines_df, total_credit_count = cmc_client.fetch_klines_df(
-                    chain=chain_name,
-                    contract_address=pair_address,
-                    interval=interval_config['kline_interval'],
-                    limit=50,
-                    min_count=kline_min_count,
-                    time_start=start_time
-                )
-            
-            klines_df = pd.concat([klines_orign, klines_df]) # 合并K线数据
-            klines_df.drop_duplicates(subset=['candle_begin_time'], inplace=True) # 去重
-            klines_df.sort_values(by='candle_begin_time', inplace=True) # 排序
-            klines_df.reset_index(drop=True, inplace=True) # 重置索引
-    else:
-        # 获取K线数据
-        klines_df, total_credit_count = cmc_client.fetch_klines_df(
-            chain=chain_name,
-            contract_address=pair_address,
-            interval=interval_config['kline_interval'],
-            min_count=kline_min_count
-        )
-    
-    if klines_df is None or klines_df.empty:
-        logger.warning(f"未获取到{token_symbol}的K线数据, credit_count: {total_credit_count}")
-        return False
+    store_dir = klines_dir / f"{str(token_symbol)}_{str(token_address)}"
+    # 旧版CSV只导入一次
+    kline_store.migrate_legacy_csv(store_dir)
+    
+    base_kwargs = {
+        'chain': chain_name,
+        'contract_address': pair_address,
+        'interval': interval_config['kline_interval'],
+        'raise_errors': True,
+    }
+    # 开启报价采样时，当前周期由报价合成
+    ranges = quote_candles.plan_fetch(store_dir) if quote_candle_config['enabled'] else fetch_planner.plan_fetch(store_dir)
+    if ranges is None:
+        return store_dir, None, [{**base_kwargs, 'min_count': kline_min_count}]
+    
+    fetch_list = [
+        {**base_kwargs, 'time_start': time_start, 'time_end': time_end, 'limit': kline_fetch_config['page_limit']}
+        for time_start, time_end in ranges
+    ]
+    return store_dir, ranges, fetch_list
+
+
+def save_klines(token_data: Dict, store_dir: Path, ranges, results: list, fetched_at: float) -> bool:
+    """
+    保存下载的K线数据，有类型的K线数组直接写入存储和共享内存，不再构建DataFrame
+    所有区间都获取成功时，记录没有K线的区间和获取时间
+    
+    ranges: 请求的区间，None表示向前获取
+    results: 每个请求的 (K线数组, 交易对信息, credit_count) 或异常
+    fetched_at: 发出请求的时间，epoch秒
+    Returns: 是否成功下载
+    """
+    token_symbol = replace_special_characters(token_data['symbol'])
+    pages = []
+    info = None
+    total_credit_count = 0
+    failed = False
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"获取{token_symbol}的K线失败: {result}")
+            failed = True
+            continue
+        records, page_info, credit_count = result
+        total_credit_count += credit_count
+        if len(records):
+            pages.append(records)
+            info = page_info
     
-    # 保存K线数据
-    klines_df.to_csv(kline_file, index=False)
-    logger.ok(f"获取到k线 - {token_symbol} : {token_address} - pair: {pair_address} - credit_count: {total_credit_count}")
+    records = np.concatenate(pages) if pages else None
+    if records is not None:
+        # 保存K线数据，只合并最后的分区
+        kline_store.write_records(store_dir, records, info)
+        # 发布到共享内存，供hunter直接读取
+        ohlcv_ring.publish_records(store_dir, np.sort(records, order='candle_begin_time'))
+    if not failed:
+        fetch_planner.record_fetch(store_dir, ranges, [] if records is None else records['candle_begin_time'], fetched_at)
     
-    return True
+    if records is None:
+        if not failed:
+            logger.warning(f"未获取到{token_symbol}的K线数据, credit_count: {total_credit_count}")
+        return False
+    logger.ok(f"获取到k线 - {token_symbol} : {token_data['address']} - pair: {token_data['pair_address']} - {len(records)}根 - credit_count: {total_credit_count}")
+    return not failed
+
+
+def download_klines(token_data: Dict, chain_name: str, klines_dir: Path) -> bool:
+    """
+    下载单个代币的K线数据
     
+    token_data: 代币数据
+    chain_name: 链名称
+    klines_dir: K线保存目录
+        
+    Returns: 是否成功下载，没有缺少的K线时也返回True
+    """
+    prepared = prepare_download(token_data, chain_name, klines_dir)
+    if prepared is None:
+        return False
+    store_dir, ranges, fetch_list = prepared
+    if not fetch_list:
+        return True
+    fetched_at = time.time()
+    results = []
+    for fetch_kwargs in fetch_list:
+        try:
+            results.append(get_cmc_client().fetch_kline_records(**fetch_kwargs))
+        except Exception as e:
+            results.append(e)
+    return save_klines(token_data, store_dir, ranges, results, fetched_at)
+
+
+async def download_klines_async(token_data: Dict, chain_name: str, klines_dir: Path) -> bool:
+    """
+    异步下载单个代币的K线数据，在CMC客户端的事件循环中运行，多个缺少的区间同时请求
+    读写K线存储、元数据、共享内存和旧版CSV都是阻塞的文件操作，在线程池中执行，不阻塞事件循环中其他代币的请求
+    """
+    prepared = await asyncio.to_thread(prepare_download, token_data, chain_name, klines_dir)
+    if prepared is None:
+        return False
+    store_dir, ranges, fetch_list = prepared
+    if not fetch_list:
+        return True
+    fetched_at = time.time()
+    tasks = [get_cmc_client().async_client.fetch_kline_records(**fetch_kwargs) for fetch_kwargs in fetch_list]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return await asyncio.to_thread(save_klines, token_data, store_dir, ranges, results, fetched_at)
 
 
-def update_klines_for_chain(chain_name: str, account_ids: List[str], parallel: bool = True, max_workers: int = 3) -> int:
+async def download_all_klines(tokens: pd.DataFrame, chain_name: str, klines_dir: Path) -> list:
+    """
+    同时下载所有代币的K线，请求数量由CMC客户端的速率限制和max_in_flight控制
+    
+    Returns: 每个代币的结果，成功为True，失败为False或异常
+    """
+    tasks = [download_klines_async(token, chain_name, klines_dir) for _, token in tokens.iterrows()]
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def update_klines_for_chain(chain_name: str, account_ids: List[str], parallel: bool = True) -> int:
     """
     更新指定链上所有账户的K线数据
     
     chain_name: 链名称
     account_ids: 账户ID列表
-    parallel: 是否并行处理
-    max_workers: 最大工作线程数
+    parallel: 是否并发下载，并发时所有代币的请求同时发出，由CMC客户端的速率限制控制
         
     Returns: 成功更新的代币数量
     """
@@ -259,9 +403,8 @@ def update_klines_for_chain(chain_name: str, account_ids: List[str], parallel: b
         tokens_df = collect_tokens_from_files(chain_name, account_id)
         
         # 更新active_pool中缺少pair_address的记录
-        active_pool_path = root_path / 'data_feed' / f'{account_id}' / 'active_pool.csv'
-        if active_pool_path.exists():
-            active_pool_df = pd.read_csv(active_pool_path)
+        active_pool_df = load_active_pool(account_id)
+        if active_pool_df is not None and not active_pool_df.empty:
             # 更新CSV文件中的pair_address并获取更新后的DataFrame
             updated_pool_df = update_active_pool_pair_address(chain_name, account_id, active_pool_df)
             
@@ -296,35 +439,25 @@ def update_klines_for_chain(chain_name: str, account_ids: List[str], parallel: b
         logger.warning(f"未收集到任何有效代币，无法获取K线")
         return 0
     
+    # 已经有K线的交易对在下次更新前由报价采样合成K线
+    quote_targets[chain_name] = {
+        token['pair_address']: kline_store.get_store_dir(chain_name, token['symbol'], token['address'])
+        for _, token in all_tokens.iterrows()
+    }
+    
     # 下载K线数据
     updated_count = 0
     
     if parallel and len(all_tokens) > 1:
-        # 并行下载
-        logger.info(f"使用并行模式下载K线数据，最大线程数: {max_workers}")
-        results = []
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_idx = {
-                executor.submit(
-                    download_klines,
-                    token,
-                    chain_name,
-                    klines_dir
-                ): idx for idx, token in all_tokens.iterrows()
-            }
-            
-            for future in concurrent.futures.as_completed(future_to_idx):
-                idx = future_to_idx[future]
-                try:
-                    success = future.result()
-                    if success:
-                        updated_count += 1
-                    results.append(success)
-                except Exception as e:
-                    logger.error(f"处理代币索引{idx}时发生异常: {e}")
-                    logger.error(traceback.format_exc())
-                    results.append(False)
+        # 并发下载
+        logger.info(f"使用并发模式下载K线数据，共{len(all_tokens)}个代币")
+        results = get_cmc_client().run(download_all_klines(all_tokens, chain_name, klines_dir))
+        for idx, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.error(f"处理代币索引{idx}时发生异常: {result}")
+                logger.error(''.join(traceback.format_exception(result)))
+            elif result:
+                updated_count += 1
     else:
         # 顺序下载
         logger.info(f"使用顺序模式下载K线数据")
@@ -335,26 +468,72 @@ def update_klines_for_chain(chain_name: str, account_ids: List[str], parallel: b
     
     return updated_count
 
-def create_flag(flag_dir: Path, run_time: datetime) -> None:
+async def sample_quotes_async(chain_name: str, pair_addresses: List[str]):
     """
-    创建更新标志文件
+    批量获取交易对的最新报价，每batch_size个交易对一个请求，所有请求同时发出
+    
+    Returns: ({交易对地址: (价格, 24小时成交量)}, 总credit_count)
+    """
+    batch_size = quote_candle_config['batch_size']
+    tasks = [
+        get_cmc_client().async_client.get_pair_quotes(chain_name, pair_addresses[start:start + batch_size], convert_id='2781')
+        for start in range(0, len(pair_addresses), batch_size)
+    ]
+    quotes = {}
+    total_credit_count = 0
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.error(f"{chain_name} 获取交易对报价失败: {result}")
+            continue
+        result, api_credit_consumed = result
+        total_credit_count += api_credit_consumed
+        quotes.update(quote_candles.parse_pair_quotes(result))
+    return quotes, total_credit_count
+
+
+def sample_quotes_until(run_time: datetime) -> None:
+    """
+    在run_time之前按sample_seconds采样报价合成K线，到达run_time时收盘上一周期的K线
+    
+    run_time: 下次K线更新的时间
+    """
+    deadline = run_time.timestamp()
+    logger.info(f"报价采样K线，{sum(len(targets) for targets in quote_targets.values())}个交易对，直到{run_time}")
+    while time.time() < deadline:
+        started = time.time()
+        for chain_name, targets in quote_targets.items():
+            if not targets:
+                continue
+            try:
+                quotes, total_credit_count = get_cmc_client().run(sample_quotes_async(chain_name, list(targets)))
+            except Exception as e:
+                logger.error(f"{chain_name} 报价采样失败: {e}")
+                continue
+            now = time.time()
+            quote_candles.save_bars(quote_candles.update_bars(targets, quotes, now), now)
+            logger.debug(f"{chain_name} 采样到{len(quotes)}/{len(targets)}个交易对的报价, credit_count: {total_credit_count}")
+        time.sleep(max(min(quote_candle_config['sample_seconds'] - (time.time() - started), deadline - time.time()), 0))
+    quote_candles.save_bars(quote_candles.close_bars(deadline), deadline)
+
+
+def create_flag(flag_dir: Path, run_time: datetime, tokens: List[str] = None) -> None:
+    """
+    创建更新标志文件，并通知hunter数据已就绪
     
     flag_dir: 标志文件目录
     run_time: 更新时间
+    tokens: 本周期更新成功的代币地址，None表示没有统计
     """
-    # 添加更新标志
-    flag_file = flag_dir / f"{run_time.strftime('%Y-%m-%d_%H_%M')}.flag"
-    
-    with open(flag_file, 'w', encoding='utf-8') as f:
-        f.write('更新完成')
-        f.close()
+    # 添加更新标志，内容为代币清单
+    data_notify.publish(flag_dir, flag_dir.parent.name, run_time, tokens)
     
-    # 清除旧的标志文件，只保留最新的100个
-    all_flags = sorted(flag_dir.glob("*.flag"), key=os.path.getmtime, reverse=True)
-    if len(all_flags) > 100:
-        logger.info(f"清理旧的flag文件，删除{len(all_flags)-100}个")
-        for old_flag in all_flags[100:]:
-            old_flag.unlink()
+    # 清除旧的标志文件和代币就绪文件，只保留最新的100个
+    for pattern in ("*.flag", "*.ready"):
+        all_flags = sorted(flag_dir.glob(pattern), key=os.path.getmtime, reverse=True)
+        if len(all_flags) > 100:
+            logger.info(f"清理旧的{pattern[2:]}文件，删除{len(all_flags)-100}个")
+            for old_flag in all_flags[100:]:
+                old_flag.unlink()
 
 
 def group_accounts_by_chain(accounts_info: Dict) -> Dict[str, List[str]]:
@@ -370,13 +549,12 @@ def group_accounts_by_chain(accounts_info: Dict) -> Dict[str, List[str]]:
     return chain_accounts
 
 # ====================入口函数======================
-def update_all_klines(run_time, parallel = False, max_workers = 3) -> Dict[str, int]:
+def update_all_klines(run_time, parallel = False) -> Dict[str, int]:
     """
     更新所有链和账户的K线数据
     
     run_time: 更新时间
     parallel: 是否使用并发模式
-    max_workers: 并发模式下的最大工作线程数
         
     Returns: 每条链更新的代币数量的字典
     """
@@ -386,7 +564,7 @@ def update_all_klines(run_time, parallel = False, max_workers = 3) -> Dict[str,
     # 更新每条链的K线
     results = {}
     for chain_name, account_ids in chain_accounts.items():
-        updated_count = update_klines_for_chain(chain_name, account_ids, parallel=parallel, max_workers=max_workers)
+        updated_count = update_klines_for_chain(chain_name, account_ids, parallel=parallel)
         # 创建更新完成标志文件
         flag_chain_path = klines_path / chain_name / 'flags'
         create_flag(flag_chain_path, run_time)
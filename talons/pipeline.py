@@ -0,0 +1,244 @@
+"""
+talons流水线模块
+币池获取 → 交易对解析 → K线获取 → 发布完成标志 四个阶段同时运行，阶段之间用有界队列连接
+说明:
+1. 每个账户的币池更新完就进入交易对解析，不等其他账户
+2. 已经有pair_address的代币直接进入所在链的K线获取，缺少的代币解析完成后再进入
+3. 每条链一个K线获取线程，同时运行；K线请求提交到CMC客户端的事件循环后立即处理下一个代币，
+   每条链按chain_weights分到速率限制的份额和queue_size中同时下载的数量，一条链的代币再多也不会挤占其他链
+4. 一条链的所有账户都已解析、所有代币的K线都已完成时立即创建这条链的完成标志并推送通知(utils/data_notify.py)，
+   通知中带有更新成功的代币清单，不等其他链
+5. 每个代币的K线保存后立即推送代币就绪的通知，hunter可以先处理已经就绪的代币
+6. 每条链的进度写入 flags/progress.json，hunter等待时可以查看各条链的进度
+7. 同一周期内同一条链的代币只下载一次；历史池子在所有链完成后再更新，不在关键路径上
+8. 某个阶段异常时仍然发出结束标记，下游阶段不会一直等待
+"""
+import os
+import json
+import time
+import queue
+import threading
+import traceback
+import pandas as pd
+
+from config import accounts_info, klines_path, pipeline_config
+from utils.log_kit import logger
+from utils import kline_store, data_notify, event_bus
+from utils.datatools import load_active_pool
+from clients.cmc_client import run_with_budget
+from talons import pools_generator, klines_fetcher
+
+# 队列结束标记
+_DONE = None
+
+
+def _pool_stage(resolve_queue):
+    """
+    逐个账户更新币池，更新完的账户立即交给交易对解析
+    """
+    try:
+        for index, (account_id, account_info) in enumerate(accounts_info.items()):
+            if index:
+                # 避免请求频率过高
+                time.sleep(pipeline_config['pool_interval'])
+            chain_name = account_info['strategy']['chain_name']
+            try:
+                pools_count = pools_generator.update_active_pools({**account_info, 'account_id': account_id})
+                if pools_count:
+                    logger.info(f"账户 {account_id} 成功更新 {pools_count} 个币池")
+                else:
+                    logger.warning(f"账户 {account_id} 未能更新币池数据")
+            except Exception as e:
+                # 币池更新失败时仍然更新持仓和旧币池的K线
+                logger.error(f"账户 {account_id} 更新币池失败: {e}")
+                logger.error(traceback.format_exc())
+            resolve_queue.put((chain_name, account_id))
+    finally:
+        resolve_queue.put(_DONE)
+
+
+def _resolve_stage(chain_accounts, resolve_queue, kline_queues):
+    """
+    收集账户的代币，有pair_address的代币直接交给所在链的K线获取，缺少的代币解析后再交给K线获取
+    一条链的所有账户都处理完后发出这条链的结束标记
+    """
+    remaining = {chain_name: len(account_ids) for chain_name, account_ids in chain_accounts.items()}
+    try:
+        while (item := resolve_queue.get()) is not _DONE:
+            chain_name, account_id = item
+            kline_queue = kline_queues[chain_name]
+            try:
+                tokens_df = klines_fetcher.collect_tokens_from_files(chain_name, account_id)
+                if not tokens_df.empty:
+                    has_pair = tokens_df['pair_address'].notna() & (tokens_df['pair_address'] != '')
+                    for token in tokens_df[has_pair].to_dict(orient='records'):
+                        kline_queue.put(token)
+
+                    missing = tokens_df[~has_pair]
+                    pool_df = load_active_pool(account_id)
+                    if not missing.empty and pool_df is not None and not pool_df.empty:
+                        updated_pool_df = klines_fetcher.update_active_pool_pair_address(chain_name, account_id, pool_df)
+                        address_to_pair = dict(zip(updated_pool_df['address'], updated_pool_df['pair_address']))
+                        skipped = 0
+                        for token in missing.to_dict(orient='records'):
+                            pair_address = address_to_pair.get(token['address'])
+                            if not pair_address or pd.isna(pair_address):
+                                skipped += 1
+                                continue
+                            kline_queue.put({**token, 'pair_address': pair_address})
+                        if skipped:
+                            logger.warning(f"账户{account_id}跳过{skipped}个没有pair_address的代币")
+            except Exception as e:
+                logger.error(f"账户 {account_id} 解析交易对失败: {e}")
+                logger.error(traceback.format_exc())
+            remaining[chain_name] -= 1
+            if remaining[chain_name] == 0:
+                kline_queue.put(_DONE)
+    finally:
+        for chain_name, count in remaining.items():
+            if count > 0:
+                kline_queues[chain_name].put(_DONE)
+
+
+def _kline_worker(chain_name, kline_queue, result_queue, in_flight):
+    """
+    一条链的K线获取，把代币的K线下载提交到CMC客户端的事件循环，不等待结果
+    请求使用这条链的速率限制份额，完成的下载放入结果队列，还没有完成的下载最多in_flight个
+    """
+    slots = threading.BoundedSemaphore(in_flight)
+    seen = set()
+    targets = {}
+
+    def on_done(future, token):
+        # 在事件循环线程中调用，结果队列没有上限，不会阻塞事件循环
+        slots.release()
+        result_queue.put(('result', chain_name, (token, future)))
+
+    try:
+        while (token := kline_queue.get()) is not _DONE:
+            if token['address'] in seen:
+                continue
+
+            slots.acquire()
+            coro = None
+            try:
+                coro = klines_fetcher.download_klines_async(token, chain_name, klines_path / chain_name)
+                future = klines_fetcher.get_cmc_client().submit(run_with_budget(chain_name, coro))
+            except Exception as e:
+                # 没有提交的代币不会有结果，不计入这条链的代币数量，否则发布阶段会一直等待
+                slots.release()
+                if coro is not None:
+                    coro.close()
+                logger.error(f"{chain_name} 提交代币{token['symbol']} ({token['address']})的K线下载失败: {e}")
+                logger.error(traceback.format_exc())
+                continue
+            seen.add(token['address'])
+            targets[token['pair_address']] = kline_store.get_store_dir(chain_name, token['symbol'], token['address'])
+            future.add_done_callback(lambda future, token=token: on_done(future, token))
+    finally:
+        # 下次更新前由报价采样合成K线的交易对
+        klines_fetcher.quote_targets[chain_name] = targets
+        result_queue.put(('chain_done', chain_name, len(seen)))
+
+
+def _write_progress(chain_name, progress):
+    """
+    原子写入一条链的进度，hunter读取时不会读到半个文件，单进程运行时在后台写入
+    """
+    progress_file = klines_path / chain_name / 'flags' / 'progress.json'
+    progress_file.parent.mkdir(parents=True, exist_ok=True)
+    body = json.dumps(progress, ensure_ascii=False)
+
+    def write(progress_file):
+        tmp_file = progress_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(body)
+        os.replace(tmp_file, progress_file)
+
+    event_bus.persist(progress_file, write)
+
+
+def _publish_stage(chain_names, result_queue, run_time):
+    """
+    统计每条链的下载结果并定期写入进度，一条链全部完成时立即创建完成标志
+    Returns: 每条链成功更新的代币数量
+    """
+    started = time.time()
+    progress = {
+        chain_name: {'run_time': run_time.strftime('%Y-%m-%d_%H_%M'), 'total': None, 'finished': 0, 'updated': 0, 'done': False, 'elapsed': 0}
+        for chain_name in chain_names
+    }
+    written = {chain_name: 0 for chain_name in chain_names}
+    # 更新成功的代币，随完成标志一起通知hunter
+    updated_tokens = {chain_name: [] for chain_name in chain_names}
+    for chain_name in chain_names:
+        _write_progress(chain_name, progress[chain_name])
+
+    while not all(chain_progress['done'] for chain_progress in progress.values()):
+        kind, chain_name, value = result_queue.get()
+        chain_progress = progress[chain_name]
+        if kind == 'chain_done':
+            chain_progress['total'] = value
+        else:
+            token, future = value
+            chain_progress['finished'] += 1
+            try:
+                if future.result():
+                    chain_progress['updated'] += 1
+                    updated_tokens[chain_name].append(token['address'])
+                    # hunter不用等整条链完成，这个代币的信号可以先计算
+                    data_notify.publish_token(klines_path / chain_name / 'flags', chain_name, run_time, token['address'])
+            except Exception as e:
+                logger.error(f"{chain_name} 处理代币{token['symbol']} ({token['address']})时发生异常: {e}")
+                logger.error(''.join(traceback.format_exception(e)))
+
+        now = time.time()
+        chain_progress['elapsed'] = round(now - started, 2)
+        if chain_progress['total'] is not None and chain_progress['finished'] >= chain_progress['total']:
+            klines_fetcher.create_flag(klines_path / chain_name / 'flags', run_time, updated_tokens[chain_name])
+            chain_progress['done'] = True
+            logger.ok(f"{chain_name} K线更新完成，{chain_progress['updated']}/{chain_progress['total']}个代币，耗时 {chain_progress['elapsed']:.2f} 秒")
+        if chain_progress['done'] or now - written[chain_name] >= pipeline_config['progress_seconds']:
+            _write_progress(chain_name, chain_progress)
+            written[chain_name] = now
+
+    return {chain_name: chain_progress['updated'] for chain_name, chain_progress in progress.items()}
+
+
+# ====================入口函数======================
+def run_cycle(run_time):
+    """
+    以流水线方式更新所有账户的币池和K线，每条链完成时立即创建完成标志
+    run_time: 更新时间
+    Returns: 每条链成功更新的代币数量
+    """
+    chain_accounts = klines_fetcher.group_accounts_by_chain(accounts_info)
+    queue_size = pipeline_config['queue_size']
+    resolve_queue = queue.Queue(maxsize=queue_size)
+    # 每条链的代币队列有上限，K线获取处理不过来时交易对解析等待，不会在内存中堆积代币
+    kline_queues = {chain_name: queue.Queue(maxsize=queue_size) for chain_name in chain_accounts}
+    result_queue = queue.Queue()
+
+    # 每条链按权重分到速率限制的份额和同时下载的数量
+    weights = {chain_name: pipeline_config['chain_weights'].get(chain_name, 1) for chain_name in chain_accounts}
+    klines_fetcher.get_cmc_client().set_budgets(weights)
+    total_weight = sum(weights.values())
+
+    stages = [
+        threading.Thread(target=_pool_stage, args=(resolve_queue,), name='talons_pools', daemon=True),
+        threading.Thread(target=_resolve_stage, args=(chain_accounts, resolve_queue, kline_queues), name='talons_pairs', daemon=True),
+    ]
+    for chain_name, kline_queue in kline_queues.items():
+        in_flight = max(int(queue_size * weights[chain_name] / total_weight), 1)
+        stages.append(threading.Thread(target=_kline_worker, args=(chain_name, kline_queue, result_queue, in_flight),
+                                       name=f'talons_klines_{chain_name}', daemon=True))
+    for stage in stages:
+        stage.start()
+    results = _publish_stage(list(chain_accounts), result_queue, run_time)
+    for stage in stages:
+        stage.join()
+
+    # 历史池子不影响K线，所有链完成后再更新
+    history_count = pools_generator.update_history_pools()
+    logger.info(f"历史池子更新完成，处理了 {history_count} 条记录")
+    return results
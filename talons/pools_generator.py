@@ -14,16 +14,42 @@ warnings.filterwarnings('ignore')
 from config import root_path, accounts_info, data_path, klines_path
 from clients.gmgn_client import GMGNClient
 from utils.log_kit import logger, divider
+from utils import pair_index
+from utils.datatools import save_active_pool
 
 # 创建全局队列用于存放需要处理的池子
 pool_queue = queue.Queue()
 # 创建GMGN客户端实例，所有账户共用
 gmgn_client = GMGNClient()
+# 已经把旧CSV中的pair_address导入交易对索引的账户
+imported_accounts = set()
+
+def import_legacy_pairs(chain_name, account_dir):
+    """
+    把活跃池子、今天和昨天历史池子中已有的pair_address导入交易对索引，只导入索引中还没有的代币
+    每个账户在进程中只导入一次，之后都直接查询索引
+    """
+    today = datetime.now().date()
+    yesterday = today - timedelta(days=1)
+    paths = [
+        account_dir / 'active_pool.csv',
+        account_dir / 'history_pools' / f"history_pool_{today}.csv",
+        account_dir / 'history_pools' / f"history_pool_{yesterday}.csv",
+    ]
+    for path in paths:
+        if not path.exists():
+            continue
+        df = pd.read_csv(path, usecols=lambda column: column in ('address', 'pair_address'), dtype=str)
+        if 'pair_address' not in df.columns:
+            continue
+        df = df[df['pair_address'].notna() & (df['pair_address'] != '')]
+        pair_index.put_many(chain_name, df.to_dict(orient='records'), only_missing=True)
+
 
 def update_active_pools(account_info):
     """
     更新活跃币池
-    较少使用api获取pair_address，使用活跃池子、今天历史池子、昨天历史池子的pair_address
+    较少使用api获取pair_address，使用交易对索引中已有的pair_address
     """
     strategy_info = account_info['strategy']
     chain_name = strategy_info['chain_name']
@@ -36,46 +62,10 @@ def update_active_pools(account_info):
     account_dir = root_path / 'data_feed' / f'{account_id}'
     account_dir.mkdir(parents=True, exist_ok=True)
     
-    # 活跃池子文件路径，使用CSV格式
-    active_pool_path = account_dir / 'active_pool.csv'
-    
-    # 创建地址-pair_address映射字典
-    address_to_pair = {}
-    
-    # 检查是否存在原始active_pool.csv文件
-    if active_pool_path.exists():
-        # 读取原有的活跃池子数据
-        old_pools_df = pd.read_csv(active_pool_path)
-        
-        # 提取address和pair_address映射关系
-        for _, row in old_pools_df.iterrows():
-            if pd.notna(row.get('pair_address')) and row['pair_address']:
-                address_to_pair[row['address']] = row['pair_address']
-    
-    # 获取今天和昨天的日期
-    today = datetime.now().date()
-    yesterday = today - timedelta(days=1)
-    
-    # 尝试从历史池子文件中读取pair_address
-    # 今天的历史池子文件
-    today_history_path = account_dir / 'history_pools' / f"history_pool_{today}.csv"
-    if today_history_path.exists():
-        today_history_df = pd.read_csv(today_history_path)
-        # 提取address和pair_address映射关系
-        for _, row in today_history_df.iterrows():
-            if pd.notna(row.get('pair_address')) and row['pair_address']:
-                if row['address'] not in address_to_pair:  # 不覆盖已有的映射
-                    address_to_pair[row['address']] = row['pair_address']
-    
-    # 昨天的历史池子文件
-    yesterday_history_path = account_dir / 'history_pools' / f"history_pool_{yesterday}.csv"
-    if yesterday_history_path.exists():
-        yesterday_history_df = pd.read_csv(yesterday_history_path)
-        # 提取address和pair_address映射关系
-        for _, row in yesterday_history_df.iterrows():
-            if pd.notna(row.get('pair_address')) and row['pair_address']:
-                if row['address'] not in address_to_pair:  # 不覆盖已有的映射
-                    address_to_pair[row['address']] = row['pair_address']
+    # 旧的CSV中已有的pair_address只导入一次
+    if account_id not in imported_accounts:
+        import_legacy_pairs(chain_name, account_dir)
+        imported_accounts.add(account_id)
 
     # 获取币池数据，直接使用全局客户端
     pools = gmgn_client.get_coins_pool(pool_config)
@@ -84,6 +74,9 @@ def update_active_pools(account_info):
         logger.warning(f"未获取到{chain_name}链的币池数据")
         return 0
     
+    # 批量查询交易对索引
+    address_to_pair = pair_index.get_many(chain_name, [pool['address'] for pool in pools])
+    
     # 添加时间戳并处理pair_address
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
@@ -95,13 +88,13 @@ def update_active_pools(account_info):
         if 'pair_address' not in pool:
             pool['pair_address'] = ''
         
-        # 如果地址在映射字典中存在，则保留原有的pair_address
-        if pool['address'] in address_to_pair:
+        # 索引中有交易对时使用索引中的pair_address
+        if address_to_pair.get(pool['address']):
             pool['pair_address'] = address_to_pair[pool['address']]
         
-    # 转换为DataFrame并保存为CSV
+    # 转换为DataFrame并保存为CSV，单进程运行时hunter直接使用内存中的快照
     pools_df = pd.DataFrame(pools)
-    pools_df.to_csv(active_pool_path, index=False)
+    save_active_pool(account_id, pools_df)
     
     # 将更新的池子放入队列，用于更新历史池子
     for pool in pools:
@@ -0,0 +1,169 @@
+"""
+报价采样K线模块
+在两次K线更新之间，按sample_seconds批量获取交易对的最新报价(get_pair_quotes一次请求多个交易对)，在本地合成K线
+OHLCV接口每根K线消耗1个credit，报价一次请求可以覆盖batch_size个交易对，可以用同样的额度跟踪更多代币
+说明:
+1. 每个交易对正在合成的K线保存在内存中，周期结束后写入K线存储和共享内存，并更新meta.json的fetched_at
+2. 开盘价为上一根K线(内存中或共享内存中的)的收盘价(连续时)，否则为周期内第一次采样的价格；最高、最低、收盘为采样价格
+3. 成交量为周期内24小时成交量的增加量(小于0时为0)，只是估计值，由定期校正覆盖
+4. OHLCV只用于新代币的初始化、补齐采样没有覆盖的周期，以及每reconcile_minutes用接口K线覆盖最近reconcile_count根本地K线
+"""
+import time
+import numpy as np
+
+from config import interval_config, quote_candle_config
+from clients.cmc_client import interval_to_seconds
+from utils import kline_store, ohlcv_ring
+from utils.ohlcv_ring import RECORD_DTYPE
+from talons import fetch_planner
+
+# 正在合成的K线，key为K线存储目录
+_bars = {}
+
+
+def _interval_seconds():
+    return interval_to_seconds(interval_config['kline_interval'])
+
+
+def parse_pair_quotes(result):
+    """
+    解析 /dex/pairs/quotes/latest 的响应
+    Returns: {交易对地址: (价格, 24小时成交量)}，没有价格的交易对不在结果中
+    """
+    quotes = {}
+    for item in (result or {}).get('data') or []:
+        quote = item.get('quote')
+        if isinstance(quote, list):
+            quote = quote[0] if quote else None
+        if not quote or quote.get('price') is None:
+            continue
+        quotes[item['contract_address']] = (float(quote['price']), float(quote.get('volume_24h') or 0))
+    return quotes
+
+
+def _close(bar):
+    """
+    把合成中的K线转换为一条记录
+    """
+    record = np.zeros(1, dtype=RECORD_DTYPE)
+    record['candle_begin_time'] = bar['time']
+    record['open'] = bar['open']
+    record['high'] = bar['high']
+    record['low'] = bar['low']
+    record['close'] = bar['close']
+    record['volume'] = max(bar['volume_last'] - bar['volume_start'], 0.0)
+    return record
+
+
+def update_bars(targets, quotes, now=None):
+    """
+    用一次采样的报价更新合成中的K线，进入新周期的交易对先收盘上一根K线
+    targets: {交易对地址: K线存储目录}
+    quotes: parse_pair_quotes的结果
+    now: 采样时间，epoch秒
+    Returns: 收盘的 [(K线存储目录, 记录)]
+    """
+    interval_seconds = _interval_seconds()
+    slot = fetch_planner.current_slot(interval_seconds, now)
+    closed = []
+    for pair_address, (price, volume_24h) in quotes.items():
+        store_dir = targets.get(pair_address)
+        if store_dir is None:
+            continue
+        key = str(store_dir)
+        bar = _bars.get(key)
+        if bar is not None and bar['time'] == slot and not bar['closed']:
+            bar['high'] = max(bar['high'], price)
+            bar['low'] = min(bar['low'], price)
+            bar['close'] = price
+            bar['volume_last'] = volume_24h
+            continue
+        open_price = price
+        if bar is not None:
+            if not bar['closed']:
+                closed.append((store_dir, _close(bar)))
+            if bar['time'] + interval_seconds == slot:
+                open_price = bar['close']
+        else:
+            last = ohlcv_ring.read_ring(store_dir, tail=1)
+            if last is not None and len(last) and last['candle_begin_time'][-1] + interval_seconds == slot:
+                open_price = float(last['close'][-1])
+        _bars[key] = {
+            'time': slot, 'open': open_price, 'high': max(open_price, price), 'low': min(open_price, price),
+            'close': price, 'volume_start': volume_24h, 'volume_last': volume_24h, 'closed': False,
+        }
+    return closed
+
+
+def close_bars(now=None):
+    """
+    收盘所有周期已经结束的K线，没有新报价的交易对也会收盘
+    Returns: 收盘的 [(K线存储目录, 记录)]
+    """
+    slot = fetch_planner.current_slot(_interval_seconds(), now)
+    closed = []
+    for key, bar in _bars.items():
+        if bar['time'] < slot and not bar['closed']:
+            closed.append((key, _close(bar)))
+            # 保留收盘价，下一根K线的开盘价使用
+            bar['closed'] = True
+    return closed
+
+
+def save_bars(closed, now=None):
+    """
+    保存收盘的K线，写入K线存储和共享内存，并记录获取时间，fetch_planner不会再请求这些K线
+    closed: update_bars或close_bars的结果
+    Returns: 保存的K线数量
+    """
+    now = time.time() if now is None else now
+    by_store = {}
+    for store_dir, record in closed:
+        by_store.setdefault(str(store_dir), []).append(record)
+    for store_dir, records in by_store.items():
+        records = np.concatenate(records)
+        if not kline_store.load_meta(store_dir):
+            # 只给已经初始化的代币合成K线
+            continue
+        kline_store.write_records(store_dir, records)
+        ohlcv_ring.publish_records(store_dir, records)
+        fetched_at = kline_store.load_meta(store_dir).get('fetched_at', 0)
+        kline_store.update_meta(store_dir, {'fetched_at': int(max(fetched_at, now))})
+    return len(closed)
+
+
+def _merge_ranges(ranges, interval_seconds):
+    """
+    合并重叠或相邻的区间
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + interval_seconds:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def plan_fetch(store_dir, now=None):
+    """
+    开启报价采样时的K线获取计划
+    1. 当前周期由报价合成，只检查已经收盘的周期中缺少的K线
+    2. 距离上次校正超过reconcile_minutes时，加上最近reconcile_count根K线，校正失败时等到下一次
+    Returns: 同fetch_planner.plan_fetch
+    """
+    now = time.time() if now is None else now
+    interval_seconds = _interval_seconds()
+    last_closed = fetch_planner.current_slot(interval_seconds, now) - interval_seconds
+    ranges = fetch_planner.plan_fetch(store_dir, now=last_closed)
+    if ranges is None:
+        return None
+
+    meta = kline_store.load_meta(store_dir)
+    reconcile_seconds = quote_candle_config['reconcile_minutes'] * 60
+    if reconcile_seconds and quote_candle_config['reconcile_count'] and now - meta.get('reconciled_at', 0) >= reconcile_seconds:
+        start = max(int(meta['first_time']), last_closed - (quote_candle_config['reconcile_count'] - 1) * interval_seconds)
+        if start <= last_closed:
+            ranges = _merge_ranges(ranges + [(start, last_closed)], interval_seconds)
+        kline_store.update_meta(store_dir, {'reconciled_at': int(now)})
+    return ranges
@@ -7,10 +7,11 @@ import traceback
 import warnings
 warnings.filterwarnings('ignore')
 
-from config import accounts_info, interval_config
+from config import accounts_info, interval_config, quote_candle_config, pipeline_config
 from talons.pools_generator import update_all_pools, create_data_files
-from talons.klines_fetcher import update_all_klines
-from utils.commons import sleep_until_run_time, send_wechat_message
+from talons.klines_fetcher import update_all_klines, sample_quotes_until
+from talons.pipeline import run_cycle
+from utils.commons import sleep_until_run_time, next_run_time, remedy_until_run_time, send_wechat_message
 from utils.log_kit import logger, divider
 
 is_debug = True
@@ -21,19 +22,28 @@ def main():
     random_seconds = 0  # 可以根据需要调整这个值，避免K线刚更新就执行
     if is_debug:
         run_time = sleep_until_run_time(interval_config['kline_interval'], if_sleep=False, cheat_seconds=random_seconds)
+    elif quote_candle_config['enabled']:
+        # 等待期间采样报价，在本地合成K线
+        run_time = next_run_time(interval_config['kline_interval'], 1)
+        sample_quotes_until(run_time)
+        remedy_until_run_time(run_time)
     else:
         run_time = sleep_until_run_time(interval_config['kline_interval'], if_sleep=True, cheat_seconds=random_seconds)
     
-    # 更新所有账户的池子
     start_time = time.time()
-    update_all_pools(accounts_info)
+    if pipeline_config['enabled']:
+        # 币池、交易对、K线流水线更新，每条链完成时立即创建完成标志
+        results = run_cycle(run_time)
+    else:
+        # 更新所有账户的池子
+        update_all_pools(accounts_info)
 
-    elapsed = time.time() - start_time
-    logger.info(f"数据中心启动完成，耗时 {elapsed:.2f} 秒")
-    
-    # 更新K线
-    start_time = time.time()
-    results = update_all_klines(run_time, parallel=True if not is_debug else False, max_workers=3)
+        elapsed = time.time() - start_time
+        logger.info(f"数据中心启动完成，耗时 {elapsed:.2f} 秒")
+        
+        # 更新K线
+        start_time = time.time()
+        results = update_all_klines(run_time, parallel=True if not is_debug else False)
     
     # 计算总更新数量
     updated_total = sum(results.values())
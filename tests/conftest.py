@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+# 测试直接导入项目根目录下的模块
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# 测试只输出到命令行，不写入logs目录
+os.environ.setdefault('X3S_USE_FILE_LOGGING', '0')
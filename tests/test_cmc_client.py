@@ -0,0 +1,49 @@
+"""
+CMC客户端K线输出格式的测试，不发送请求
+"""
+import asyncio
+
+import numpy as np
+
+from clients.cmc_client import AsyncCMCClient
+from utils.ohlcv_ring import RECORD_DTYPE
+
+INFO = {
+    'pair_name': 'X/SOL',
+    'pair_address': 'PAIR',
+    'symbol': 'X',
+    'address': 'ADDR',
+    'quote_coin_symbol': 'SOL',
+    'chain': 'solana',
+    'created_at': '2025-04-20 00:00:00',
+}
+
+
+def client_with(records, info, credit):
+    client = object.__new__(AsyncCMCClient)
+
+    async def fetch_kline_records(*args, **kwargs):
+        return records, info, credit
+
+    client.fetch_kline_records = fetch_kline_records
+    return client
+
+
+def test_fetch_klines_df_keeps_legacy_format():
+    records = np.zeros(2, dtype=RECORD_DTYPE)
+    records['candle_begin_time'] = [1745193600, 1745193900]
+    records['close'] = [1.5, 2.5]
+    client = client_with(records, INFO, 2)
+    df, credit = asyncio.run(client.fetch_klines_df('solana', 'PAIR', '5m'))
+    assert credit == 2
+    assert list(df.columns) == ['candle_begin_time', 'open', 'high', 'low', 'close', 'volume', 'symbol', 'address',
+                                'quote_coin_symbol', 'pair_name', 'pair_address', 'chain', 'created_at']
+    assert list(df['candle_begin_time']) == ['2025-04-21 00:00:00', '2025-04-21 00:05:00']
+    assert list(df['close']) == [1.5, 2.5]
+    assert (df['pair_address'] == 'PAIR').all()
+
+
+def test_fetch_klines_df_empty():
+    client = client_with(np.zeros(0, dtype=RECORD_DTYPE), None, 1)
+    df, credit = asyncio.run(client.fetch_klines_df('solana', 'PAIR', '5m'))
+    assert df.empty and credit == 1
@@ -0,0 +1,132 @@
+"""
+数据就绪通知的测试: 套接字不可用时使用flag/ready文件，过大的通知从flag文件读取清单
+"""
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import notify_config
+from utils import data_notify, event_bus
+
+RUN_TIME = datetime(2025, 4, 21, 8, 0)
+RUN_TIME_STR = '2025-04-21_08_00'
+
+
+@pytest.fixture
+def notify(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_notify, 'klines_path', tmp_path / 'klines')
+    monkeypatch.setattr(data_notify, 'notify_socket_path', tmp_path / 'ready.sock')
+    monkeypatch.setattr(data_notify, '_listener', [None])
+    monkeypatch.setattr(data_notify, '_state', {'run_time': None, 'chains': {}, 'tokens': {}})
+    monkeypatch.setattr(event_bus, '_enabled', [False])
+    monkeypatch.setitem(notify_config, 'enabled', True)
+    monkeypatch.setitem(notify_config, 'fallback_seconds', 60)
+    yield tmp_path
+    data_notify.close_listener()
+
+
+def flag_dir(notify, chain_name='solana'):
+    path = notify / 'klines' / chain_name / 'flags'
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def later(seconds, func, *args):
+    timer = threading.Timer(seconds, func, args)
+    timer.start()
+    return timer
+
+
+def collect(wanted, seconds=10, **kwargs):
+    """
+    Returns: [(链名称, 就绪的代币, 距离开始的秒数)]
+    """
+    started = time.time()
+    deadline = datetime.now() + timedelta(seconds=seconds)
+    return [(chain_name, ready, time.time() - started)
+            for chain_name, ready in data_notify.wait_tokens(RUN_TIME, wanted, deadline=deadline, **kwargs)]
+
+
+def test_files_when_socket_disabled(notify, monkeypatch):
+    monkeypatch.setitem(notify_config, 'enabled', False)
+    flags = flag_dir(notify)
+    data_notify.publish_token(flags, 'solana', RUN_TIME, 'A')
+    # 写了一半的行不算就绪
+    with open(flags / f'{RUN_TIME_STR}.ready', 'a') as f:
+        f.write('B')
+    timer = later(0.3, data_notify.publish, flags, 'solana', RUN_TIME, ['A', 'B'])
+    results = collect({'solana': {'A', 'B', 'C'}})
+    timer.join()
+
+    # 没有套接字时每秒读取一次文件；C不在清单中，是本周期更新失败的代币
+    assert [(chain_name, ready) for chain_name, ready, _ in results] == [('solana', {'A'}), ('solana', {'B'})]
+    assert results[1][2] < 3
+    assert data_notify._listener == [False]
+    assert not data_notify.notify_socket_path.exists()
+
+
+def test_files_when_published_before_listener(notify):
+    flags = flag_dir(notify)
+    # talons发送时hunter还没有绑定套接字，只写入文件
+    data_notify.publish_token(flags, 'solana', RUN_TIME, 'A')
+    data_notify.publish(flags, 'solana', RUN_TIME, ['A', 'B'])
+    results = collect({'solana': {'A', 'B'}})
+    assert [(chain_name, ready) for chain_name, ready, _ in results] == [('solana', {'A', 'B'})]
+
+
+def test_socket_wakes_before_fallback(notify):
+    if not hasattr(socket, 'AF_UNIX'):
+        pytest.skip('系统不支持Unix域套接字')
+    flags = flag_dir(notify)
+    idle = []
+    timers = [later(0.3, data_notify.publish_token, flags, 'solana', RUN_TIME, 'A'),
+              later(0.6, data_notify.publish, flags, 'solana', RUN_TIME, ['A', 'B'])]
+    results = collect({'solana': {'A', 'B', 'C'}}, on_idle=idle.append)
+    for timer in timers:
+        timer.join()
+    # fallback_seconds为60，只能是套接字的通知
+    assert [(chain_name, ready) for chain_name, ready, _ in results] == [('solana', {'A'}), ('solana', {'B'})]
+    assert results[-1][2] < 5
+    assert idle[0] == 3
+
+
+def test_message_without_tokens_reads_flag(notify):
+    flags = flag_dir(notify)
+    data_notify.publish(flags, 'solana', RUN_TIME, ['A', 'B'])
+    data_notify._state.update({'run_time': RUN_TIME_STR, 'chains': {}, 'tokens': {}})
+    # 通知过大时只带链和时间
+    data_notify._apply({'chain': 'solana', 'run_time': RUN_TIME_STR, 'tokens': None})
+    assert data_notify._state['tokens']['solana'] == {'A', 'B'}
+    assert data_notify._state['chains']['solana']['tokens'] == ['A', 'B']
+
+
+def test_oversized_message_over_socket(notify):
+    if not hasattr(socket, 'AF_UNIX'):
+        pytest.skip('系统不支持Unix域套接字')
+    flags = flag_dir(notify)
+    tokens = [f'{i:044d}' for i in range(30000)]
+    timer = later(0.3, data_notify.publish, flags, 'solana', RUN_TIME, tokens)
+    results = collect({'solana': {tokens[0], tokens[-1], 'FAILED'}})
+    timer.join()
+    assert [(chain_name, ready) for chain_name, ready, _ in results] == [('solana', {tokens[0], tokens[-1]})]
+    assert results[0][2] < 5
+
+
+def test_legacy_flag_marks_chain_ready(notify):
+    flags = flag_dir(notify)
+    (flags / f'{RUN_TIME_STR}.flag').write_text('')
+    results = collect({'solana': {'A', 'B'}})
+    assert [(chain_name, ready) for chain_name, ready, _ in results] == [('solana', {'A', 'B'})]
+
+
+def test_deadline(notify, monkeypatch):
+    monkeypatch.setitem(notify_config, 'enabled', False)
+    flag_dir(notify)
+    idle = []
+    started = time.time()
+    assert collect({'solana': {'A'}, 'bsc': set()}, seconds=1.5, on_idle=idle.append) == []
+    assert 1 <= time.time() - started < 4
+    assert idle and set(idle) == {1}
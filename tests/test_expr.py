@@ -0,0 +1,147 @@
+"""
+表达式策略编译和执行的测试
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from signals import expr, indicators, sma, bolling
+
+SMA_SPEC = {
+    'params': ['n', 'm'],
+    'entry': 'cross_up(sma(close, n), sma(sma(close, n), m))',
+    'exit': 'cross_down(sma(close, n), sma(sma(close, n), m))',
+}
+BOLLING_SPEC = {
+    'params': ['n', 'k'],
+    'entry': 'cross_up(close, sma(close, n) + k * std(close, n))',
+    'exit': 'cross_down(close, sma(close, n))',
+}
+
+
+def random_closes(seed, size=3000):
+    rng = np.random.default_rng(seed)
+    return np.round(100 + np.cumsum(rng.normal(0, 1, size)), 1)
+
+
+@pytest.fixture(autouse=True)
+def clean_plans(monkeypatch):
+    monkeypatch.setattr(expr, '_plans', {})
+
+
+# ============= 解析 =============
+def test_params_are_substituted():
+    plan = expr.compile_plan({'params': ['n'], 'entry': 'close > sma(close, n - 1)', 'exit': 'close < shift(close, n)'}, [5])
+    assert ('mean', ('input', 'close'), 4) in plan['steps']
+    assert ('shift', ('input', 'close'), 5) in plan['steps']
+    assert plan['inputs'] == ['close']
+
+
+def test_chained_compare_and_unary_minus():
+    plan = expr.compile_plan({'params': [], 'entry': '0 < close < 10', 'exit': 'close > -volume'}, [])
+    assert plan['inputs'] == ['close', 'volume']
+    assert plan['entry'][0] == 'and'
+    close = np.array([-1.0, 5.0, 20.0])
+    entry = expr.execute_plan({**plan, 'exit': ('const', False)}, {'close': close, 'volume': np.ones(3)})
+    np.testing.assert_array_equal(entry, [0, 1, 0])
+
+
+@pytest.mark.parametrize('text, message', [
+    ('close > price', 'price'),
+    ('rank(close, 3) > 0', 'rank'),
+    ('sma(close) > 0', '两个参数'),
+    ('sma(close, 2.5) > 0', '正整数'),
+    ('sma(close, close) > 0', '正整数'),
+    ('close ** 2 > 0', '不支持'),
+    ('close in [1, 2]', '不支持'),
+])
+def test_invalid_expressions(text, message):
+    with pytest.raises(ValueError, match=message):
+        expr.compile_plan({'params': [], 'entry': text, 'exit': 'close < 0'}, [])
+
+
+def test_param_count_checked():
+    with pytest.raises(ValueError):
+        expr.compile_plan(SMA_SPEC, [5])
+
+
+# ============= 公共子表达式 =============
+def test_shared_subexpressions_compiled_once():
+    plan = expr.compile_plan(SMA_SPEC, [5, 20])
+    # close, sma(close, 5), sma(sma(close, 5), 20), cross_up, cross_down
+    assert len(plan['steps']) == 5
+    assert len(plan['steps']) == len(set(plan['steps']))
+    assert sum(key[0] == 'mean' for key in plan['steps']) == 2
+
+
+def test_commutative_operands_compiled_once():
+    spec = {'params': ['n'], 'entry': 'close + sma(close, n) > 2 * close', 'exit': 'sma(close, n) + close < close * 2'}
+    plan = expr.compile_plan(spec, [3])
+    assert sum(key[0] == '+' for key in plan['steps']) == 1
+    assert sum(key[0] == '*' for key in plan['steps']) == 1
+    # 不满足交换律的运算不合并
+    plan = expr.compile_plan({'params': [], 'entry': 'close - volume > 0', 'exit': 'volume - close > 0'}, [])
+    assert sum(key[0] == '-' for key in plan['steps']) == 2
+
+
+# ============= 执行计划缓存 =============
+def test_plan_cache():
+    plan = expr.get_plan('sma_expr', SMA_SPEC, (5, 20))
+    assert expr.get_plan('sma_expr', SMA_SPEC, [5, 20]) is plan
+    assert expr.get_plan('sma_expr', SMA_SPEC, (5, 30)) is not plan
+    assert set(expr._plans) == {('sma_expr', (5, 20)), ('sma_expr', (5, 30))}
+
+    strategy = expr.build_strategy('sma_expr', SMA_SPEC)
+    strategy.signal(pd.DataFrame({'close': random_closes(1, 100)}), 5, 20)
+    assert len(expr._plans) == 2
+
+
+# ============= 和手写策略一致 =============
+@pytest.mark.parametrize('module, spec, params', [
+    (sma, SMA_SPEC, (5, 20)),
+    (sma, SMA_SPEC, (3, 7)),
+    (bolling, BOLLING_SPEC, (20, 2)),
+    (bolling, BOLLING_SPEC, (10, 1.5)),
+])
+def test_matches_handwritten_strategy(module, spec, params):
+    prices = pd.DataFrame({'close': random_closes(0)})
+    strategy = expr.build_strategy(module.__name__, spec)
+    expected = module.signal(prices.copy(), *params)['signal'].to_numpy()
+    actual = strategy.signal(prices.copy(), *params)['signal'].to_numpy()
+    np.testing.assert_array_equal(actual, expected)
+    assert strategy.lookback(*params) == module.lookback(*params)
+
+    # 面板计算和逐个代币计算一致
+    closes = np.stack([random_closes(seed, 500) for seed in range(4)])
+    panel_signals = indicators.dedup_signals(strategy.panel_kernel({'close': closes, 'nodes': {}}, *params))
+    for row, close in enumerate(closes):
+        expected = module.signal(pd.DataFrame({'close': close}), *params)['signal'].to_numpy()
+        np.testing.assert_array_equal(indicators.to_signal_column(panel_signals[row]), expected)
+
+
+# ============= 面板计算 =============
+def test_panel_kernel_only_for_close_expressions():
+    # 参数代入后才合法的周期不影响判断
+    strategy = expr.build_strategy('lagged', {'params': ['n'], 'entry': 'cross_up(close, sma(close, n - 1))',
+                                              'exit': 'cross_down(close, sma(close, n - 1))'})
+    assert hasattr(strategy, 'panel_kernel')
+    closes = np.stack([random_closes(seed, 200) for seed in range(2)])
+    panel_signals = indicators.dedup_signals(strategy.panel_kernel({'close': closes, 'nodes': {}}, 6))
+    expected = strategy.signal(pd.DataFrame({'close': closes[1]}), 6)['signal'].to_numpy()
+    np.testing.assert_array_equal(indicators.to_signal_column(panel_signals[1]), expected)
+
+    strategy = expr.build_strategy('volume', {'params': ['n'], 'entry': 'cross_up(close, sma(close, n))',
+                                              'exit': 'volume > sma(volume, n)'})
+    assert not hasattr(strategy, 'panel_kernel')
+
+
+def test_panel_kernel_shares_nodes():
+    closes = np.stack([random_closes(seed, 300) for seed in range(3)])
+    panel = {'close': closes, 'nodes': {}}
+    expr.build_strategy('sma_expr', SMA_SPEC).panel_kernel(panel, 5, 20)
+    assert set(panel['nodes']) == {('mean', 'close', 5), ('mean', ('mean', 'close', 5), 20)}
+    # 另一个策略用到相同的指标时直接使用面板上的结果
+    shared = panel['nodes'][('mean', 'close', 5)]
+    expr.build_strategy('bolling_expr', BOLLING_SPEC).panel_kernel(panel, 5, 2)
+    assert panel['nodes'][('mean', 'close', 5)] is shared
+    assert ('std', 'close', 5) in panel['nodes']
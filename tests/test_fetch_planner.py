@@ -0,0 +1,46 @@
+"""
+K线获取计划的测试
+"""
+import numpy as np
+
+from config import kline_fetch_config
+from talons import fetch_planner
+from utils import kline_store
+from utils.ohlcv_ring import RECORD_DTYPE
+
+INTERVAL = '5m'
+STEP = 300
+
+
+def make_store(store_dir, times):
+    records = np.zeros(len(times), dtype=RECORD_DTYPE)
+    records['candle_begin_time'] = times
+    records['close'] = 1.0
+    kline_store.write_records(store_dir, records, {'symbol': 'X'})
+
+
+def test_recent_missing_slots_are_retried(tmp_path):
+    now = 1745222400 + 100
+    current = fetch_planner.current_slot(STEP, now)
+    # 最后一根已收盘的K线接口还没有收录
+    stored = np.arange(current - 20 * STEP, current - STEP, STEP)
+    make_store(tmp_path, stored)
+    ranges = [(current - STEP, current)]
+    fetch_planner.record_fetch(tmp_path, ranges, [current], now, interval=INTERVAL)
+
+    assert kline_store.load_meta(tmp_path)['empty_ranges'] == []
+    assert fetch_planner.plan_fetch(tmp_path, interval=INTERVAL, now=now + STEP) == [(current - STEP, current + STEP)]
+
+
+def test_settled_missing_slots_are_recorded(tmp_path):
+    now = 1745222400 + 100
+    current = fetch_planner.current_slot(STEP, now)
+    settle = kline_fetch_config['settle_count']
+    gap = current - (settle + 3) * STEP
+    stored = np.arange(current - 20 * STEP, current + 1, STEP)
+    make_store(tmp_path, stored[stored != gap])
+    fetch_planner.record_fetch(tmp_path, [(gap, gap), (current, current)], [current], now, interval=INTERVAL)
+
+    assert kline_store.load_meta(tmp_path)['empty_ranges'] == [[gap, gap]]
+    # 已知没有K线的周期不再请求，只重新获取上次没有收盘的K线
+    assert fetch_planner.plan_fetch(tmp_path, interval=INTERVAL, now=now) == [(current, current)]
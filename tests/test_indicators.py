@@ -0,0 +1,192 @@
+"""
+指标库和策略增量计算的一致性测试
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from signals import indicators, sma, bolling
+
+
+def random_closes(seed, size=3000):
+    """
+    随机游走的收盘价，保留一位小数，均线经常出现相等的情况
+    """
+    rng = np.random.default_rng(seed)
+    return np.round(50 + np.cumsum(rng.normal(0, 0.3, size)), 1)
+
+
+def pandas_sma(df, n, m):
+    """
+    原pandas实现的双均线策略
+    """
+    df['ma_short'] = df['close'].rolling(n, min_periods=1).mean()
+    df['ma_long'] = df['ma_short'].rolling(m, min_periods=1).mean()
+    df.loc[(df['ma_short'] > df['ma_long']) & (df['ma_short'].shift(1) <= df['ma_long'].shift(1)), 'signal'] = 1
+    df.loc[(df['ma_short'] < df['ma_long']) & (df['ma_short'].shift(1) >= df['ma_long'].shift(1)), 'signal'] = -1
+    temp = df[df['signal'].notnull()][['signal']]
+    df['signal'] = temp[temp['signal'] != temp['signal'].shift(1)]['signal']
+    return df
+
+
+def pandas_bolling(df, n, k):
+    """
+    原pandas实现的布林带策略
+    """
+    df['middle'] = df['close'].rolling(n, min_periods=1).mean()
+    df['std'] = df['close'].rolling(n, min_periods=1).std(ddof=0)
+    df['upper'] = df['middle'] + k * df['std']
+    df.loc[(df['close'] > df['upper']) & (df['close'].shift(1) <= df['upper'].shift(1)), 'signal'] = 1
+    df.loc[(df['close'] < df['middle']) & (df['close'].shift(1) >= df['middle'].shift(1)), 'signal'] = -1
+    temp = df[df['signal'].notnull()][['signal']]
+    df['signal'] = temp[temp['signal'] != temp['signal'].shift(1)]['signal']
+    return df
+
+
+def indicator_series():
+    """
+    带有长时间不变的价格和缺失值的随机游走，一维和二维各一份
+    """
+    closes = np.stack([random_closes(seed, size=1000) for seed in range(4)])
+    closes[0, 300:340] = closes[0, 300]
+    closes[1, 500:502] = np.nan
+    closes[2, :30] = np.nan
+    return closes
+
+
+# 'numpy': 没有numba时的实现，'loop': 循环实现(没有numba时以纯Python运行)，'numba': JIT编译的实现
+IMPLEMENTATIONS = ['numpy', 'loop'] + (['numba'] if indicators.NUMBA_AVAILABLE else [])
+
+
+@pytest.fixture(params=IMPLEMENTATIONS)
+def implementation(request, monkeypatch):
+    if request.param == 'numpy':
+        monkeypatch.setattr(indicators, 'NUMBA_AVAILABLE', False)
+    elif request.param == 'loop':
+        # 逐行调用循环实现，核对算法本身
+        monkeypatch.setattr(indicators, 'NUMBA_AVAILABLE', True)
+        monkeypatch.setattr(indicators, '_rolling_mean_rows', lambda values, n: np.stack([indicators._rolling_mean_loop(row, n) for row in values]))
+        monkeypatch.setattr(indicators, '_rolling_var_rows', lambda values, n, ddof: np.stack([indicators._rolling_var_loop(row, n, ddof) for row in values]))
+        monkeypatch.setattr(indicators, '_ema_rows', lambda values, alpha, adjust: np.stack([indicators._ema_loop(row, alpha, adjust) for row in values]))
+        monkeypatch.setattr(indicators, '_dedup_rows', lambda raw: np.stack([indicators._dedup_loop(row) for row in raw]))
+    return request.param
+
+
+@pytest.mark.parametrize('n', [1, 5, 20])
+def test_rolling_mean_matches_pandas(implementation, n):
+    closes = indicator_series()
+    expected = pd.DataFrame(closes.T).rolling(n, min_periods=1).mean().to_numpy().T
+    np.testing.assert_array_equal(indicators.rolling_mean(closes, n), expected)
+    np.testing.assert_array_equal(indicators.rolling_mean(closes[0], n), expected[0])
+
+
+@pytest.mark.parametrize('n', [1, 5, 20])
+@pytest.mark.parametrize('ddof', [0, 1])
+def test_rolling_std_matches_pandas(implementation, n, ddof):
+    closes = indicator_series()
+    expected = pd.DataFrame(closes.T).rolling(n, min_periods=1).std(ddof=ddof).to_numpy().T
+    np.testing.assert_array_equal(indicators.rolling_std(closes, n, ddof=ddof), expected)
+
+
+@pytest.mark.parametrize('adjust', [False, True])
+def test_ema_matches_pandas(implementation, adjust):
+    closes = indicator_series()
+    expected = pd.DataFrame(closes.T).ewm(span=12, adjust=adjust).mean().to_numpy().T
+    np.testing.assert_array_equal(indicators.ema(closes, 12, adjust=adjust), expected)
+
+
+def test_cross_matches_pandas(implementation):
+    closes = indicator_series()
+    ma_short = indicators.rolling_mean(closes, 5)
+    ma_long = indicators.rolling_mean(ma_short, 10)
+    for row in range(len(closes)):
+        short, long = pd.Series(ma_short[row]), pd.Series(ma_long[row])
+        above = (short > long) & (short.shift(1) <= long.shift(1))
+        below = (short < long) & (short.shift(1) >= long.shift(1))
+        np.testing.assert_array_equal(indicators.cross_above(ma_short, ma_long)[row], above.to_numpy())
+        np.testing.assert_array_equal(indicators.cross_below(ma_short, ma_long)[row], below.to_numpy())
+    # 和标量比较
+    close = pd.Series(closes[0])
+    np.testing.assert_array_equal(indicators.cross_above(closes[0], 50.0), ((close > 50) & (close.shift(1) <= 50)).to_numpy())
+
+
+def test_dedup_signals(implementation):
+    raw = np.random.default_rng(0).choice(np.array([-1, 0, 0, 0, 1], dtype=np.int8), size=(4, 500))
+    signals = indicators.dedup_signals(raw)
+    for row in range(len(raw)):
+        temp = pd.Series(raw[row]).replace(0, np.nan).dropna()
+        expected = np.zeros(raw.shape[1], dtype=np.int8)
+        kept = temp[temp != temp.shift(1)]
+        expected[kept.index] = kept.to_numpy()
+        np.testing.assert_array_equal(signals[row], expected)
+        np.testing.assert_array_equal(indicators.dedup_last(raw[row]), expected[-1])
+
+
+@pytest.mark.parametrize('module, reference, params', [(sma, pandas_sma, (5, 20)), (bolling, pandas_bolling, (20, 2))])
+@pytest.mark.parametrize('seed', range(5))
+def test_strategy_signal_matches_pandas(implementation, module, reference, params, seed):
+    df = pd.DataFrame({'close': random_closes(seed)})
+    expected = reference(df.copy(), *params)
+    actual = module.signal(df.copy(), *params)
+    for col in ['signal'] + module.INDICATOR_COLUMNS:
+        np.testing.assert_array_equal(actual[col].to_numpy(), expected[col].to_numpy(), err_msg=col)
+
+
+def incremental(module, closes, *params):
+    """
+    逐根K线增量计算
+    Returns: (signal数组, {指标列: 数组})
+    """
+    state = module.init_state(*params)
+    signals = np.full(len(closes), np.nan)
+    values = {col: np.empty(len(closes)) for col in module.INDICATOR_COLUMNS}
+    for i, close in enumerate(closes):
+        result = module.update_state(state, float(close), *params)
+        if result is not None:
+            signals[i] = result
+        for col in module.INDICATOR_COLUMNS:
+            values[col][i] = state[col]
+    return signals, values
+
+
+STRATEGIES = [
+    (sma, pandas_sma, (5, 10)),
+    (sma, pandas_sma, (3, 7)),
+    (sma, pandas_sma, (1, 4)),
+    (bolling, pandas_bolling, (20, 2)),
+    (bolling, pandas_bolling, (5, 1.5)),
+]
+
+
+@pytest.mark.parametrize('module, reference, params', STRATEGIES)
+@pytest.mark.parametrize('seed', range(20))
+def test_incremental_matches_full(module, reference, params, seed):
+    closes = random_closes(seed)
+    closes[500:540] = closes[500]  # 长时间不变的价格
+    df = pd.DataFrame({'close': closes})
+    signals, values = incremental(module, closes, *params)
+
+    expected = reference(df.copy(), *params)
+    np.testing.assert_array_equal(signals, expected['signal'].to_numpy())
+    for col, value in values.items():
+        np.testing.assert_array_equal(value, expected[col].to_numpy(), err_msg=col)
+
+    full = module.signal(df.copy(), *params)
+    np.testing.assert_array_equal(signals, full['signal'].to_numpy())
+
+
+@pytest.mark.parametrize('module, params', [(sma, (5, 10)), (bolling, (20, 2)), (bolling, (10, 1))])
+def test_widened_window_matches_full_history(module, params):
+    # 不保留小数，避免指标相等时尾部窗口和全部历史的累加误差不同
+    closes = 50 + np.cumsum(np.random.default_rng(7).normal(0, 0.3, 800))
+    full = module.signal(pd.DataFrame({'close': closes}), *params)['signal'].to_numpy()
+    bars = module.lookback(*params)
+    for end in range(bars, len(closes)):
+        window = bars
+        while True:
+            start = max(end - window, 0)
+            signal = module.signal(pd.DataFrame({'close': closes[start:end]}), *params)['signal'].to_numpy()
+            if start == 0 or indicators.last_signal_settled(np.nan_to_num(signal), bars):
+                break
+            window *= 4
+        np.testing.assert_array_equal(signal[-1], full[end - 1], err_msg=f'end={end}')
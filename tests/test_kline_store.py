@@ -0,0 +1,38 @@
+"""
+K线存储写入合并的测试
+"""
+import numpy as np
+import pytest
+
+from utils import kline_store
+from utils.ohlcv_ring import RECORD_DTYPE
+
+T0 = 1745193600
+STEP = 300
+
+
+def records(index, closes):
+    bars = np.zeros(len(index), dtype=RECORD_DTYPE)
+    bars['candle_begin_time'] = T0 + np.asarray(index) * STEP
+    bars['close'] = closes
+    return bars
+
+
+@pytest.mark.parametrize('existing', [[], [0, 1]], ids=['new_store', 'append'])
+def test_duplicate_times_in_one_write_keep_last(tmp_path, existing):
+    if existing:
+        kline_store.write_records(tmp_path, records(existing, [1.0] * len(existing)))
+    # 同一次写入中重复的时间戳以后面的数据为准
+    added = kline_store.write_records(tmp_path, records([2, 3, 3, 4], [2.0, 3.0, 3.5, 4.0]))
+    df = kline_store.read_klines(tmp_path)
+    assert added == 3
+    assert list(df['close']) == [1.0] * len(existing) + [2.0, 3.5, 4.0]
+    assert kline_store.load_meta(tmp_path)['count'] == len(existing) + 3
+
+
+def test_overlapping_write_replaces_old_bars(tmp_path):
+    kline_store.write_records(tmp_path, records([0, 1, 2], [1.0, 1.0, 1.0]))
+    added = kline_store.write_records(tmp_path, records([2, 3, 1], [2.0, 3.0, 5.0]))
+    df = kline_store.read_klines(tmp_path)
+    assert added == 1
+    assert list(df['close']) == [1.0, 5.0, 2.0, 3.0]
@@ -0,0 +1,77 @@
+"""
+K线重采样缓存的测试
+"""
+import numpy as np
+import pytest
+
+from utils import kline_store, ohlcv_ring, ohlcv_resample
+from utils.ohlcv_ring import RECORD_DTYPE
+
+T0 = 1745193600  # UTC整点
+
+
+def base_records(hours):
+    """
+    指定小时内的全部5分钟K线
+    """
+    times = np.concatenate([T0 + hour * 3600 + np.arange(0, 3600, 300) for hour in hours])
+    records = np.zeros(len(times), dtype=RECORD_DTYPE)
+    records['candle_begin_time'] = times
+    records['open'] = records['high'] = records['low'] = records['close'] = np.arange(len(times), dtype=np.float64)
+    records['volume'] = 1.0
+    return records
+
+
+def write(store_dir, records, ring):
+    kline_store.write_records(store_dir, records)
+    if ring:
+        ohlcv_ring.publish_records(store_dir, records)
+
+
+def hours(bars):
+    return list((bars['candle_begin_time'] - T0) // 3600)
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    ohlcv_resample.clear_cache()
+    yield
+    ohlcv_resample.clear_cache()
+
+
+@pytest.mark.parametrize('ring', [False, True], ids=['store', 'ring'])
+@pytest.mark.parametrize('tail', [None, 10])
+def test_backfill_reaches_cached_bars(tmp_path, ring, tail):
+    now = T0 + 6 * 3600
+    write(tmp_path, base_records([0, 2, 3, 4, 5]), ring)
+    assert hours(ohlcv_resample.read_resampled(tmp_path, '1h', tail=tail, now=now)) == [0, 2, 3, 4, 5]
+
+    # 补齐中间缺失的小时
+    write(tmp_path, base_records([1]), ring)
+    cached = ohlcv_resample.read_resampled(tmp_path, '1h', tail=tail, now=now)
+    assert hours(cached) == [0, 1, 2, 3, 4, 5]
+
+    ohlcv_resample.clear_cache()
+    np.testing.assert_array_equal(cached, ohlcv_resample.read_resampled(tmp_path, '1h', tail=tail, now=now))
+
+
+def test_write_log_truncated(tmp_path):
+    now = T0 + 6 * 3600
+    write(tmp_path, base_records([0, 2]), False)
+    ohlcv_resample.read_resampled(tmp_path, '1h', now=now)
+    # 缓存之后的写入次数超过写入记录的长度
+    for _ in range(kline_store.WRITE_LOG_SIZE):
+        write(tmp_path, base_records([3]), False)
+    write(tmp_path, base_records([1]), False)
+    assert kline_store.changed_since(tmp_path, 1) == (kline_store.WRITE_LOG_SIZE + 2, 0)
+    assert hours(ohlcv_resample.read_resampled(tmp_path, '1h', now=now)) == [0, 1, 2, 3]
+
+
+def test_changed_since(tmp_path):
+    write(tmp_path, base_records([3]), False)
+    write(tmp_path, base_records([1]), False)
+    write(tmp_path, base_records([4]), False)
+    assert kline_store.changed_since(tmp_path, 3) == (3, None)
+    assert kline_store.changed_since(tmp_path, 2) == (3, T0 + 4 * 3600)
+    assert kline_store.changed_since(tmp_path, 1) == (3, T0 + 3600)
+    assert kline_store.changed_since(tmp_path, None) == (3, 0)
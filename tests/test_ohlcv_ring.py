@@ -0,0 +1,108 @@
+"""
+K线共享内存环形缓冲的测试
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from utils import kline_store, ohlcv_ring
+from utils.ohlcv_ring import RECORD_DTYPE
+
+T0 = 1745193600
+STEP = 300
+CAPACITY = 8
+
+
+def records(index, close=None):
+    bars = np.zeros(len(index), dtype=RECORD_DTYPE)
+    bars['candle_begin_time'] = T0 + np.asarray(index) * STEP
+    bars['close'] = np.asarray(index, dtype=np.float64) if close is None else close
+    return bars
+
+
+def bar_index(window):
+    return list((window['candle_begin_time'] - T0) // STEP)
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ohlcv_ring, 'kline_ring_size', CAPACITY)
+    return tmp_path / 'X_ADDR'
+
+
+def test_append_and_wrap(store_dir):
+    ohlcv_ring.publish_records(store_dir, records(range(5)))
+    assert bar_index(ohlcv_ring.read_ring(store_dir)) == [0, 1, 2, 3, 4]
+    # 乱序写入也按时间追加，超过容量后只保留最近的K线
+    ohlcv_ring.publish_records(store_dir, records([7, 5, 6]))
+    ohlcv_ring.publish_records(store_dir, records(range(8, 12)))
+    window = ohlcv_ring.read_ring(store_dir)
+    assert bar_index(window) == list(range(4, 12))
+    assert list(window['close']) == list(range(4, 12))
+    assert bar_index(ohlcv_ring.read_ring(store_dir, tail=3)) == [9, 10, 11]
+
+
+def test_overwrite_in_place(store_dir):
+    ohlcv_ring.publish_records(store_dir, records(range(10)))
+    version = ohlcv_ring.data_version(store_dir)
+    # 修正窗口内的K线，比窗口起点还早的K线忽略
+    ohlcv_ring.publish_records(store_dir, records([0, 5, 9], close=[-1.0, 50.0, 90.0]))
+    window = ohlcv_ring.read_ring(store_dir)
+    assert bar_index(window) == list(range(2, 10))
+    assert list(window['close']) == [2, 3, 4, 50, 6, 7, 8, 90]
+    # 覆盖不移动cursor
+    header, _ = ohlcv_ring._open_ring(store_dir)
+    assert int(header['cursor'][0]) == CAPACITY
+    assert ohlcv_ring.data_version(store_dir) != version
+
+
+def test_missing_bar_rebuilds_from_store(store_dir):
+    index = [i for i in range(10) if i != 6]
+    kline_store.write_records(store_dir, records(index))
+    ohlcv_ring.publish_records(store_dir, records(index))
+    assert bar_index(ohlcv_ring.read_ring(store_dir)) == [1, 2, 3, 4, 5, 7, 8, 9]
+
+    # 补齐窗口中间缺失的K线时从K线存储重建窗口
+    kline_store.write_records(store_dir, records([6]))
+    ohlcv_ring.publish_records(store_dir, records([6]))
+    window = ohlcv_ring.read_ring(store_dir)
+    assert bar_index(window) == list(range(2, 10))
+    assert list(window['close']) == list(range(2, 10))
+    # 重建之后继续追加
+    ohlcv_ring.publish_records(store_dir, records([10]))
+    assert bar_index(ohlcv_ring.read_ring(store_dir)) == list(range(3, 11))
+
+
+def test_read_retries_while_writing(store_dir):
+    ohlcv_ring.publish_records(store_dir, records(range(4)))
+    header, records_view = ohlcv_ring._open_ring(store_dir, create=True)
+
+    # 模拟写入方写到一半: generation为奇数，新K线已写入但cursor还没有更新
+    header['generation'] += 1
+    records_view[4] = records([4])[0]
+    assert ohlcv_ring.read_ring(store_dir, retries=5) is None
+    assert ohlcv_ring.data_version(store_dir) is None
+
+    def finish():
+        time.sleep(0.05)
+        header['cursor'] = 5
+        header['generation'] += 1
+
+    writer = threading.Thread(target=finish)
+    writer.start()
+    window = ohlcv_ring.read_ring(store_dir, retries=100000)
+    writer.join()
+    assert bar_index(window) == [0, 1, 2, 3, 4]
+    assert int(header['generation'][0]) % 2 == 0
+
+
+def test_capacity_change_rebuilds_ring(store_dir, monkeypatch):
+    ohlcv_ring.publish_records(store_dir, records(range(6)))
+    monkeypatch.setattr(ohlcv_ring, 'kline_ring_size', CAPACITY * 2)
+    monkeypatch.setattr(ohlcv_ring, '_rings', {})
+    ohlcv_ring.publish_records(store_dir, records([6]))
+    _, records_view = ohlcv_ring._open_ring(store_dir)
+    assert len(records_view) == CAPACITY * 2
+    assert bar_index(ohlcv_ring.read_ring(store_dir)) == [6]
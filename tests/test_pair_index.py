@@ -0,0 +1,104 @@
+"""
+交易对索引过期和负缓存的测试
+"""
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from config import pair_index_config
+from utils import pair_index
+
+HOUR = 3600
+
+
+@pytest.fixture(autouse=True)
+def index_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(pair_index, 'pair_index_path', tmp_path / 'pair_index.db')
+    monkeypatch.setattr(pair_index, '_local', threading.local())
+    monkeypatch.setitem(pair_index_config, 'ttl_hours', 168)
+    monkeypatch.setitem(pair_index_config, 'negative_ttl_hours', 6)
+    return tmp_path / 'pair_index.db'
+
+
+def ago(hours):
+    return time.time() - hours * HOUR
+
+
+def test_found_pairs_expire_after_ttl():
+    pair_index.put_many('solana', [
+        {'address': 'fresh', 'pair_address': 'P1', 'pair_name': 'A/SOL', 'liquidity': 10.0},
+        {'address': 'old', 'pair_address': 'P2', 'resolved_at': ago(167)},
+        {'address': 'expired', 'pair_address': 'P3', 'resolved_at': ago(169)},
+    ])
+    assert pair_index.get_many('solana', ['fresh', 'old', 'expired', 'unknown']) == {'fresh': 'P1', 'old': 'P2'}
+
+
+def test_negative_cache():
+    pair_index.put_many('solana', [
+        {'address': 'none', 'pair_address': None},
+        {'address': 'empty', 'pair_address': ''},
+        {'address': 'stale', 'pair_address': None, 'resolved_at': ago(7)},
+    ])
+    # 没有找到交易对的代币返回None，表示不需要再查询；过期后按不存在处理
+    assert pair_index.get_many('solana', ['none', 'empty', 'stale']) == {'none': None, 'empty': None}
+
+
+def test_ttl_follows_config(monkeypatch):
+    pair_index.put_many('solana', [{'address': 'a', 'pair_address': 'P', 'resolved_at': ago(2)},
+                                   {'address': 'b', 'pair_address': None, 'resolved_at': ago(2)}])
+    monkeypatch.setitem(pair_index_config, 'ttl_hours', 1)
+    monkeypatch.setitem(pair_index_config, 'negative_ttl_hours', 1)
+    assert pair_index.get_many('solana', ['a', 'b']) == {}
+
+
+def test_replace_and_only_missing():
+    pair_index.put_many('solana', [{'address': 'a', 'pair_address': None, 'resolved_at': ago(7)}])
+    # 从旧数据导入时不覆盖已有的记录
+    pair_index.put_many('solana', [{'address': 'a', 'pair_address': 'OLD'}, {'address': 'b', 'pair_address': 'B'}], only_missing=True)
+    assert pair_index.get_many('solana', ['a', 'b']) == {'b': 'B'}
+    # 重新查询的结果覆盖过期的负缓存
+    pair_index.put_many('solana', [{'address': 'a', 'pair_address': 'NEW'}])
+    assert pair_index.get_many('solana', ['a', 'b']) == {'a': 'NEW', 'b': 'B'}
+
+
+def test_chains_and_batches_are_separate():
+    addresses = [f'token{i}' for i in range(pair_index.BATCH_SIZE * 2 + 7)]
+    pair_index.put_many('solana', [{'address': address, 'pair_address': f'S{address}'} for address in addresses])
+    pair_index.put_many('bsc', [{'address': addresses[0], 'pair_address': 'BSC'}])
+    result = pair_index.get_many('solana', addresses + addresses[:3])
+    assert result == {address: f'S{address}' for address in addresses}
+    assert pair_index.get_many('bsc', addresses) == {addresses[0]: 'BSC'}
+
+
+def test_threads_use_own_connections(index_db):
+    pair_index.put_many('solana', [{'address': 'a', 'pair_address': 'P'}])
+    results = []
+    thread = threading.Thread(target=lambda: results.append(pair_index.get_many('solana', ['a'])))
+    thread.start()
+    thread.join()
+    assert results == [{'a': 'P'}]
+    assert index_db.exists()
+
+
+def test_fetcher_skips_negative_cache(monkeypatch):
+    pytest.importorskip('curl_cffi')
+    from talons import klines_fetcher
+
+    calls = []
+
+    def fetch_pair_addresses(chain_name, addresses):
+        calls.append(list(addresses))
+        return [{'address': address, 'pair_address': None if address == 'nope' else f'P{address}'} for address in addresses]
+
+    monkeypatch.setattr(klines_fetcher, 'fetch_pair_addresses', fetch_pair_addresses)
+    monkeypatch.setattr(klines_fetcher, 'prefetch_pair_addresses', lambda chain_name, addresses: {})
+    monkeypatch.setattr(klines_fetcher, 'save_active_pool', lambda account_id, df: None)
+    pool = pd.DataFrame({'address': ['a', 'nope', 'c'], 'pair_address': [None, None, 'Pc'], 'symbol': ['A', 'N', 'C']})
+
+    for _ in range(2):
+        updated = klines_fetcher.update_active_pool_pair_address('solana', 'acc', pool)
+        assert updated['pair_address'].tolist()[::2] == ['Pa', 'Pc'] and pd.isna(updated['pair_address'][1])
+    # 第二次全部来自索引，没有找到交易对的代币也不再查询
+    assert calls == [['a', 'nope']]
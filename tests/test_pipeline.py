@@ -0,0 +1,52 @@
+"""
+talons流水线K线获取阶段的测试
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('curl_cffi')
+
+from talons import pipeline, klines_fetcher  # noqa: E402
+
+
+class FakeClient:
+    """
+    第二个代币提交失败，其余代币的下载立即完成
+    """
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, coro):
+        self.submitted += 1
+        coro.close()
+        if self.submitted == 2:
+            raise RuntimeError('event loop closed')
+        future = Future()
+        future.set_result(True)
+        return future
+
+
+def test_failed_submit_is_not_counted(tmp_path, monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(pipeline, 'klines_path', tmp_path)
+    monkeypatch.setattr(klines_fetcher, 'get_cmc_client', lambda: client)
+    monkeypatch.setattr(klines_fetcher, 'quote_targets', {})
+    monkeypatch.setattr(pipeline, 'run_with_budget', lambda chain_name, coro: coro)
+    kline_queue = queue.Queue(maxsize=1)
+    result_queue = queue.Queue()
+    # 同时下载的数量为1，提交失败时没有释放名额会一直等待
+    worker = threading.Thread(target=pipeline._kline_worker, args=('solana', kline_queue, result_queue, 1), daemon=True)
+    worker.start()
+    for i in range(3):
+        kline_queue.put({'address': f'ADDR{i}', 'symbol': f'T{i}', 'pair_address': f'PAIR{i}'}, timeout=5)
+    kline_queue.put(pipeline._DONE, timeout=5)
+    worker.join(timeout=5)
+    assert not worker.is_alive()
+
+    items = [result_queue.get_nowait() for _ in range(result_queue.qsize())]
+    assert [(kind, value[0]['address']) for kind, _, value in items[:-1]] == [('result', 'ADDR0'), ('result', 'ADDR2')]
+    assert items[-1] == ('chain_done', 'solana', 2)
+    assert set(klines_fetcher.quote_targets['solana']) == {'PAIR0', 'PAIR2'}
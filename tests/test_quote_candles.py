@@ -0,0 +1,139 @@
+"""
+报价采样合成K线和定期校正的测试
+"""
+import numpy as np
+import pytest
+
+from config import quote_candle_config
+from talons import fetch_planner, quote_candles
+from utils import kline_store, ohlcv_ring
+from utils.ohlcv_ring import RECORD_DTYPE
+
+STEP = 300
+SLOT = 1745222400
+HISTORY = 20
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    """
+    已经初始化的代币: 当前周期之前的HISTORY根K线，收盘价为5，已经校正过
+    """
+    monkeypatch.setattr(quote_candles, '_bars', {})
+    monkeypatch.setitem(quote_candle_config, 'reconcile_minutes', 60)
+    monkeypatch.setitem(quote_candle_config, 'reconcile_count', 1)
+    store_dir = tmp_path / 'X_ADDR'
+    history = np.zeros(HISTORY, dtype=RECORD_DTYPE)
+    history['candle_begin_time'] = SLOT - STEP * np.arange(HISTORY, 0, -1)
+    history['open'] = history['high'] = history['low'] = history['close'] = 5.0
+    kline_store.write_records(store_dir, history, {'symbol': 'X'})
+    ohlcv_ring.publish_records(store_dir, history)
+    kline_store.update_meta(store_dir, {'fetched_at': SLOT, 'reconciled_at': SLOT})
+    return store_dir
+
+
+def sample(store_dir, quotes, now):
+    return quote_candles.update_bars({'PAIR': store_dir}, {'PAIR': quote for quote in quotes}, now)
+
+
+def test_parse_pair_quotes():
+    result = {'data': [
+        {'contract_address': 'A', 'quote': [{'price': 1.5, 'volume_24h': 100}]},
+        {'contract_address': 'B', 'quote': {'price': '2', 'volume_24h': None}},
+        {'contract_address': 'C', 'quote': [{'price': None}]},
+        {'contract_address': 'D', 'quote': []},
+    ]}
+    assert quote_candles.parse_pair_quotes(result) == {'A': (1.5, 100.0), 'B': (2.0, 0.0)}
+    assert quote_candles.parse_pair_quotes(None) == {}
+
+
+def test_samples_aggregate_into_bar(store_dir):
+    for i, quote in enumerate([(5.5, 100.0), (6.0, 110.0), (4.0, 130.0), (4.5, 150.0)]):
+        assert sample(store_dir, [quote], SLOT + 10 + i * 60) == []
+    # 没有索引的交易对忽略
+    assert quote_candles.update_bars({'PAIR': store_dir}, {'OTHER': (1.0, 1.0)}, SLOT + 280) == []
+    assert quote_candles.close_bars(SLOT + STEP - 1) == []
+
+    closed = quote_candles.close_bars(SLOT + STEP)
+    assert len(closed) == 1
+    record = closed[0][1][0]
+    # 开盘价为共享内存中上一根K线的收盘价，成交量为24小时成交量的增加量
+    assert record['candle_begin_time'] == SLOT
+    assert (record['open'], record['high'], record['low'], record['close'], record['volume']) == (5.0, 6.0, 4.0, 4.5, 50.0)
+    # 已经收盘的K线不会重复收盘
+    assert quote_candles.close_bars(SLOT + 2 * STEP) == []
+
+    assert quote_candles.save_bars(closed, now=SLOT + STEP) == 1
+    assert ohlcv_ring.read_ring(store_dir, tail=1)[0] == record
+    assert kline_store.read_klines(store_dir)['close'].iloc[-1] == 4.5
+    assert kline_store.load_meta(store_dir)['fetched_at'] == SLOT + STEP
+
+
+def test_next_bar_opens_at_previous_close(store_dir):
+    sample(store_dir, [(5.5, 100.0)], SLOT + 10)
+    sample(store_dir, [(4.5, 200.0)], SLOT + 200)
+    # 进入新周期时先收盘上一根K线
+    closed = sample(store_dir, [(4.8, 150.0)], SLOT + STEP + 5)
+    assert [(record['candle_begin_time'][0], record['close'][0], record['volume'][0]) for _, record in closed] == [(SLOT, 4.5, 100.0)]
+    closed = quote_candles.close_bars(SLOT + 2 * STEP)
+    record = closed[0][1][0]
+    # 24小时成交量减少时成交量为0
+    assert (record['open'], record['high'], record['low'], record['close'], record['volume']) == (4.5, 4.8, 4.5, 4.8, 0.0)
+
+    # 中间有周期没有采样时，开盘价为第一次采样的价格
+    sample(store_dir, [(7.0, 150.0)], SLOT + 3 * STEP + 5)
+    record = quote_candles.close_bars(SLOT + 4 * STEP)[0][1][0]
+    assert record['candle_begin_time'] == SLOT + 3 * STEP and record['open'] == 7.0
+
+
+def test_uninitialized_store_is_not_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(quote_candles, '_bars', {})
+    store_dir = tmp_path / 'NEW_ADDR'
+    sample(store_dir, [(1.0, 1.0)], SLOT + 10)
+    closed = quote_candles.close_bars(SLOT + STEP)
+    quote_candles.save_bars(closed, now=SLOT + STEP)
+    assert kline_store.load_meta(store_dir) == {}
+    assert ohlcv_ring.read_ring(store_dir) is None
+
+
+def test_plan_fetch_with_reconcile(store_dir, monkeypatch):
+    sample(store_dir, [(5.5, 100.0)], SLOT + 10)
+    quote_candles.save_bars(quote_candles.close_bars(SLOT + STEP), now=SLOT + STEP)
+    # 合成的K线不需要再通过OHLCV获取，当前周期由报价合成
+    now = SLOT + STEP + 10
+    assert quote_candles.plan_fetch(store_dir, now=now) == []
+    assert fetch_planner.plan_fetch(store_dir, now=now) == [(SLOT + STEP, SLOT + STEP)]
+
+    # 超过reconcile_minutes后用接口K线覆盖最近reconcile_count根
+    monkeypatch.setitem(quote_candle_config, 'reconcile_count', 3)
+    now = SLOT + 3600 + 10
+    last_closed = fetch_planner.current_slot(STEP, now) - STEP
+    quote_candles.save_bars([(store_dir, quote_candles._close({
+        'time': t, 'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume_start': 0.0, 'volume_last': 0.0,
+    })) for t in range(SLOT + STEP, last_closed + 1, STEP)], now=now)
+    assert quote_candles.plan_fetch(store_dir, now=now) == [(last_closed - 2 * STEP, last_closed)]
+    assert kline_store.load_meta(store_dir)['reconciled_at'] == now
+    # 校正之后到下一次校正之前不再请求
+    assert quote_candles.plan_fetch(store_dir, now=now + 60) == []
+
+
+def test_plan_fetch_gap_and_reconcile_merge(store_dir, monkeypatch):
+    now = SLOT + 3 * STEP + 10
+    # 采样没有覆盖的已收盘周期需要获取
+    assert quote_candles.plan_fetch(store_dir, now=now) == [(SLOT, SLOT + 2 * STEP)]
+
+    # 缺口和校正的K线相邻时合并成一个区间
+    closed = []
+    for t in (SLOT + STEP, SLOT + 2 * STEP):
+        closed += sample(store_dir, [(6.0, 1.0)], t + 10)
+    quote_candles.save_bars(closed + quote_candles.close_bars(now), now=now)
+    assert quote_candles.plan_fetch(store_dir, now=now) == [(SLOT, SLOT)]
+    monkeypatch.setitem(quote_candle_config, 'reconcile_count', 2)
+    kline_store.update_meta(store_dir, {'reconciled_at': 0})
+    assert quote_candles.plan_fetch(store_dir, now=now) == [(SLOT, SLOT + 2 * STEP)]
+
+
+def test_reconcile_disabled(store_dir, monkeypatch):
+    monkeypatch.setitem(quote_candle_config, 'reconcile_minutes', 0)
+    kline_store.update_meta(store_dir, {'reconciled_at': 0})
+    assert quote_candles.plan_fetch(store_dir, now=SLOT + 10) == []
@@ -0,0 +1,74 @@
+"""
+多进程共用速率限制的测试，两个独立的进程通过同一个状态文件取令牌
+"""
+import multiprocessing
+import time
+
+import numpy as np
+
+from utils import rate_limiter
+
+KEYS = ['key-a', 'key-b']
+LIMITS = {'per_minute': 600, 'per_month': 990000, 'burst': 5}
+RATE = (LIMITS['per_minute'] - LIMITS['burst']) / 60
+
+
+def acquire_until(state_file, keys, limits, start_at, duration):
+    """
+    子进程: 从start_at开始尽快取令牌，直到duration秒后或月度额度用完
+    Returns: 取到令牌的 (时间, 密钥) 列表
+    """
+    acquired = []
+    time.sleep(max(start_at - time.time(), 0))
+    while time.time() < start_at + duration:
+        api_key, wait = rate_limiter.try_acquire(state_file, keys, limits)
+        if api_key is not None:
+            acquired.append((time.time(), api_key))
+        elif wait is None:
+            break
+        else:
+            time.sleep(min(wait, 0.005))
+    return acquired
+
+
+def run_processes(state_file, keys, limits, duration):
+    context = multiprocessing.get_context('spawn')
+    # 等两个进程都启动之后同时开始
+    start_at = time.time() + 3
+    with context.Pool(2) as pool:
+        results = pool.starmap(acquire_until, [(str(state_file), keys, limits, start_at, duration)] * 2)
+    return results
+
+
+def test_two_processes_share_per_minute_bound(tmp_path):
+    state_file = tmp_path / 'rate_limit.bin'
+    duration = 1.5
+    results = run_processes(state_file, KEYS[:1], LIMITS, duration)
+    times = np.sort([acquired_time for result in results for acquired_time, _ in result])
+
+    # 每个进程单独计数时总数会接近两倍
+    assert len(times) <= LIMITS['burst'] + RATE * duration + 1
+    assert len(times) >= LIMITS['burst'] + RATE * duration * 0.5
+    # 任意时间段内的调用不超过桶容量加上这段时间补充的令牌
+    for i in range(len(times)):
+        count = np.arange(1, len(times) - i + 1)
+        assert np.all(count <= LIMITS['burst'] + RATE * (times[i:] - times[i]) + 1)
+
+    credits = rate_limiter.monthly_credits(state_file, KEYS[:1])
+    assert credits == {KEYS[0]: len(times)}
+
+
+def test_two_processes_share_monthly_credits(tmp_path):
+    state_file = tmp_path / 'rate_limit.bin'
+    limits = {'per_minute': 6000, 'per_month': 7, 'burst': 100}
+    # 这个进程已经用掉了第一个密钥的3个credit，预占的1个加上差额2
+    assert rate_limiter.try_acquire(state_file, KEYS, limits) == (KEYS[0], 0)
+    rate_limiter.add_credits(state_file, KEYS[0], 2)
+
+    results = run_processes(state_file, KEYS, limits, 5)
+    keys = [api_key for result in results for _, api_key in result]
+    # 第一个密钥还剩4个，用完后切换到第二个密钥，两个密钥都用完后停止
+    assert keys.count(KEYS[0]) == 4
+    assert keys.count(KEYS[1]) == 7
+    assert rate_limiter.monthly_credits(state_file, KEYS) == {KEYS[0]: 7, KEYS[1]: 7}
+    assert rate_limiter.try_acquire(state_file, KEYS, limits) == (None, None)
@@ -0,0 +1,97 @@
+"""
+信号缓存命中和失效的测试
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import signal_config
+from hunter import signal_cache
+from utils import kline_store, ohlcv_ring
+from utils.ohlcv_ring import RECORD_DTYPE
+
+T0 = 1745193600
+STEP = 300
+TOKEN = {'symbol': 'X', 'address': 'ADDR', 'pair_address': 'PAIR'}
+
+
+def records(index, close=1.0):
+    bars = np.zeros(len(index), dtype=RECORD_DTYPE)
+    bars['candle_begin_time'] = T0 + np.asarray(index) * STEP
+    bars['close'] = close
+    return bars
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(kline_store, 'klines_path', tmp_path)
+    monkeypatch.setattr(signal_cache, '_cache', OrderedDict())
+    monkeypatch.setattr(signal_cache, '_stats', {'hits': 0, 'misses': 0, 'invalidations': 0})
+
+
+def test_cache_key_prefers_pair_address():
+    assert signal_cache.cache_key(TOKEN, 'sma', [5, 20]) == ('PAIR', 'sma', (5, 20))
+    for pair_address in (None, '', np.nan):
+        assert signal_cache.cache_key({**TOKEN, 'pair_address': pair_address}, 'sma', [5, 20]) == ('ADDR', 'sma', (5, 20))
+
+
+def test_hit_miss_and_invalidation():
+    key = signal_cache.cache_key(TOKEN, 'sma', (5, 20))
+    df = pd.DataFrame({'signal': [1.0]})
+    assert signal_cache.get(key, ('store', 1, T0)) is None
+    signal_cache.put(key, ('store', 1, T0), df)
+    assert signal_cache.get(key, ('store', 1, T0)) is df
+    # 版本变化时缓存失效并被删除
+    assert signal_cache.get(key, ('store', 2, T0 + STEP)) is None
+    assert signal_cache.get(key, ('store', 1, T0)) is None
+    assert signal_cache.get_stats() == {'hits': 1, 'misses': 3, 'invalidations': 1, 'size': 0}
+
+
+def test_unknown_version_is_not_cached():
+    key = signal_cache.cache_key(TOKEN, 'sma', (5, 20))
+    signal_cache.put(key, None, pd.DataFrame())
+    assert signal_cache.get_stats()['size'] == 0
+    signal_cache.put(key, ('store', 1, T0), pd.DataFrame())
+    # 正在写入时版本为None，不使用缓存
+    assert signal_cache.get(key, None) is None
+    assert signal_cache.get_stats()['misses'] == 1
+
+
+def test_least_recently_used_evicted(monkeypatch):
+    monkeypatch.setitem(signal_config, 'cache_size', 2)
+    version = ('store', 1, T0)
+    for name in ('a', 'b'):
+        signal_cache.put((name, 'sma', ()), version, pd.DataFrame())
+    # 访问a之后b是最久未使用的
+    signal_cache.get(('a', 'sma', ()), version)
+    signal_cache.put(('c', 'sma', ()), version, pd.DataFrame())
+    assert list(signal_cache._cache) == [('a', 'sma', ()), ('c', 'sma', ())]
+
+
+@pytest.mark.parametrize('ring', [False, True], ids=['store', 'ring'])
+def test_lookup_groups_follows_data_version(ring):
+    store_dir = kline_store.get_store_dir('solana', 'X', 'ADDR')
+
+    def write(bars):
+        kline_store.write_records(store_dir, bars)
+        if ring:
+            ohlcv_ring.publish_records(store_dir, bars)
+
+    write(records(range(10)))
+    groups = [('sma', (5, 20), [TOKEN]), ('bolling', (20, 2), [TOKEN])]
+    frames, missed = signal_cache.lookup_groups(groups, 'solana')
+    assert frames == [[], []] and len(missed) == 2
+    for i, token_info, key, version in missed:
+        assert version == ohlcv_ring.data_version(store_dir)
+        signal_cache.put(key, version, pd.DataFrame({'group': [i]}))
+
+    frames, missed = signal_cache.lookup_groups(groups, 'solana')
+    assert [list(frame[0]['group']) for frame in frames] == [[0], [1]] and missed == []
+
+    # 改写最后一根K线也会改变版本
+    write(records([9], close=2.0))
+    frames, missed = signal_cache.lookup_groups(groups, 'solana')
+    assert frames == [[], []] and len(missed) == 2
+    assert signal_cache.get_stats()['invalidations'] == 2
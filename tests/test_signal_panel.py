@@ -0,0 +1,125 @@
+"""
+信号面板和逐个代币计算的一致性测试
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from hunter import signal_cache, signal_panel
+from signals import registry
+from utils import kline_store, ohlcv_resample, ohlcv_ring
+from utils.ohlcv_ring import RECORD_DTYPE
+
+T0 = 1745193600
+STEP = 300
+# 不同长度的K线，较短的代币只有部分窗口，1500根的代币中间缺失一段
+LENGTHS = [8, 30, 120, 600, 1500]
+# 最后HOLD根K线逐根写入，模拟每个周期新增的K线
+HOLD = 16
+SPEC = {'params': ['n'], 'timeframe': '15m', 'entry': 'cross_up(close, sma(close, n))', 'exit': 'cross_down(close, sma(close, n))'}
+
+
+def write(token_info, bars):
+    store_dir = kline_store.get_store_dir('solana', token_info['symbol'], token_info['address'])
+    kline_store.write_records(store_dir, bars)
+    if token_info['ring']:
+        ohlcv_ring.publish_records(store_dir, bars)
+
+
+@pytest.fixture
+def tokens(tmp_path, monkeypatch):
+    monkeypatch.setattr(kline_store, 'klines_path', tmp_path)
+    monkeypatch.setattr(signal_cache, '_cache', OrderedDict())
+    monkeypatch.setattr(signal_cache, '_stats', {'hits': 0, 'misses': 0, 'invalidations': 0})
+    monkeypatch.setitem(registry.signal_expressions, 'sma_15m', SPEC)
+    monkeypatch.setattr(registry, '_strategies', {})
+    ohlcv_resample.clear_cache()
+
+    rng = np.random.default_rng(4)
+    token_infos = []
+    for i, length in enumerate(LENGTHS):
+        # 一位小数的收盘价，均线经常相等
+        closes = np.round(20 + np.cumsum(rng.normal(0, 0.3, length)), 1)
+        bars = np.zeros(length, dtype=RECORD_DTYPE)
+        bars['candle_begin_time'] = T0 + STEP * np.arange(length)
+        bars['open'] = bars['high'] = bars['low'] = bars['close'] = closes
+        bars['volume'] = 1.0
+        if length == 1500:
+            bars = bars[(np.arange(length) < 700) | (np.arange(length) >= 760)]
+        # 一半代币同时发布到共享内存
+        token_info = {'symbol': f'T{i}', 'address': f'ADDR{i}', 'pair_address': f'PAIR{i}', 'ring': bool(i % 2), 'bars': bars}
+        write(token_info, bars[:max(len(bars) - HOLD, 1)])
+        token_infos.append(token_info)
+    # 没有K线的代币不在结果中
+    token_infos.append({'symbol': 'EMPTY', 'address': 'ADDR_EMPTY', 'pair_address': 'PAIR_EMPTY', 'ring': False, 'bars': None})
+    yield token_infos
+    ohlcv_resample.clear_cache()
+
+
+def cycles(token_infos):
+    """
+    每个周期给K线还没有写完的代币追加一根K线
+    """
+    for step in range(HOLD):
+        for token_info in token_infos[:-1]:
+            bars = token_info['bars']
+            position = len(bars) - HOLD + step
+            if position >= 1:
+                write(token_info, bars[position:position + 1])
+        yield step
+
+
+def full_history(signal_name, params, token_info):
+    """
+    全部历史K线逐个代币计算的最后一根K线
+    """
+    store_dir = kline_store.get_store_dir('solana', token_info['symbol'], token_info['address'])
+    timeframe = registry.get_timeframe(signal_name)
+    if ohlcv_resample.is_base(timeframe):
+        df = kline_store.read_klines(store_dir)
+    else:
+        df = ohlcv_ring.to_dataframe(ohlcv_resample.read_resampled(store_dir, timeframe))
+    if df.empty:
+        return None
+    return registry.get_strategy(signal_name).signal(df, *params).iloc[-1]
+
+
+def assert_matches_full(groups, results):
+    """
+    Returns: 非空信号的数量
+    """
+    signals = 0
+    for (signal_name, params, token_infos), df in zip(groups, results):
+        assert list(df['address']) == [token_info['address'] for token_info in token_infos[:-1]]
+        for token_info, (_, row) in zip(token_infos, df.iterrows()):
+            expected = full_history(signal_name, params, token_info)
+            assert row['candle_begin_time'] == expected['candle_begin_time']
+            assert row['close'] == expected['close']
+            assert np.isnan(row['signal']) and np.isnan(expected['signal']) or row['signal'] == expected['signal']
+            assert row['pair_address'] == token_info['pair_address']
+            signals += not np.isnan(row['signal'])
+    return signals
+
+
+@pytest.mark.parametrize('signal_name, params', [
+    ('sma', (5, 20)),
+    ('sma', (3, 60)),
+    ('bolling', (20, 2)),
+    ('bolling', (10, 1)),
+    ('sma_15m', (4,)),
+])
+def test_panel_matches_per_token(tokens, signal_name, params):
+    groups = [(signal_name, params, tokens)]
+    signals = sum(assert_matches_full(groups, signal_panel.panel_signals(groups, 'solana')) for _ in cycles(tokens))
+    assert signals > 0
+
+
+def test_groups_share_panel_and_cache(tokens):
+    groups = [('sma', (5, 20), tokens), ('bolling', (20, 2), tokens), ('sma_15m', (4,), tokens)]
+    for _ in cycles(tokens):
+        assert_matches_full(groups, signal_panel.panel_signals(groups, 'solana'))
+    # K线没有变化时全部命中缓存，结果不变
+    hits = signal_cache.get_stats()['hits']
+    assert_matches_full(groups, signal_panel.panel_signals(groups, 'solana'))
+    assert signal_cache.get_stats()['hits'] - hits == 3 * (len(tokens) - 1)
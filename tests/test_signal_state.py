@@ -0,0 +1,89 @@
+"""
+增量信号状态的测试
+"""
+import numpy as np
+import pytest
+
+from hunter import signal_state
+from signals import sma
+from utils import kline_store
+from utils.ohlcv_ring import RECORD_DTYPE
+
+T0 = 1745193600
+STEP = 300
+PARAMS = [5, 3]
+
+
+def records(index, closes):
+    bars = np.zeros(len(index), dtype=RECORD_DTYPE)
+    bars['candle_begin_time'] = T0 + np.asarray(index) * STEP
+    bars['open'] = bars['high'] = bars['low'] = bars['close'] = closes
+    bars['volume'] = 1.0
+    return bars
+
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(signal_state, 'signal_state_path', tmp_path / 'state')
+    monkeypatch.setattr(signal_state, '_states', {})
+    monkeypatch.setattr(signal_state, '_dirty', set())
+    return tmp_path
+
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    calls = []
+    rebuild = signal_state._rebuild_state
+
+    def counted(*args):
+        calls.append(args)
+        return rebuild(*args)
+
+    monkeypatch.setattr(signal_state, '_rebuild_state', counted)
+    return calls
+
+
+def incremental(store_dir):
+    token_info = {'address': 'ADDR', 'symbol': 'X'}
+    df = signal_state.incremental_signal(token_info, 'solana', 'sma', PARAMS, sma, store_dir)
+    return signal_state._states[str(signal_state._state_file('solana', 'sma', PARAMS))]['ADDR'], df
+
+
+def assert_matches_full(store_dir, state):
+    full = sma.signal(kline_store.read_klines(store_dir), *PARAMS).iloc[-1]
+    for col in sma.INDICATOR_COLUMNS:
+        assert state['strategy'][col] == pytest.approx(full[col], rel=1e-12)
+
+
+def test_append_is_incremental(state_dir, rebuilds):
+    store_dir = state_dir / 'X_ADDR'
+    closes = 80 + np.cumsum(np.random.default_rng(1).normal(0, 1, 60))
+    kline_store.write_records(store_dir, records(np.arange(50), closes[:50]))
+    incremental(store_dir)
+    for i in range(50, 60):
+        kline_store.write_records(store_dir, records([i], closes[i:i + 1]))
+        state, _ = incremental(store_dir)
+    assert len(rebuilds) == 1
+    assert state['last_time'] == T0 + 59 * STEP
+    assert_matches_full(store_dir, state)
+
+
+@pytest.mark.parametrize('rewrite', ['backfill', 'correct'])
+def test_earlier_write_rebuilds_state(state_dir, rebuilds, rewrite):
+    store_dir = state_dir / 'X_ADDR'
+    closes = 80 + np.cumsum(np.random.default_rng(2).normal(0, 1, 40))
+    index = np.arange(40)
+    kept = index != 36 if rewrite == 'backfill' else np.ones(40, dtype=bool)
+    kline_store.write_records(store_dir, records(index[kept], closes[kept]))
+    incremental(store_dir)
+
+    # 补齐4根之前缺失的K线，或者修正4根之前的K线，最后一根K线不变
+    close = closes[36] if rewrite == 'backfill' else closes[36] + 5
+    kline_store.write_records(store_dir, records([36], [close]))
+    state, _ = incremental(store_dir)
+    assert len(rebuilds) == 2
+    assert_matches_full(store_dir, state)
+
+    # 没有新的写入时不再重建
+    incremental(store_dir)
+    assert len(rebuilds) == 2
@@ -0,0 +1,63 @@
+"""
+信号worker计算的测试，在当前进程中直接调用worker的计算函数
+"""
+import numpy as np
+import pytest
+
+from hunter import signal_workers
+from signals import registry
+from utils import kline_store
+from utils.ohlcv_ring import RECORD_DTYPE
+
+T0 = 1745193600
+SPEC = {
+    'params': ['n'],
+    'entry': 'cross_up(close, sma(high, n))',
+    'exit': 'cross_down(close, sma(low, n)) or volume > 1000',
+}
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(kline_store, 'klines_path', tmp_path)
+    monkeypatch.setitem(registry.signal_expressions, 'hl_channel', SPEC)
+    monkeypatch.setattr(registry, '_strategies', {})
+    monkeypatch.setattr(signal_workers, '_tails', {})
+    rng = np.random.default_rng(3)
+    tokens = []
+    for i in range(3):
+        closes = 50 + np.cumsum(rng.normal(0, 1, 300))
+        bars = np.zeros(len(closes), dtype=RECORD_DTYPE)
+        bars['candle_begin_time'] = T0 + 300 * np.arange(len(closes))
+        bars['close'] = closes
+        bars['open'] = np.r_[closes[0], closes[:-1]]
+        bars['high'] = np.maximum(bars['open'], closes) + rng.random(len(closes))
+        bars['low'] = np.minimum(bars['open'], closes) - rng.random(len(closes))
+        bars['volume'] = rng.random(len(closes)) * 1100
+        kline_store.write_records(kline_store.get_store_dir('solana', f'T{i}', f'ADDR{i}'), bars)
+        tokens.append((i, f'T{i}', f'ADDR{i}'))
+    return tokens
+
+
+def test_batch_uses_all_ohlcv_columns(stores):
+    registry.load_strategy('hl_channel')
+    index, last_times, closes, signals = signal_workers.compute_batch('solana', 'hl_channel', (10,), stores)
+    assert list(index) == [0, 1, 2]
+    strategy = registry.get_strategy('hl_channel')
+    for position, symbol, address in stores:
+        # 全部历史K线计算的最后一根K线
+        df = strategy.signal(kline_store.read_klines(kline_store.get_store_dir('solana', symbol, address)), 10)
+        row = df.iloc[-1]
+        assert last_times[position] == row['candle_begin_time'].timestamp()
+        assert closes[position] == row['close']
+        assert signals[position] == (0 if np.isnan(row['signal']) else row['signal'])
+
+
+def test_main_process_fallback_skips_failing_batch(stores, monkeypatch):
+    registry.load_strategy('hl_channel')
+
+    def broken(*args):
+        raise KeyError('turnover')
+
+    monkeypatch.setattr(signal_workers, 'compute_batch', broken)
+    assert signal_workers._compute_in_main((1, 'solana', 'hl_channel', (10,), stores)) is None
@@ -0,0 +1,123 @@
+"""
+API使用量账本的崩溃恢复和合并测试
+"""
+import multiprocessing
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from utils import usage_ledger
+
+MONTH = usage_ledger._current_month()
+
+
+@pytest.fixture(autouse=True)
+def empty_pending(monkeypatch):
+    monkeypatch.setattr(usage_ledger, '_pending', {})
+    monkeypatch.setattr(usage_ledger, '_last_flush', [0.0])
+
+
+def log_file(ledger_dir):
+    _, log_id = usage_ledger._read_snapshot(ledger_dir, MONTH)
+    return usage_ledger._log_file(ledger_dir, MONTH, log_id)
+
+
+def test_record_accumulates_until_flush(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_ledger, 'FLUSH_INTERVAL', 3600)
+    # 上次写入是很久之前，第一次记录就需要写入，之后由调用方写入前不再重复提示
+    assert usage_ledger.record(tmp_path, 'k1', 3) is True
+    assert usage_ledger.record(tmp_path, 'k1', 2) is False
+    assert usage_ledger.record(tmp_path, 'k2', 1) is False
+    assert not log_file(tmp_path).exists()
+    # 还没写入的部分也计入总量
+    assert usage_ledger.load_totals(tmp_path) == {'k1': 5, 'k2': 1}
+
+    usage_ledger.flush()
+    assert log_file(tmp_path).read_text() == 'k1,5;\nk2,1;\n'
+    assert usage_ledger.load_totals(tmp_path) == {'k1': 5, 'k2': 1}
+
+
+def test_partial_line_from_crash_is_ignored(tmp_path):
+    usage_ledger.record(tmp_path, 'k1', 4)
+    usage_ledger.flush()
+    # 崩溃时写了一半的行
+    with open(log_file(tmp_path), 'a') as f:
+        f.write('k1,99')
+    assert usage_ledger.load_totals(tmp_path) == {'k1': 4}
+
+    usage_ledger.record(tmp_path, 'k1', 6)
+    usage_ledger.flush()
+    assert log_file(tmp_path).read_text() == 'k1,4;\nk1,99\nk1,6;\n'
+    assert usage_ledger.load_totals(tmp_path) == {'k1': 10}
+
+
+def test_compaction_on_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_ledger, 'LOG_MAX_BYTES', 40)
+    for credits in range(1, 8):
+        usage_ledger.record(tmp_path, 'k1', credits)
+        usage_ledger.record(tmp_path, 'k2', 1)
+        usage_ledger.flush()
+    snapshot, log_id = usage_ledger._read_snapshot(tmp_path, MONTH)
+    assert log_id > 0
+    # 旧日志合并后删除，只剩当前的日志
+    assert sorted(path.name for path in tmp_path.glob('*.log')) == [usage_ledger._log_file(tmp_path, MONTH, log_id).name]
+    assert log_file(tmp_path).stat().st_size <= 40
+    assert usage_ledger.load_totals(tmp_path) == {'k1': 28, 'k2': 7}
+
+
+def test_crash_after_snapshot_is_not_double_counted(tmp_path):
+    usage_ledger.record(tmp_path, 'k1', 10)
+    usage_ledger.flush()
+    old_log = log_file(tmp_path)
+    kept = tmp_path / 'kept'
+    shutil.copy(old_log, kept)
+
+    usage_ledger.compact(tmp_path)
+    assert not old_log.exists()
+    assert usage_ledger._read_snapshot(tmp_path, MONTH) == ({'k1': 10}, 1)
+    # 写完新快照后、删除旧日志前崩溃
+    shutil.copy(kept, old_log)
+    assert usage_ledger.load_totals(tmp_path) == {'k1': 10}
+
+    usage_ledger.record(tmp_path, 'k1', 1)
+    usage_ledger.compact(tmp_path)
+    assert usage_ledger.load_totals(tmp_path) == {'k1': 11}
+
+
+def test_legacy_snapshot_without_log_id(tmp_path):
+    pd.DataFrame({'api_key': ['k1'], 'monthly_credits': [100]}).to_csv(usage_ledger._snapshot_file(tmp_path, MONTH), index=False)
+    usage_ledger.record(tmp_path, 'k1', 5)
+    usage_ledger.flush()
+    assert usage_ledger.load_totals(tmp_path) == {'k1': 105}
+    usage_ledger.compact(tmp_path)
+    assert usage_ledger._read_snapshot(tmp_path, MONTH) == ({'k1': 105}, 1)
+
+
+def write_and_crash(ledger_dir, count):
+    """
+    子进程: 写入count批后，内存中还有没写入的credit时直接退出，不执行atexit
+    """
+    usage_ledger.FLUSH_INTERVAL = 0
+    usage_ledger.LOG_MAX_BYTES = 300
+    for _ in range(count):
+        usage_ledger.record(ledger_dir, 'k1', 3)
+        if usage_ledger.record(ledger_dir, 'k2', 1):
+            usage_ledger.flush()
+    usage_ledger.flush()
+    usage_ledger.record(ledger_dir, 'k1', 1000)
+    os._exit(0)
+
+
+def test_concurrent_writers_and_crash(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=write_and_crash, args=(str(tmp_path), 200)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    # 多个进程同时追加和合并不会丢失或重复，崩溃时没写入的部分只会少算
+    assert usage_ledger.load_totals(str(tmp_path)) == {'k1': 1800, 'k2': 600}
+    assert usage_ledger._read_snapshot(str(tmp_path), MONTH)[1] > 0
@@ -2,15 +2,25 @@
 通用工具函数模块
 """
 import time
+import asyncio
 from datetime import datetime, timedelta
 import pandas as pd
 import requests
 import json
 import traceback
 import functools
+import threading
+from pathlib import Path
+from contextlib import contextmanager
 from config import wechat_webhook_url, log_path
 from utils.log_kit import logger
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # ================== 重试功能 ==================
 def retry(max_tries=3, delay_seconds=1, backoff=1, exceptions=(Exception,)):
     """
@@ -49,6 +59,30 @@ def retry(max_tries=3, delay_seconds=1, backoff=1, exceptions=(Exception,)):
     return decorator
 
 
+def async_retry(max_tries=3, delay_seconds=1, backoff=1, exceptions=(Exception,)):
+    """
+    协程版本的重试装饰器，等待时不阻塞事件循环，参数同retry
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            mtries, mdelay = max_tries, delay_seconds
+            while mtries > 0:
+                try:
+                    return await func(*args, **kwargs)
+                except exceptions as e:
+                    logger.warning(f"{func.__name__} 调用失败: {str(e)}, 还剩 {mtries-1} 次重试")
+                    logger.debug(f"错误详情: {traceback.format_exc()}")
+                    if mtries == 1:
+                        logger.error(f"{func.__name__} 达到最大重试次数，放弃重试")
+                        raise
+                    await asyncio.sleep(mdelay)
+                    mdelay *= backoff
+                    mtries -= 1
+        return wrapper
+    return decorator
+
+
 # ================== 通知功能 ==================
 def send_wechat_message(content, url=wechat_webhook_url):
     if not url:
@@ -181,3 +215,34 @@ def replace_special_characters(symbol):
     """
     symbol = symbol.replace('/', '-').replace(':', '-').replace('*', '-').replace('?', '-').replace('\'', '-').replace(' ', '-').replace('"', '-')
     return symbol
+
+
+# ============= 文件锁 =============
+# 进程内的线程锁，key为锁文件路径
+_thread_locks = {}
+
+
+@contextmanager
+def file_lock(lock_file):
+    """
+    进程间文件锁 + 进程内线程锁，用于多个进程共同读写的状态文件
+    lock_file: 锁文件路径，不存在时创建
+    """
+    lock_file = Path(lock_file)
+    thread_lock = _thread_locks.setdefault(str(lock_file), threading.Lock())
+    with thread_lock:
+        lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_file, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
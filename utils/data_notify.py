@@ -0,0 +1,294 @@
+"""
+数据就绪通知模块
+talons在每个代币的K线保存后、一条链的K线全部完成时通过Unix域数据报套接字推送通知，同时写入文件作为后备，
+hunter阻塞等待通知，数据就绪后毫秒级响应
+消息为JSON:
+    代币就绪: {'chain': 链名称, 'run_time': 'YYYY-mm-dd_HH_MM', 'token': 代币地址}，同时追加到 flags/{run_time}.ready
+    链完成: {'chain': 链名称, 'run_time': 'YYYY-mm-dd_HH_MM', 'tokens': [本周期更新成功的代币地址]}，同时写入 flags/{run_time}.flag
+说明:
+1. hunter启动后绑定 notify_socket_path 并一直保留，hunter正在处理其他数据时到达的通知在套接字缓冲区中排队
+2. talons只发送不等待，hunter没有运行或缓冲区已满时发送失败，只写文件；消息过大时不带tokens，hunter从flag文件读取
+3. hunter开始等待时和之后每fallback_seconds都会读取flag和ready文件，通知丢失也不会漏掉
+4. 系统不支持Unix域套接字或notify_config['enabled']为False时，每秒读取一次文件，和原来的方式一致
+5. 链完成后不会再有代币就绪，清单之外的代币是本周期更新失败的；没有清单(旧版flag)时整条链都视为就绪
+6. 单进程运行(utils/event_bus.py开启)时通知通过事件总线在内存中传递，flag和ready文件在后台写入
+"""
+import os
+import json
+import errno
+import time
+import socket
+import queue
+import select
+from datetime import datetime, timedelta
+
+from config import klines_path, notify_config, notify_socket_path
+from utils.log_kit import logger
+from utils import event_bus
+
+# 单条通知的最大字节数
+MAX_MESSAGE_BYTES = 1 << 20
+
+# hunter绑定的套接字(单进程运行时为事件总线的订阅队列)，进程内复用，None表示还没有绑定，False表示不可用
+_listener = [None]
+
+# hunter收到的当前周期的通知，{'run_time': 'YYYY-mm-dd_HH_MM', 'chains': {链: 完成消息}, 'tokens': {链: 就绪的代币地址集合}}
+_state = {'run_time': None, 'chains': {}, 'tokens': {}}
+
+
+def _flag_file(chain_name, run_time_str, suffix='.flag'):
+    return klines_path / chain_name / 'flags' / f'{run_time_str}{suffix}'
+
+
+def _socket_available():
+    return notify_config['enabled'] and hasattr(socket, 'AF_UNIX')
+
+
+def _send(message):
+    """
+    推送一条通知，hunter没有运行或没有及时读取时放弃，hunter会读取文件
+    """
+    if event_bus.enabled():
+        event_bus.publish('ready', message['chain'], message)
+        return
+    if not _socket_available() or not notify_socket_path.exists():
+        return
+    body = json.dumps(message, ensure_ascii=False)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            try:
+                sock.sendto(body.encode(), str(notify_socket_path))
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE or message.get('tokens') is None:
+                    raise
+                # 消息过大时只发送链和时间，代币清单从flag文件读取
+                sock.sendto(json.dumps({**message, 'tokens': None}).encode(), str(notify_socket_path))
+    except OSError as e:
+        logger.debug(f"{message['chain']} 数据就绪通知发送失败，使用文件: {e}")
+
+
+def publish(flag_dir, chain_name, run_time, tokens=None):
+    """
+    写入flag文件并推送链完成的通知
+    flag_dir: 标志文件目录
+    run_time: 更新时间
+    tokens: 本周期更新成功的代币地址，None表示没有统计
+    """
+    message = {'chain': chain_name, 'run_time': run_time.strftime('%Y-%m-%d_%H_%M'), 'tokens': tokens}
+
+    def write(flag_file):
+        tmp_file = flag_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(message, f, ensure_ascii=False)
+        os.replace(tmp_file, flag_file)
+
+    event_bus.persist(flag_dir / f"{message['run_time']}.flag", write)
+    _send(message)
+
+
+def publish_token(flag_dir, chain_name, run_time, address):
+    """
+    追加到ready文件并推送代币就绪的通知
+    flag_dir: 标志文件目录
+    run_time: 更新时间
+    address: K线已经保存的代币地址
+    """
+    run_time_str = run_time.strftime('%Y-%m-%d_%H_%M')
+
+    def write(ready_file):
+        # 每行一个地址，只追加完整的行，读取时忽略没有换行的最后一行
+        with open(ready_file, 'a', encoding='utf-8') as f:
+            f.write(f'{address}\n')
+
+    event_bus.persist(flag_dir / f'{run_time_str}.ready', write, append=True)
+    _send({'chain': chain_name, 'run_time': run_time_str, 'token': address})
+
+
+def _open_listener():
+    """
+    绑定hunter的套接字，不可用时返回None
+    """
+    if _listener[0] is None:
+        _listener[0] = False
+        if event_bus.enabled():
+            _listener[0] = event_bus.subscribe('ready')
+        elif _socket_available():
+            try:
+                notify_socket_path.parent.mkdir(parents=True, exist_ok=True)
+                if notify_socket_path.exists():
+                    # 上次运行留下的套接字文件
+                    notify_socket_path.unlink()
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, MAX_MESSAGE_BYTES)
+                sock.bind(str(notify_socket_path))
+                sock.setblocking(False)
+                _listener[0] = sock
+            except OSError as e:
+                logger.warning(f"数据就绪通知套接字不可用，改为检查flag文件: {e}")
+    return _listener[0] or None
+
+
+def close_listener():
+    """
+    关闭hunter的套接字并删除套接字文件
+    """
+    sock = _listener[0]
+    _listener[0] = None
+    if isinstance(sock, socket.socket):
+        sock.close()
+        notify_socket_path.unlink(missing_ok=True)
+
+
+def _receive(sock):
+    """
+    读取套接字中所有排队的通知
+    Returns: [消息]
+    """
+    messages = []
+    while isinstance(sock, queue.Queue):
+        try:
+            messages.append(sock.get_nowait()[1])
+        except queue.Empty:
+            return messages
+    while True:
+        try:
+            body = sock.recv(MAX_MESSAGE_BYTES)
+        except BlockingIOError:
+            return messages
+        try:
+            messages.append(json.loads(body))
+        except ValueError:
+            logger.warning(f"无法解析的数据就绪通知: {body[:100]}")
+
+
+def read_flag(chain_name, run_time_str):
+    """
+    读取flag文件中的代币清单
+    Returns: 消息字典，flag文件不存在时返回None；旧版flag文件没有清单时tokens为None
+    """
+    try:
+        with open(_flag_file(chain_name, run_time_str), 'r', encoding='utf-8') as f:
+            message = json.loads(f.read())
+        if isinstance(message, dict):
+            return message
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        pass
+    return {'chain': chain_name, 'run_time': run_time_str, 'tokens': None}
+
+
+def read_ready(chain_name, run_time_str):
+    """
+    读取ready文件中已经就绪的代币
+    Returns: 代币地址集合
+    """
+    try:
+        with open(_flag_file(chain_name, run_time_str, '.ready'), 'r', encoding='utf-8') as f:
+            lines = f.read().split('\n')
+    except FileNotFoundError:
+        return set()
+    # 最后一段没有换行，可能还没有写完
+    return set(line for line in lines[:-1] if line)
+
+
+def _apply(message):
+    """
+    记录一条当前周期的通知
+    """
+    chain_name = message.get('chain')
+    if message.get('run_time') != _state['run_time'] or not chain_name:
+        return
+    tokens = _state['tokens'].setdefault(chain_name, set())
+    if 'token' in message:
+        tokens.add(message['token'])
+        return
+    if message.get('tokens') is None:
+        # 通知过大时没有带清单，从flag文件读取
+        message = read_flag(chain_name, _state['run_time']) or message
+    _state['chains'][chain_name] = message
+    tokens.update(message.get('tokens') or [])
+
+
+def _collect(run_time_str, chain_names, read_files):
+    """
+    读取套接字中的通知，read_files为True时再读取flag和ready文件
+    """
+    if _state['run_time'] != run_time_str:
+        _state.update({'run_time': run_time_str, 'chains': {}, 'tokens': {}})
+    sock = _open_listener()
+    if sock:
+        for message in _receive(sock):
+            _apply(message)
+    if read_files:
+        for chain_name in chain_names:
+            _state['tokens'].setdefault(chain_name, set()).update(read_ready(chain_name, run_time_str))
+            if chain_name not in _state['chains']:
+                message = read_flag(chain_name, run_time_str)
+                if message is not None:
+                    _apply(message)
+
+
+def _wait(sock, deadline, check_seconds):
+    """
+    等待下一条通知，最多等到check_seconds后重新读取文件
+    Returns: 是否已经超过截止时间
+    """
+    remaining = (deadline - datetime.now()).total_seconds()
+    if remaining <= 0:
+        return True
+    timeout = min(check_seconds, remaining)
+    if isinstance(sock, queue.Queue):
+        try:
+            _apply(sock.get(timeout=timeout)[1])
+        except queue.Empty:
+            pass
+    elif sock:
+        select.select([sock], [], [], timeout)
+    else:
+        time.sleep(timeout)
+    return False
+
+
+def wait_tokens(run_time, wanted, deadline=None, on_idle=None):
+    """
+    等待代币的K线就绪，分批返回已经就绪的代币
+    run_time: 当前的运行时间
+    wanted: {链名称: 代币地址集合}
+    deadline: 最晚等待到的时间(datetime)，默认 run_time + deadline_minutes
+    on_idle: 每次没有新数据时调用，参数为还没有就绪的代币数量
+    Returns: 依次生成 (链名称, 本批就绪的代币地址集合)；链完成后更新失败的代币和超过deadline仍未就绪的代币不会返回
+    """
+    run_time_str = run_time.strftime('%Y-%m-%d_%H_%M')
+    deadline = deadline or run_time + timedelta(minutes=notify_config['deadline_minutes'])
+    pending = {chain_name: set(addresses) for chain_name, addresses in wanted.items() if addresses}
+    sock = _open_listener()
+    check_seconds = notify_config['fallback_seconds'] if sock else 1
+    files_read = 0
+
+    while pending:
+        read_files = time.time() - files_read >= check_seconds
+        _collect(run_time_str, list(pending), read_files)
+        if read_files:
+            files_read = time.time()
+        for chain_name in list(pending):
+            addresses = pending[chain_name]
+            done = _state['chains'].get(chain_name)
+            if done is not None and done.get('tokens') is None:
+                # 没有清单时整条链都视为就绪
+                ready = set(addresses)
+            else:
+                ready = addresses & _state['tokens'].get(chain_name, set())
+            addresses -= ready
+            if done is not None or not addresses:
+                # 链完成后不会再有代币就绪
+                del pending[chain_name]
+            if ready:
+                yield chain_name, ready
+        if not pending:
+            break
+        if on_idle is not None:
+            on_idle(sum(len(addresses) for addresses in pending.values()))
+        if _wait(sock, deadline, check_seconds):
+            break
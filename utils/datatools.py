@@ -1,39 +1,63 @@
 import os
-import time
+import json
+import pandas as pd
 from datetime import datetime, timedelta
 from glob import glob
 
 from utils.log_kit import logger
-from config import klines_path
+from config import klines_path, data_path
+from utils import event_bus
 
-def check_data_update_flag(run_time, chain_name):
+
+def warn_stale_flags(run_time, chain_name):
     """
-    检查flag
-    :param run_time:    当前的运行时间
+    最新的flag超过30分钟时提示数据中心进程可能崩溃，每次等待只提示一次
     """
-    flag_path = klines_path / chain_name / 'flags'
-    max_flag = sorted(glob(os.path.join(flag_path, '*.flag')))
+    max_flag = sorted(glob(os.path.join(klines_path / chain_name / 'flags', '*.flag')))
     if max_flag:
-        max_flag_time = datetime.strptime(max_flag[-1].split(os.sep)[-1].split('.')[0], '%Y-%m-%d_%H_%M')
+        max_flag_time = datetime.strptime(os.path.basename(max_flag[-1]).split('.')[0], '%Y-%m-%d_%H_%M')
     else:
         max_flag_time = datetime(2000, 1, 1)  # 设置一个很早的时间，防止出现空数据
+    if max_flag_time < run_time - timedelta(minutes=30):  # 如果最新数据更新时间超过30分钟，表示数据中心进程可能崩溃了
+        logger.error(f'{chain_name} 数据中心进程疑似崩溃，最新数据更新时间：{max_flag_time}，程序启动时间：{run_time}')
+
+
+def load_chain_progress(chain_name):
+    """
+    读取talons写入的链的K线更新进度
+    :param chain_name:  链名称
+    :return: {'run_time', 'total', 'finished', 'updated', 'done', 'elapsed'}，没有进度文件时返回空字典
+    """
+    progress_file = klines_path / chain_name / 'flags' / 'progress.json'
+    try:
+        with open(progress_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
 
-    index_file_path = os.path.join(flag_path, f"{run_time.strftime('%Y-%m-%d_%H_%M')}.flag")  # 构建本地flag文件地址
-    while True:
-        time.sleep(1)
-        # 判断该flag文件是否存在
-        if os.path.exists(index_file_path):
-            flag = True
-            break
-
-        if max_flag_time < run_time - timedelta(minutes=30):  # 如果最新数据更新时间超过30分钟，表示数据中心进程可能崩溃了
-            logger.error(f'数据中心进程疑似崩溃，最新数据更新时间：{max_flag_time}，程序启动时间：{run_time}')
-
-        # 当前时间是否超过run_time
-        if datetime.now() > run_time + timedelta(
-                minutes=5):  # 如果当前时间超过run_time半小时，表示已经错过当前run_time的下单时间，可能数据中心更新数据失败，没有生成flag文件
-            flag = False
-            logger.warning(f"上次数据更新时间:【{max_flag_time}】，程序启动时间：【{run_time}】， 当前时间:【{datetime.now()}】")
-            break
-
-    return flag
\ No newline at end of file
+def load_active_pool(account_id):
+    """
+    读取账户的活跃池子，单进程运行时直接使用事件总线中的最新快照
+    :param account_id:  账户ID
+    :return: 活跃池子的DataFrame，文件不存在时返回None，文件为空时返回空DataFrame
+    """
+    snapshot = event_bus.latest('pool', account_id)
+    if snapshot is not None:
+        return snapshot.copy()
+    active_pool_path = data_path / account_id / 'active_pool.csv'
+    if not active_pool_path.exists():
+        return None
+    if os.path.getsize(active_pool_path) == 0:
+        return pd.DataFrame()
+    return pd.read_csv(active_pool_path)
+
+
+def save_active_pool(account_id, pool_df):
+    """
+    保存账户的活跃池子，单进程运行时先发布到事件总线，文件在后台写入
+    :param account_id:  账户ID
+    :param pool_df:     活跃池子的DataFrame，保存后不能再修改
+    """
+    event_bus.publish('pool', account_id, pool_df)
+    event_bus.persist(data_path / account_id / 'active_pool.csv', lambda path: pool_df.to_csv(path, index=False))
@@ -0,0 +1,122 @@
+"""
+进程内事件总线
+单进程运行(runtime.py)时talons和hunter通过事件总线直接传递内存中的对象，不再经过CSV文件和套接字
+主题:
+    'pool': key为账户ID，value为活跃池子DataFrame(币池更新和补齐pair_address后发布)
+    'ready': key为链名称，value为数据就绪消息，格式见 utils/data_notify.py
+说明:
+1. 没有调用enable()时(talons和hunter分开运行)，publish不做任何事，persist直接写文件，行为和原来一致
+2. 每个 (主题, key) 保存最新的值，latest直接读取；subscribe返回的队列接收订阅之后发布的所有消息
+3. persist把文件写入交给后台线程，同一文件还没有写入的内容只保留最新的一份(append=True时按顺序全部写入)，
+   文件只用于持久化、重启恢复和单独运行的进程读取，不在关键路径上
+"""
+import queue
+import itertools
+import threading
+from collections import OrderedDict
+
+from utils.log_kit import logger
+
+_enabled = [False]
+# 每个 (主题, key) 的最新值
+_latest = {}
+# 每个主题的订阅队列
+_subscribers = {}
+_lock = threading.Lock()
+
+# 等待写入的文件，key为路径(append时为 (路径, 序号))，value为 (路径, 写入函数)
+_writes = OrderedDict()
+_writing = [0]
+_write_cond = threading.Condition()
+_write_seq = itertools.count()
+_writer = [None]
+
+
+def enable():
+    """开启事件总线，需要在talons和hunter开始运行之前调用"""
+    _enabled[0] = True
+
+
+def enabled():
+    return _enabled[0]
+
+
+def publish(topic, key, value):
+    """
+    发布一条消息，保存为最新值并放入所有订阅队列
+    """
+    if not _enabled[0]:
+        return
+    with _lock:
+        _latest[(topic, key)] = value
+        subscribers = list(_subscribers.get(topic, []))
+    for subscriber in subscribers:
+        subscriber.put((key, value))
+
+
+def latest(topic, key, default=None):
+    """
+    读取 (主题, key) 的最新值，没有发布过时返回default
+    """
+    with _lock:
+        return _latest.get((topic, key), default)
+
+
+def subscribe(topic):
+    """
+    订阅主题
+    Returns: queue.Queue，元素为 (key, value)
+    """
+    subscriber = queue.Queue()
+    with _lock:
+        _subscribers.setdefault(topic, []).append(subscriber)
+    return subscriber
+
+
+def _write_loop():
+    """
+    后台写入文件
+    """
+    while True:
+        with _write_cond:
+            while not _writes:
+                _write_cond.wait()
+            _, (path, write) = _writes.popitem(last=False)
+            _writing[0] += 1
+        try:
+            write(path)
+        except Exception as e:
+            logger.error(f"异步写入 {path} 失败: {e}")
+        finally:
+            with _write_cond:
+                _writing[0] -= 1
+                _write_cond.notify_all()
+
+
+def persist(path, write, append=False):
+    """
+    写入文件，开启事件总线时由后台线程异步写入
+    path: 文件路径
+    write: write(path)，完成写入的函数，需要在调用时已经捕获好要写入的内容
+    append: 为True时每次写入都保留，否则同一路径只写入最新的一次
+    """
+    if not _enabled[0]:
+        write(path)
+        return
+    with _write_cond:
+        key = (str(path), next(_write_seq)) if append else str(path)
+        _writes.pop(key, None)
+        _writes[key] = (path, write)
+        if _writer[0] is None:
+            _writer[0] = threading.Thread(target=_write_loop, name='event_bus_writer', daemon=True)
+            _writer[0].start()
+        _write_cond.notify_all()
+
+
+def flush(timeout=None):
+    """
+    等待所有文件写入完成，退出前调用
+    Returns: 是否全部写入
+    """
+    with _write_cond:
+        return _write_cond.wait_for(lambda: not _writes and not _writing[0], timeout)
@@ -0,0 +1,311 @@
+"""
+K线存储模块
+按交易对分区存储K线，替代每次都整体重写的CSV文件
+目录结构:
+    klines/CHAIN/SYMBOL_ADDRESS/
+        meta.json           交易对元数据(symbol, pair_name, chain, created_at等)和覆盖范围
+        YYYYMMDD.parquet    按UTC日期分区的K线段，只保存时间戳和OHLCV
+说明:
+1. candle_begin_time 使用int64的epoch秒(UTC)，OHLCV使用float64
+2. 新K线只和所在的分区(通常就是最后一个分区)做有序合并去重，历史分区不会被改写
+3. 读取时可以只读取尾部N根K线，只会打开需要的分区
+4. 旧版的 SYMBOL_ADDRESS.csv 在第一次写入时导入
+5. 元数据的writes记录最近WRITE_LOG_SIZE次写入的 [版本, 最早的K线时间]，缓存合成结果的读取方据此找到需要重新计算的起点
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from config import klines_path
+from utils.commons import replace_special_characters
+
+# K线列，按存储顺序
+KLINE_COLUMNS = ['candle_begin_time', 'open', 'high', 'low', 'close', 'volume']
+# 每行重复的元数据，放在meta.json中
+META_COLUMNS = ['symbol', 'address', 'quote_coin_symbol', 'pair_name', 'pair_address', 'chain', 'created_at']
+# 每个分区的时长(秒)，按UTC日期分区
+PARTITION_SECONDS = 86400
+
+META_FILE = 'meta.json'
+# 元数据中保留最近多少次写入的记录
+WRITE_LOG_SIZE = 64
+
+
+def get_store_dir(chain, symbol, address):
+    """
+    获取交易对的K线存储目录
+    chain: 链名称
+    symbol: 代币符号，会处理特殊字符
+    address: 代币地址
+    """
+    symbol = replace_special_characters(str(symbol))
+    return klines_path / chain / f"{symbol}_{address}"
+
+
+def to_epoch(times):
+    """
+    将时间序列转换为int64的epoch秒
+    times: 字符串、datetime或epoch秒组成的序列
+    """
+    times = pd.Series(times)
+    if pd.api.types.is_integer_dtype(times):
+        return times.to_numpy(dtype=np.int64)
+    return pd.to_datetime(times).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+def load_meta(store_dir):
+    """
+    读取元数据，不存在时返回空字典
+    """
+    meta_file = Path(store_dir) / META_FILE
+    if not meta_file.exists():
+        return {}
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_meta(store_dir, meta):
+    """
+    原子写入元数据，避免读取方读到半个文件
+    """
+    meta_file = Path(store_dir) / META_FILE
+    tmp_file = meta_file.with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_file, meta_file)
+
+
+def update_meta(store_dir, fields):
+    """
+    更新元数据中的字段(不改变K线，版本号不变)
+    fields: {字段: 值}
+    """
+    meta = load_meta(store_dir)
+    meta.update(fields)
+    _save_meta(store_dir, meta)
+
+
+def _partition_name(day):
+    """
+    根据分区序号(epoch秒 // PARTITION_SECONDS)计算分区名称 YYYYMMDD
+    """
+    return pd.Timestamp(int(day) * PARTITION_SECONDS, unit='s').strftime('%Y%m%d')
+
+
+def _read_partition(store_dir, name, columns=KLINE_COLUMNS):
+    """
+    读取单个分区，返回列名到numpy数组的字典
+    columns: 需要读取的列
+    """
+    df = pd.read_parquet(Path(store_dir) / f"{name}.parquet", columns=columns)
+    return {col: df[col].to_numpy() for col in columns}
+
+
+def _write_partition(store_dir, name, columns):
+    """
+    原子写入单个分区
+    """
+    partition_file = Path(store_dir) / f"{name}.parquet"
+    tmp_file = partition_file.with_suffix('.tmp')
+    pd.DataFrame(columns, columns=KLINE_COLUMNS).to_parquet(tmp_file, index=False)
+    os.replace(tmp_file, partition_file)
+
+
+def _merge_sorted(old, new):
+    """
+    有序合并两段K线，相同时间戳以新数据为准
+    old, new: 列名到numpy数组的字典，均已按时间排序
+    """
+    # 快速路径：新数据没有重复的时间戳并且全部在旧数据之后，直接追加
+    new_ts = new['candle_begin_time']
+    if np.all(new_ts[1:] > new_ts[:-1]) and (len(old['candle_begin_time']) == 0 or new_ts[0] > old['candle_begin_time'][-1]):
+        return {col: np.concatenate([old[col], new[col]]) for col in KLINE_COLUMNS}
+
+    merged = {col: np.concatenate([old[col], new[col]]) for col in KLINE_COLUMNS}
+    # 稳定排序保证相同时间戳时新数据排在后面
+    order = np.argsort(merged['candle_begin_time'], kind='stable')
+    merged = {col: values[order] for col, values in merged.items()}
+    ts = merged['candle_begin_time']
+    keep = np.ones(len(ts), dtype=bool)
+    keep[:-1] = ts[1:] != ts[:-1]  # 保留相同时间戳中的最后一条
+    return {col: values[keep] for col, values in merged.items()}
+
+
+def write_klines(store_dir, klines_df):
+    """
+    写入K线，只改写新K线所在的分区
+    store_dir: 交易对的存储目录
+    klines_df: fetch_klines_df返回的K线数据
+    Returns: 新增的K线数量
+    """
+    if klines_df is None or klines_df.empty:
+        return 0
+
+    # 元数据只保存一份，以最新的数据为准
+    last_row = klines_df.iloc[-1]
+    info = {col: last_row[col] for col in META_COLUMNS if col in klines_df.columns and pd.notna(last_row[col])}
+
+    # 转换为有类型的列
+    new = {
+        'candle_begin_time': to_epoch(klines_df['candle_begin_time']),
+        **{col: klines_df[col].to_numpy(dtype=np.float64) for col in KLINE_COLUMNS[1:]},
+    }
+    return write_records(store_dir, new, info)
+
+
+def write_records(store_dir, records, info=None):
+    """
+    写入有类型的K线记录，只改写新K线所在的分区
+    store_dir: 交易对的存储目录
+    records: KLINE_COLUMNS组成的结构化数组或 {列名: 数组}，candle_begin_time为epoch秒
+    info: 元数据 {META_COLUMNS中的字段: 值}
+    Returns: 新增的K线数量
+    """
+    if records is None or len(records['candle_begin_time']) == 0:
+        return 0
+
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    meta = load_meta(store_dir)
+    for col, value in (info or {}).items():
+        if col in META_COLUMNS and value is not None:
+            meta[col] = str(value)
+
+    # 按时间排序
+    new = {col: np.asarray(records[col], dtype=np.int64 if col == 'candle_begin_time' else np.float64) for col in KLINE_COLUMNS}
+    order = np.argsort(new['candle_begin_time'], kind='stable')
+    new = {col: values[order] for col, values in new.items()}
+
+    partitions = meta.get('partitions', [])
+    days = new['candle_begin_time'] // PARTITION_SECONDS
+    added = 0
+    for day in np.unique(days):
+        name = _partition_name(day)
+        part = {col: values[days == day] for col, values in new.items()}
+        if name in partitions:
+            old = _read_partition(store_dir, name)
+            merged = _merge_sorted(old, part)
+            added += len(merged['candle_begin_time']) - len(old['candle_begin_time'])
+        else:
+            merged = _merge_sorted({col: part[col][:0] for col in KLINE_COLUMNS}, part)
+            partitions.append(name)
+            added += len(merged['candle_begin_time'])
+        _write_partition(store_dir, name, merged)
+
+    partitions.sort()
+    meta['partitions'] = partitions
+    meta['count'] = meta.get('count', 0) + added
+    meta['first_time'] = int(min(meta.get('first_time', new['candle_begin_time'][0]), new['candle_begin_time'][0]))
+    meta['last_time'] = int(max(meta.get('last_time', new['candle_begin_time'][-1]), new['candle_begin_time'][-1]))
+    # 每次写入递增版本号，读取方可以据此判断数据是否变化
+    meta['version'] = meta.get('version', 0) + 1
+    meta['writes'] = (meta.get('writes', []) + [[meta['version'], int(new['candle_begin_time'][0])]])[-WRITE_LOG_SIZE:]
+    _save_meta(store_dir, meta)
+
+    return added
+
+
+def changed_since(store_dir, version):
+    """
+    版本version之后写入的最早的K线时间
+    version: 读取方上次看到的元数据版本，None表示不知道
+    Returns: (当前版本, 最早的K线时间)，没有写入时最早的时间为None；
+             写入记录追溯不到version时为0，读取方需要全部重新计算
+    """
+    meta = load_meta(store_dir)
+    current = meta.get('version')
+    if version is not None and current == version:
+        return current, None
+    writes = meta.get('writes', [])
+    if version is None or not writes or writes[0][0] > version + 1:
+        return current, 0
+    return current, min(time for written, time in writes if written > version)
+
+
+def read_klines(store_dir, tail=None):
+    """
+    读取K线数据
+    store_dir: 交易对的存储目录
+    tail: 只读取最后tail根K线，None时读取全部
+    Returns: K线DataFrame，candle_begin_time为UTC时间，并带上元数据列
+    """
+    meta = load_meta(store_dir)
+    partitions = meta.get('partitions', [])
+    if not partitions:
+        return pd.DataFrame()
+
+    # 从最后一个分区往前读，够数就停
+    segments = []
+    row_count = 0
+    for name in reversed(partitions):
+        segment = _read_partition(store_dir, name)
+        segments.append(segment)
+        row_count += len(segment['candle_begin_time'])
+        if tail and row_count >= tail:
+            break
+
+    segments.reverse()
+    columns = {col: np.concatenate([segment[col] for segment in segments]) for col in KLINE_COLUMNS}
+    if tail:
+        columns = {col: values[-tail:] for col, values in columns.items()}
+
+    df = pd.DataFrame(columns, columns=KLINE_COLUMNS)
+    df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time'], unit='s')
+    for col in META_COLUMNS:
+        df[col] = meta.get(col)
+
+    return df
+
+
+def read_since(store_dir, since=None, columns=KLINE_COLUMNS):
+    """
+    读取since之后(含)的K线，从最后一个分区往前读，只读取需要的分区
+    since: epoch秒，None时读取全部
+    columns: 需要读取的列，会包含candle_begin_time
+    Returns: {列名: numpy数组}，按时间排序，candle_begin_time为int64 epoch秒
+    """
+    columns = ['candle_begin_time'] + [col for col in columns if col != 'candle_begin_time']
+    meta = load_meta(store_dir)
+    segments = []
+    for name in reversed(meta.get('partitions', [])):
+        segment = _read_partition(store_dir, name, columns)
+        times = segment['candle_begin_time']
+        if since is not None:
+            segment = {col: values[times >= since] for col, values in segment.items()}
+        segments.append(segment)
+        if since is not None and len(times) and times[0] < since:
+            break
+    if not segments:
+        return {col: np.array([], dtype=np.int64 if col == 'candle_begin_time' else np.float64) for col in columns}
+    segments.reverse()
+    result = {col: np.concatenate([segment[col] for segment in segments]) for col in columns}
+    result['candle_begin_time'] = result['candle_begin_time'].astype(np.int64)
+    return result
+
+
+def read_times(store_dir, since):
+    """
+    读取since之后(含)所有K线的开始时间，只读取需要的分区
+    since: epoch秒
+    Returns: 按时间排序的int64 epoch秒数组
+    """
+    return read_since(store_dir, since, ['candle_begin_time'])['candle_begin_time']
+
+
+def migrate_legacy_csv(store_dir):
+    """
+    将旧版的 SYMBOL_ADDRESS.csv 导入存储目录，只在存储为空时执行一次
+    Returns: 导入的K线数量
+    """
+    store_dir = Path(store_dir)
+    legacy_file = store_dir.parent / f"{store_dir.name}.csv"
+    if not legacy_file.exists() or load_meta(store_dir).get('partitions'):
+        return 0
+
+    legacy_df = pd.read_csv(legacy_file)
+    added = write_klines(store_dir, legacy_df)
+    # 导入完成后改名，避免重复导入
+    os.replace(legacy_file, store_dir.parent / f"{store_dir.name}.csv.migrated")
+    return added
@@ -0,0 +1,132 @@
+"""
+K线重采样模块
+用已存储的基础周期(interval_config['kline_interval'])K线在本地合成更大周期的K线，策略需要的周期再多也只消耗CPU，不消耗CMC credit
+说明:
+1. 周期按UTC对齐，开始时间为 t // 周期 * 周期；open取第一根，high取最大，low取最小，close取最后一根，volume求和
+2. 周期结束时间 <= now 的K线才算收盘，默认只返回收盘的K线；include_partial=True时最后一根可以是正在进行的周期
+3. 基础K线中间缺失的周期直接跳过，和CMC不返回没有成交的K线一致
+4. 每个 (交易对, 周期) 的合成结果缓存在进程内，基础K线的版本变化时重新合成最后两个周期之后的部分，
+   以及K线存储元数据中记录的缓存之后写入的最早K线所在周期之后的部分，中间补齐的历史K线也会反映到合成结果中
+"""
+import time
+import numpy as np
+
+from config import interval_config
+from utils import kline_store, ohlcv_ring
+from utils.ohlcv_ring import RECORD_DTYPE
+
+# 已合成的K线，key为 (存储目录, 周期秒数)，
+# value为 {'since': 最早的基础K线时间, 'version': 基础K线版本, 'store_version': K线存储元数据版本, 'bars': K线数组}
+_cache = {}
+
+
+def timeframe_seconds(timeframe):
+    """K线周期的秒数，只支持分钟(m)和小时(h)"""
+    if timeframe.endswith('m'):
+        return int(timeframe[:-1]) * 60
+    if timeframe.endswith('h'):
+        return int(timeframe[:-1]) * 3600
+    raise ValueError(f"不支持的K线周期: {timeframe}")
+
+
+def check_timeframe(timeframe):
+    """
+    检查周期是基础周期的整数倍
+    Returns: 周期秒数
+    """
+    base = timeframe_seconds(interval_config['kline_interval'])
+    target = timeframe_seconds(timeframe)
+    if target < base or target % base:
+        raise ValueError(f"K线周期 {timeframe} 不是基础周期 {interval_config['kline_interval']} 的整数倍")
+    return target
+
+
+def is_base(timeframe):
+    """是否就是基础周期，不需要重采样"""
+    return timeframe is None or timeframe_seconds(timeframe) == timeframe_seconds(interval_config['kline_interval'])
+
+
+def resample(records, target_seconds):
+    """
+    把基础K线合成为target_seconds周期的K线，最后一个周期可能还没有收盘
+    records: 按时间排序的RECORD_DTYPE数组或 {列名: 数组}
+    Returns: RECORD_DTYPE数组
+    """
+    times = np.asarray(records['candle_begin_time'], dtype=np.int64)
+    if not len(times):
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    buckets = times // target_seconds * target_seconds
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(times)] - 1
+
+    bars = np.zeros(len(starts), dtype=RECORD_DTYPE)
+    bars['candle_begin_time'] = buckets[starts]
+    bars['open'] = np.asarray(records['open'], dtype=np.float64)[starts]
+    bars['high'] = np.maximum.reduceat(np.asarray(records['high'], dtype=np.float64), starts)
+    bars['low'] = np.minimum.reduceat(np.asarray(records['low'], dtype=np.float64), starts)
+    bars['close'] = np.asarray(records['close'], dtype=np.float64)[ends]
+    bars['volume'] = np.add.reduceat(np.asarray(records['volume'], dtype=np.float64), starts)
+    return bars
+
+
+def _read_base(store_dir, since):
+    """
+    读取since之后(含)的基础K线，共享内存覆盖时不读取K线存储
+    since: epoch秒，None时读取全部
+    """
+    if since is not None:
+        window = ohlcv_ring.read_ring(store_dir)
+        if window is not None and len(window) and window['candle_begin_time'][0] <= since:
+            return window[window['candle_begin_time'] >= since]
+    return kline_store.read_since(store_dir, since)
+
+
+def read_resampled(store_dir, timeframe, tail=None, now=None, include_partial=False):
+    """
+    读取合成后的K线
+    store_dir: 交易对的存储目录
+    timeframe: 目标周期，例如 '15m'、'1h'，需要是基础周期的整数倍
+    tail: 只返回最后tail根，None时合成全部历史
+    now: 当前时间，epoch秒，用来判断最后一个周期是否收盘
+    include_partial: 是否返回正在进行的周期
+    Returns: 按时间排序的RECORD_DTYPE数组，没有K线时为空数组
+    """
+    target = check_timeframe(timeframe)
+    now = time.time() if now is None else now
+    # 需要的最早的周期，多读一个周期给还没有收盘的K线
+    since = None if tail is None else (int(now) // target - tail - 1) * target
+
+    key = (str(store_dir), target)
+    version = ohlcv_ring.data_version(store_dir)
+    cached = _cache.get(key)
+    if cached is None or (cached['since'] is not None and (since is None or since < cached['since'])):
+        store_version = kline_store.load_meta(store_dir).get('version')
+        cached = {'since': since, 'version': version, 'store_version': store_version, 'bars': resample(_read_base(store_dir, since), target)}
+        _cache[key] = cached
+    elif version is None or cached['version'] != version:
+        bars = cached['bars']
+        # 最后两个周期之前的K线只有在之后写入了更早的K线时才会变化
+        start = int(bars['candle_begin_time'][-1]) - target if len(bars) else cached['since']
+        store_version, written = kline_store.changed_since(store_dir, cached['store_version'])
+        if written is not None and start is not None and written < start:
+            # 写入了更早的K线(例如补齐中间缺失的K线)，从所在的周期开始重新合成
+            start = written // target * target
+            if cached['since'] is not None:
+                start = max(start, cached['since'])
+        fresh = resample(_read_base(store_dir, start), target)
+        cached['bars'] = fresh if start is None else np.concatenate([bars[bars['candle_begin_time'] < start], fresh])
+        cached['version'] = version
+        cached['store_version'] = store_version
+
+    bars = cached['bars']
+    if not include_partial:
+        bars = bars[bars['candle_begin_time'] + target <= now]
+    return bars if tail is None else bars[-tail:]
+
+
+def clear_cache(store_dir=None):
+    """
+    清除合成结果的缓存，store_dir为None时清除全部
+    """
+    for key in [key for key in _cache if store_dir is None or key[0] == str(store_dir)]:
+        del _cache[key]
@@ -0,0 +1,253 @@
+"""
+K线共享内存环形缓冲模块
+talons把每个交易对最近N根K线发布到内存映射文件，hunter直接映射读取，不再重复读取和解析文件
+文件结构(klines/CHAIN/SYMBOL_ADDRESS/ring.bin):
+    头部(64字节): magic, capacity, generation, cursor
+    记录区: capacity条固定长度的K线记录(int64时间戳 + float64 OHLCV)
+说明:
+1. cursor为累计写入的K线数量，最新K线位于 (cursor - 1) % capacity
+2. generation是顺序锁：写入前加1变为奇数，写完再加1变为偶数
+   读取方在读取前后比较generation，不一致或为奇数时重试，保证读到一致的快照
+3. 每个交易对只有一个写入方(talons)，读取方可以有多个
+4. 修改kline_ring_size后需要重启talons和hunter，旧的缓冲文件会被重建
+"""
+import os
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from config import kline_ring_size
+from utils import kline_store
+
+RING_FILE = 'ring.bin'
+RING_MAGIC = 0x4B4C4E52  # 'KLNR'
+
+HEADER_DTYPE = np.dtype([
+    ('magic', '<u4'),
+    ('capacity', '<u4'),
+    ('generation', '<u8'),
+    ('cursor', '<u8'),
+])
+HEADER_SIZE = 64  # 头部按64字节对齐
+
+RECORD_DTYPE = np.dtype([
+    ('candle_begin_time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+# 已打开的映射，进程内复用，key为文件路径
+_rings = {}
+
+
+def _create_ring(ring_file, capacity):
+    """
+    创建新的缓冲文件，先写临时文件再替换，避免读取方看到未初始化的头部
+    """
+    tmp_file = ring_file.with_suffix('.tmp')
+    with open(tmp_file, 'wb') as f:
+        f.truncate(HEADER_SIZE + capacity * RECORD_DTYPE.itemsize)
+    header = np.memmap(tmp_file, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+    header['magic'] = RING_MAGIC
+    header['capacity'] = capacity
+    header.flush()
+    del header
+    os.replace(tmp_file, ring_file)
+
+
+def _open_ring(store_dir, create=False):
+    """
+    打开交易对的缓冲区
+    store_dir: 交易对的存储目录
+    create: 不存在或容量不一致时是否创建
+    Returns: (header, records)，不存在时返回None
+    """
+    ring_file = Path(store_dir) / RING_FILE
+    key = str(ring_file)
+    if key in _rings:
+        # 同一进程先读取后写入时，只读的映射需要重新以读写方式打开
+        if not (create and _rings[key][0].mode == 'r'):
+            return _rings[key]
+        del _rings[key]
+
+    if not ring_file.exists():
+        if not create:
+            return None
+        Path(store_dir).mkdir(parents=True, exist_ok=True)
+        _create_ring(ring_file, kline_ring_size)
+
+    mode = 'r+' if create else 'r'
+    header = np.memmap(ring_file, dtype=HEADER_DTYPE, mode=mode, shape=(1,))
+    if header['magic'][0] != RING_MAGIC:
+        return None
+    capacity = int(header['capacity'][0])
+    if create and capacity != kline_ring_size:
+        # 容量配置变化，重建缓冲区
+        del header
+        _create_ring(ring_file, kline_ring_size)
+        header = np.memmap(ring_file, dtype=HEADER_DTYPE, mode=mode, shape=(1,))
+        capacity = kline_ring_size
+    records = np.memmap(ring_file, dtype=RECORD_DTYPE, mode=mode, offset=HEADER_SIZE, shape=(capacity,))
+
+    _rings[key] = (header, records)
+    return _rings[key]
+
+
+def _window(header, records, tail=None):
+    """
+    按时间顺序取出当前窗口内的记录(拷贝)
+    tail: 只取最后tail条
+    """
+    capacity = len(records)
+    cursor = int(header['cursor'][0])
+    count = min(cursor, capacity, tail or capacity)
+    if count == 0:
+        return records[:0].copy()
+    start = (cursor - count) % capacity
+    if start + count <= capacity:
+        return records[start:start + count].copy()
+    return np.concatenate([records[start:], records[:start + count - capacity]])
+
+
+def _write_window(header, records, window):
+    """
+    整体重写窗口，调用方负责顺序锁
+    """
+    capacity = len(records)
+    window = window[-capacity:]
+    records[:len(window)] = window
+    header['cursor'] = len(window)
+
+
+def publish(store_dir, klines_df):
+    """
+    发布新K线到缓冲区
+    store_dir: 交易对的存储目录
+    klines_df: 本次获取的K线数据
+    """
+    if klines_df is None or klines_df.empty:
+        return
+
+    new = np.zeros(len(klines_df), dtype=RECORD_DTYPE)
+    new['candle_begin_time'] = kline_store.to_epoch(klines_df['candle_begin_time'])
+    for col in kline_store.KLINE_COLUMNS[1:]:
+        new[col] = klines_df[col].to_numpy(dtype=np.float64)
+    publish_records(store_dir, new)
+
+
+def publish_records(store_dir, new):
+    """
+    发布有类型的K线记录到缓冲区
+    1. 比最后一根K线更新的直接追加
+    2. 与窗口内已有K线时间相同的原地覆盖
+    3. 窗口中间缺失的K线，从K线存储中读取尾部重建窗口
+    store_dir: 交易对的存储目录
+    new: RECORD_DTYPE的结构化数组
+    """
+    if new is None or len(new) == 0:
+        return
+
+    header, records = _open_ring(store_dir, create=True)
+    capacity = len(records)
+    new = np.sort(new, order='candle_begin_time')
+
+    window = _window(header, records)
+    last_time = window['candle_begin_time'][-1] if len(window) else None
+    if last_time is not None:
+        older = new[new['candle_begin_time'] <= last_time]
+        positions = np.searchsorted(window['candle_begin_time'], older['candle_begin_time'])
+        positions = np.minimum(positions, len(window) - 1)
+        found = window['candle_begin_time'][positions] == older['candle_begin_time']
+        # 比窗口起点还早的K线不需要发布
+        missing = ~found & (older['candle_begin_time'] > window['candle_begin_time'][0])
+        appended = new[new['candle_begin_time'] > last_time]
+    else:
+        older, positions, found, missing, appended = new[:0], np.array([], dtype=np.int64), np.array([], dtype=bool), np.array([], dtype=bool), new
+
+    # 开始写入，generation变为奇数
+    header['generation'] += 1
+    try:
+        if missing.any():
+            rebuilt = kline_store.read_klines(store_dir, tail=capacity)
+            window = np.zeros(len(rebuilt), dtype=RECORD_DTYPE)
+            window['candle_begin_time'] = kline_store.to_epoch(rebuilt['candle_begin_time'])
+            for col in kline_store.KLINE_COLUMNS[1:]:
+                window[col] = rebuilt[col].to_numpy(dtype=np.float64)
+            _write_window(header, records, window)
+        else:
+            # 原地覆盖已有K线
+            cursor = int(header['cursor'][0])
+            start = cursor - len(window)
+            for position, record in zip(positions[found], older[found]):
+                records[(start + position) % capacity] = record
+            # 追加新K线
+            for record in appended[-capacity:]:
+                records[cursor % capacity] = record
+                cursor += 1
+            header['cursor'] = cursor
+    finally:
+        # 写入结束，generation变回偶数
+        header['generation'] += 1
+
+
+def read_ring(store_dir, tail=None, retries=100):
+    """
+    读取缓冲区中最近的K线，保证读取到一致的快照
+    store_dir: 交易对的存储目录
+    tail: 只读取最后tail根K线，None时读取整个窗口
+    retries: 写入冲突时的最大重试次数
+    Returns: 按时间排序的结构化数组，缓冲区不存在时返回None
+    """
+    ring = _open_ring(store_dir)
+    if ring is None:
+        return None
+    header, records = ring
+
+    for _ in range(retries):
+        generation = int(header['generation'][0])
+        if generation % 2 == 1:
+            # 正在写入，稍等再读
+            time.sleep(0.0001)
+            continue
+        window = _window(header, records, tail)
+        if int(header['generation'][0]) == generation:
+            return window
+
+    return None
+
+
+def to_dataframe(window):
+    """
+    将缓冲区记录转换为K线DataFrame，candle_begin_time为UTC时间
+    """
+    df = pd.DataFrame(window)
+    df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time'], unit='s')
+    return df
+
+
+def data_version(store_dir):
+    """
+    获取交易对K线数据的版本，K线有任何变化版本都会改变，只读取头部，不拷贝K线
+    有缓冲区时使用 (generation, cursor, 最后一根K线时间)，否则使用K线存储元数据中的 (version, 最后一根K线时间)
+    Returns: 版本元组，正在写入或没有数据时返回None
+    """
+    ring = _open_ring(store_dir)
+    if ring is not None:
+        header, records = ring
+        generation = int(header['generation'][0])
+        cursor = int(header['cursor'][0])
+        if generation % 2 == 1 or cursor == 0:
+            return None
+        last_time = int(records[(cursor - 1) % len(records)]['candle_begin_time'])
+        if int(header['generation'][0]) != generation:
+            return None
+        return ('ring', generation, cursor, last_time)
+
+    meta = kline_store.load_meta(store_dir)
+    if 'version' not in meta:
+        return None
+    return ('store', meta['version'], meta['last_time'])
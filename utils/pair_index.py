@@ -0,0 +1,95 @@
+"""
+交易对索引模块
+代币地址到流动性最大的交易对的持久化索引，保存在SQLite中，talons的币池更新和K线获取共用
+表结构: pairs(chain, address, pair_address, pair_name, liquidity, resolved_at)，主键为 (chain, address)
+说明:
+1. pair_address为NULL表示通过CMC查询过但没有找到交易对(负缓存)，negative_ttl_hours内不再重复查询
+2. 找到交易对的记录ttl_hours后过期，过期的记录按不存在处理，由K线获取重新查询并覆盖
+3. 只提供批量读写，每次查询和写入都是一条语句/一个事务，不再逐行扫描币池CSV
+4. 每个线程使用自己的连接，数据库使用WAL模式，多个进程可以同时读写
+"""
+import time
+import sqlite3
+import threading
+
+from config import pair_index_path, pair_index_config
+
+# SQLite单条语句的参数数量有限，批量查询按此分批
+BATCH_SIZE = 500
+
+# 每个线程的连接
+_local = threading.local()
+
+
+def _connect():
+    """
+    获取当前线程的连接，第一次使用时创建表
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        pair_index_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(pair_index_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS pairs (
+                chain TEXT NOT NULL,
+                address TEXT NOT NULL,
+                pair_address TEXT,
+                pair_name TEXT,
+                liquidity REAL,
+                resolved_at REAL NOT NULL,
+                PRIMARY KEY (chain, address)
+            ) WITHOUT ROWID
+        ''')
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def get_many(chain, addresses):
+    """
+    批量查询代币的交易对
+    chain: 链名称
+    addresses: 代币地址列表
+    Returns: {代币地址: pair_address}，没有找到交易对(负缓存)时为None，索引中没有或已过期的代币不在结果中
+    """
+    addresses = list(dict.fromkeys(addresses))
+    now = time.time()
+    ttl = pair_index_config['ttl_hours'] * 3600
+    negative_ttl = pair_index_config['negative_ttl_hours'] * 3600
+    conn = _connect()
+    result = {}
+    for start in range(0, len(addresses), BATCH_SIZE):
+        batch = addresses[start:start + BATCH_SIZE]
+        rows = conn.execute(
+            f"SELECT address, pair_address, resolved_at FROM pairs WHERE chain = ? AND address IN ({','.join('?' * len(batch))})",
+            [chain, *batch],
+        ).fetchall()
+        for address, pair_address, resolved_at in rows:
+            if now - resolved_at <= (ttl if pair_address else negative_ttl):
+                result[address] = pair_address
+    return result
+
+
+def put_many(chain, records, only_missing=False):
+    """
+    批量写入交易对，一个事务完成
+    chain: 链名称
+    records: 字典列表，字段为 address, pair_address(没有找到时为None), pair_name, liquidity, resolved_at(可选，默认当前时间)
+    only_missing: 只写入索引中还没有的代币，用于从旧数据导入
+    """
+    if not records:
+        return
+    now = time.time()
+    rows = [
+        (chain, record['address'], record.get('pair_address') or None, record.get('pair_name'),
+         record.get('liquidity'), record.get('resolved_at', now))
+        for record in records
+    ]
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            f"INSERT OR {'IGNORE' if only_missing else 'REPLACE'} INTO pairs "
+            "(chain, address, pair_address, pair_name, liquidity, resolved_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
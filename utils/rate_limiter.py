@@ -0,0 +1,159 @@
+"""
+API密钥速率限制模块
+每个API密钥一个令牌桶，状态保存在内存映射文件中，多个进程(talons、补数据脚本等)共用同一份额度
+文件结构(cmc_AIPStats/rate_limit.bin): MAX_KEYS个固定长度的槽位，每个密钥占一个
+    key: 密钥的sha1摘要，不保存明文
+    tokens, updated: 令牌桶剩余令牌和上次补充的时间
+    month, credits: 当前月份(YYYYMM)和当月已使用的credit_count
+说明:
+1. 所有读写都在文件锁内完成，同一进程的多个线程再加一把线程锁，不会因为竞争丢失或多算调用
+2. 桶容量为burst，每秒补充 (per_minute - burst) / 60 个令牌，
+   任意60秒内最多 burst + (per_minute - burst) = per_minute 次调用，跨分钟的突发也不会超过限制
+3. 取令牌时同时预占1个credit，请求返回后再用 add_credits 补上实际消耗的差额，
+   并发请求不会在月度额度检查之后超额
+4. 密钥按传入顺序优先使用，第一个有令牌且月度额度未用完的密钥被选中
+"""
+import time
+import hashlib
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+
+from utils.commons import file_lock
+
+MAX_KEYS = 64
+
+SLOT_DTYPE = np.dtype([
+    ('key', 'S20'),
+    ('tokens', '<f8'),
+    ('updated', '<f8'),
+    ('month', '<i4'),
+    ('credits', '<i8'),
+])
+
+# 已打开的映射，进程内复用，key为文件路径
+_maps = {}
+
+
+def _locked(state_file):
+    """
+    状态文件的锁，进程间用文件锁，同一进程的多个线程用线程锁
+    """
+    return file_lock(Path(state_file).with_suffix('.lock'))
+
+
+def _open_slots(state_file):
+    """
+    打开状态文件的映射，不存在时创建，调用方需要持有文件锁
+    """
+    key = str(state_file)
+    if key not in _maps:
+        state_file = Path(state_file)
+        if not state_file.exists() or state_file.stat().st_size != MAX_KEYS * SLOT_DTYPE.itemsize:
+            with open(state_file, 'wb') as f:
+                f.truncate(MAX_KEYS * SLOT_DTYPE.itemsize)
+        _maps[key] = np.memmap(state_file, dtype=SLOT_DTYPE, mode='r+', shape=(MAX_KEYS,))
+    return _maps[key]
+
+
+def _digest(api_key):
+    return hashlib.sha1(str(api_key).encode()).digest()
+
+
+def _slot(slots, api_key):
+    """
+    获取密钥的槽位序号，第一次使用时分配空槽位
+    新槽位的补充时间为0，第一次补充时令牌桶直接装满
+    """
+    digest = _digest(api_key)
+    matched = np.flatnonzero(slots['key'] == digest)
+    if len(matched):
+        return matched[0]
+    empty = np.flatnonzero(slots['key'] == b'')
+    if not len(empty):
+        raise RuntimeError(f"速率限制槽位已满({MAX_KEYS}个密钥)")
+    i = empty[0]
+    slots[i] = (digest, 0, 0, 0, 0)
+    return i
+
+
+def _refresh(slots, i, limits, now, month):
+    """
+    补充令牌，月份变化时清零当月credit
+    """
+    rate = (limits['per_minute'] - limits['burst']) / 60
+    elapsed = max(now - slots['updated'][i], 0.0)
+    slots['tokens'][i] = min(limits['burst'], slots['tokens'][i] + elapsed * rate)
+    slots['updated'][i] = now
+    if slots['month'][i] != month:
+        slots['month'][i] = month
+        slots['credits'][i] = 0
+
+
+def try_acquire(state_file, api_keys, limits):
+    """
+    尝试为一次调用取一个令牌
+    state_file: 状态文件路径
+    api_keys: 按优先级排列的密钥列表
+    limits: {'per_minute': 每分钟调用次数, 'per_month': 每月credit, 'burst': 桶容量}
+    Returns: (密钥, 0)；没有可用令牌时返回 (None, 需要等待的秒数)；所有密钥月度额度用完时返回 (None, None)
+    """
+    now = time.time()
+    month = int(datetime.utcnow().strftime('%Y%m'))
+    rate = (limits['per_minute'] - limits['burst']) / 60
+    with _locked(state_file):
+        slots = _open_slots(state_file)
+        wait = None
+        for api_key in api_keys:
+            i = _slot(slots, api_key)
+            _refresh(slots, i, limits, now, month)
+            if slots['credits'][i] >= limits['per_month']:
+                continue
+            if slots['tokens'][i] >= 1:
+                slots['tokens'][i] -= 1
+                slots['credits'][i] += 1
+                return api_key, 0
+            key_wait = (1 - slots['tokens'][i]) / rate
+            wait = key_wait if wait is None else min(wait, key_wait)
+        return None, wait
+
+
+def add_credits(state_file, api_key, credits):
+    """
+    记录一次调用实际消耗的credit，取令牌时已经预占了1个，这里传入差额
+    """
+    with _locked(state_file):
+        slots = _open_slots(state_file)
+        i = _slot(slots, api_key)
+        slots['credits'][i] += credits
+
+
+def seed_credits(state_file, api_key, month, credits):
+    """
+    用已有的统计初始化密钥当月的credit，状态文件中已经是当月数据时不覆盖(其他进程正在计数)
+    month: YYYYMM字符串
+    """
+    with _locked(state_file):
+        slots = _open_slots(state_file)
+        i = _slot(slots, api_key)
+        if slots['month'][i] != int(month):
+            slots['month'][i] = int(month)
+            slots['credits'][i] = max(int(credits), 0)
+
+
+def monthly_credits(state_file, api_keys):
+    """
+    获取所有进程共同统计的当月credit
+    Returns: {密钥: credit}
+    """
+    month = int(datetime.utcnow().strftime('%Y%m'))
+    with _locked(state_file):
+        slots = _open_slots(state_file)
+        result = {}
+        for api_key in api_keys:
+            matched = np.flatnonzero(slots['key'] == _digest(api_key))
+            if len(matched) and slots['month'][matched[0]] == month:
+                result[api_key] = int(slots['credits'][matched[0]])
+            else:
+                result[api_key] = 0
+        return result
@@ -0,0 +1,186 @@
+"""
+API使用量账本模块
+credit_count先在内存中累计，定期批量追加到日志文件，日志过大时合并到快照，不再每次调用都重写统计文件
+文件结构(cmc_AIPStats/):
+    api_usage_YYYYMM.csv: 快照，列为 api_key, monthly_credits, log_id
+    api_usage_YYYYMM.{log_id}.log: 快照之后的追加日志，每行 "api_key,credits;"，以分号结尾的才是完整的记录
+说明:
+1. 当月总量 = 快照 + 快照记录的log_id对应的日志，日志在合并前最多LOG_MAX_BYTES，启动时读取量是常数
+2. 合并时先写新快照(log_id加1)再删除旧日志，中途崩溃时旧日志的log_id已经小于快照的，不会重复计算
+3. 追加和合并都在文件锁内完成，多个进程可以同时写同一个账本；每批只写一次，不完整的最后一行被忽略
+4. 内存中未写入的credit最多累计FLUSH_INTERVAL秒，进程退出时自动写入，进程崩溃最多少算这部分，不会多算
+5. 旧版只有 api_usage_YYYYMM.csv(没有log_id列)时作为快照直接读取
+6. record只在内存中累计并且是线程安全的，写入文件由调用方在需要时调用flush()，异步客户端在线程池中写入，不阻塞事件循环
+"""
+import os
+import time
+import atexit
+import threading
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+
+from utils.commons import file_lock
+
+# 内存中的credit最多累计多少秒写入日志
+FLUSH_INTERVAL = 5
+# 日志超过该大小时合并到快照
+LOG_MAX_BYTES = 64 * 1024
+
+# 还没有写入日志的credit，key为 (账本目录, 月份)，value为 {api_key: credits}
+_pending = {}
+# 上次写入日志的时间
+_last_flush = [time.time()]
+# 保护_pending和_last_flush，事件循环线程累计的同时线程池可以写入日志
+_lock = threading.Lock()
+
+
+def _current_month():
+    return datetime.utcnow().strftime('%Y%m')
+
+
+def _snapshot_file(ledger_dir, month):
+    return Path(ledger_dir) / f"api_usage_{month}.csv"
+
+
+def _log_file(ledger_dir, month, log_id):
+    return Path(ledger_dir) / f"api_usage_{month}.{log_id}.log"
+
+
+def _locked(ledger_dir):
+    return file_lock(Path(ledger_dir) / 'api_usage.lock')
+
+
+def _read_snapshot(ledger_dir, month):
+    """
+    读取快照，调用方需要持有文件锁
+    Returns: ({api_key: credits}, log_id)
+    """
+    snapshot_file = _snapshot_file(ledger_dir, month)
+    if not snapshot_file.exists():
+        return {}, 0
+    df = pd.read_csv(snapshot_file, dtype={'api_key': str})
+    log_id = int(df['log_id'].iloc[0]) if 'log_id' in df.columns and not df.empty else 0
+    return dict(zip(df['api_key'], df['monthly_credits'].astype(int))), log_id
+
+
+def _read_log(log_file):
+    """
+    读取追加日志，忽略崩溃时写了一半的行(没有以分号结尾)
+    Returns: {api_key: credits}
+    """
+    totals = {}
+    if not log_file.exists():
+        return totals
+    with open(log_file, 'r') as f:
+        content = f.read()
+    for line in content.split('\n'):
+        if not line.endswith(';'):
+            continue
+        api_key, _, credits = line[:-1].rpartition(',')
+        if not api_key or ',' in api_key or not credits.isdigit():
+            continue
+        totals[api_key] = totals.get(api_key, 0) + int(credits)
+    return totals
+
+
+def _merge(*totals):
+    result = {}
+    for item in totals:
+        for api_key, credits in item.items():
+            result[api_key] = result.get(api_key, 0) + credits
+    return result
+
+
+def load_totals(ledger_dir, month=None):
+    """
+    获取当月每个密钥的credit总量，包含本进程还没写入的部分
+    ledger_dir: 账本目录
+    month: YYYYMM，默认当前月份
+    Returns: {api_key: credits}
+    """
+    month = month or _current_month()
+    with _locked(ledger_dir):
+        snapshot, log_id = _read_snapshot(ledger_dir, month)
+        logged = _read_log(_log_file(ledger_dir, month, log_id))
+    with _lock:
+        pending = dict(_pending.get((str(ledger_dir), month), {}))
+    return _merge(snapshot, logged, pending)
+
+
+def record(ledger_dir, api_key, credits):
+    """
+    记录一次调用的credit，只在内存中累计，不读写文件，可以在事件循环中直接调用
+    Returns: 距离上次写入是否超过FLUSH_INTERVAL秒，为True时由调用方调用flush()批量写入(例如在线程池中)
+    """
+    with _lock:
+        pending = _pending.setdefault((str(ledger_dir), _current_month()), {})
+        pending[api_key] = pending.get(api_key, 0) + credits
+        due = time.time() - _last_flush[0] >= FLUSH_INTERVAL
+        if due:
+            # 只让一个调用方写入
+            _last_flush[0] = time.time()
+    return due
+
+
+def flush():
+    """
+    把内存中累计的credit追加到日志，日志过大时合并到快照
+    """
+    with _lock:
+        _last_flush[0] = time.time()
+        batches = list(_pending.items())
+        _pending.clear()
+    for (ledger_dir, month), pending in batches:
+        if not pending:
+            continue
+        lines = ''.join(f"{api_key},{credits};\n" for api_key, credits in pending.items())
+        with _locked(ledger_dir):
+            _, log_id = _read_snapshot(ledger_dir, month)
+            log_file = _log_file(ledger_dir, month, log_id)
+            # 一批只写一次，上次崩溃留下不完整的行时先换行，让它单独成为被忽略的一行
+            fd = os.open(log_file, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                size = os.fstat(fd).st_size
+                if size:
+                    os.lseek(fd, size - 1, os.SEEK_SET)
+                    if os.read(fd, 1) != b'\n':
+                        lines = '\n' + lines
+                os.write(fd, lines.encode())
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            if log_file.stat().st_size > LOG_MAX_BYTES:
+                _compact(ledger_dir, month)
+
+
+def _compact(ledger_dir, month):
+    """
+    把日志合并到快照，调用方需要持有文件锁
+    """
+    snapshot, log_id = _read_snapshot(ledger_dir, month)
+    log_file = _log_file(ledger_dir, month, log_id)
+    totals = _merge(snapshot, _read_log(log_file))
+
+    snapshot_file = _snapshot_file(ledger_dir, month)
+    tmp_file = snapshot_file.with_suffix('.tmp')
+    pd.DataFrame({
+        'api_key': list(totals.keys()),
+        'monthly_credits': list(totals.values()),
+        'log_id': log_id + 1,
+    }).to_csv(tmp_file, index=False)
+    os.replace(tmp_file, snapshot_file)
+    # 新快照已经包含旧日志，删除失败也不会重复计算
+    log_file.unlink(missing_ok=True)
+
+
+def compact(ledger_dir, month=None):
+    """
+    写入内存中的credit并把日志合并到快照
+    """
+    flush()
+    with _locked(ledger_dir):
+        _compact(ledger_dir, month or _current_month())
+
+
+atexit.register(flush)